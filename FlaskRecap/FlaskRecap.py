@@ -1,8 +1,14 @@
+import os
+
 from flask import Flask, request, jsonify, abort
 
+from store import make_store
+
 app = Flask(__name__)
 
-greetings = {
+# Set GREETING_STORE=sqlite:///greetings.db to keep greetings across
+# restarts and share them between worker processes.
+greetings = make_store(os.environ.get('GREETING_STORE'), {
             'en': 'hello', 
             'es': 'Hola', 
             'ar': 'مرحبا',
@@ -10,24 +16,26 @@ greetings = {
             'fi': 'Hei',
             'he': 'שלום',
             'ja': 'こんにちは'
-            }
+            })
 
 @app.route('/greeting', methods=['GET'])
 def greeting_all():
-    return jsonify({'greetings': greetings})
+    return jsonify({'greetings': dict(greetings.all())})
 
 @app.route('/greeting/<lang>', methods=['GET'])
 def greeting_one(lang):
-    print(lang)
-    if(lang not in greetings):
+    greeting = greetings.get(lang)
+    if(greeting is None):
         abort(404)
-    return jsonify({'greeting': greetings[lang
-    ]})
+    return jsonify({'greeting': greeting})
 
 @app.route('/greeting', methods=['POST'])
 def greeting_add():
-    info = request.get_json()
-    if('lang' not in info or 'greeting' not in info):
+    info = request.get_json(silent=True)
+    if(not isinstance(info, dict) or
+       not isinstance(info.get('lang'), str) or
+       not isinstance(info.get('greeting'), str)):
         abort(422)
-    greetings[info['lang']] = info['greeting']
-    return jsonify({'greetings':greetings})
+    created = greetings.put(info['lang'], info['greeting'])
+    return jsonify({'lang': info['lang'], 'greeting': info['greeting']}), \
+        201 if created else 200
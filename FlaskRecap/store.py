@@ -0,0 +1,148 @@
+import os
+import sqlite3
+import threading
+import time
+from types import MappingProxyType
+
+'''
+Greeting stores
+
+    store = make_store(os.environ.get('GREETING_STORE'), greetings)
+
+Both stores serve reads from an immutable snapshot that writers replace
+whole (copy-on-write), so readers never take a lock and always see a
+consistent set of greetings.
+
+MemoryGreetingStore lives in one process. SqliteGreetingStore keeps the
+greetings in a SQLite file shared by every worker and survives restarts;
+each process refreshes its snapshot when a version counter bumped by every
+write changes, checking at most every `refresh_interval` seconds. The file
+is opened on first use, with one connection per thread and process.
+'''
+
+
+class MemoryGreetingStore(object):
+
+    def __init__(self, initial=None):
+        self._snapshot = MappingProxyType(dict(initial or {}))
+        self._lock = threading.Lock()
+
+    def all(self):
+        return self._snapshot
+
+    def get(self, lang):
+        return self._snapshot.get(lang)
+
+    def put(self, lang, greeting):
+        '''
+        Sets one greeting; returns True when lang is new.
+        '''
+        with self._lock:
+            greetings = dict(self._snapshot)
+            created = lang not in greetings
+            greetings[lang] = greeting
+            self._snapshot = MappingProxyType(greetings)
+        return created
+
+
+class SqliteGreetingStore(object):
+
+    def __init__(self, path, initial=None, refresh_interval=0.5):
+        self.path = path
+        self.refresh_interval = refresh_interval
+        self._initial = dict(initial or {})
+        self._local = threading.local()
+        self._snapshot = (None, MappingProxyType({}))
+        self._checked_at = 0
+        self._created = False
+        self._create_lock = threading.Lock()
+
+    def _connection(self):
+        # Opened on first use rather than at import, and again in each
+        # forked worker: a SQLite connection must not cross a fork.
+        connection = getattr(self._local, 'connection', None)
+        if connection is None or self._local.pid != os.getpid():
+            connection = sqlite3.connect(self.path, timeout=5)
+            connection.execute('PRAGMA journal_mode=WAL')
+            connection.execute('PRAGMA synchronous=NORMAL')
+            self._local.connection = connection
+            self._local.pid = os.getpid()
+            if not self._created:
+                self._create(connection)
+        return connection
+
+    def _create(self, connection):
+        with self._create_lock:
+            if self._created:
+                return
+            with connection:
+                connection.execute(
+                    'CREATE TABLE IF NOT EXISTS greetings '
+                    '(lang TEXT PRIMARY KEY, greeting TEXT NOT NULL)')
+                connection.execute(
+                    'CREATE TABLE IF NOT EXISTS version '
+                    '(id INTEGER PRIMARY KEY CHECK (id = 1), '
+                    'value INTEGER NOT NULL)')
+                connection.execute(
+                    'INSERT OR IGNORE INTO version VALUES (1, 0)')
+                # Seeds a new file only; existing greetings are kept.
+                if not connection.execute(
+                        'SELECT 1 FROM greetings LIMIT 1').fetchone():
+                    connection.executemany(
+                        'INSERT OR IGNORE INTO greetings VALUES (?, ?)',
+                        sorted(self._initial.items()))
+                    connection.execute('UPDATE version SET value = value + 1')
+            self._created = True
+
+    def _refresh(self):
+        connection = self._connection()
+        version = connection.execute(
+            'SELECT value FROM version').fetchone()[0]
+        if version != self._snapshot[0]:
+            greetings = dict(connection.execute(
+                'SELECT lang, greeting FROM greetings'))
+            # Versions only grow; never swap back to an older snapshot
+            # that a slower thread read.
+            if self._snapshot[0] is None or version > self._snapshot[0]:
+                self._snapshot = (version, MappingProxyType(greetings))
+        self._checked_at = time.time()
+
+    def all(self):
+        if time.time() - self._checked_at >= self.refresh_interval:
+            self._refresh()
+        return self._snapshot[1]
+
+    def get(self, lang):
+        return self.all().get(lang)
+
+    def put(self, lang, greeting):
+        '''
+        Sets one greeting; returns True when lang is new.
+        '''
+        connection = self._connection()
+        with connection:
+            # Takes the write lock up front so the check and the write
+            # below see the same row.
+            connection.execute('BEGIN IMMEDIATE')
+            created = connection.execute(
+                'SELECT 1 FROM greetings WHERE lang = ?',
+                (lang,)).fetchone() is None
+            connection.execute(
+                'INSERT OR REPLACE INTO greetings VALUES (?, ?)',
+                (lang, greeting))
+            connection.execute('UPDATE version SET value = value + 1')
+        self._refresh()
+        return created
+
+
+'''
+make_store(url, initial)
+    MemoryGreetingStore when url is empty, SqliteGreetingStore for
+    "sqlite:///path/to/greetings.db"
+'''
+def make_store(url, initial=None):
+    if not url:
+        return MemoryGreetingStore(initial)
+    if url.startswith('sqlite:///'):
+        return SqliteGreetingStore(url[len('sqlite:///'):], initial)
+    raise ValueError('unsupported GREETING_STORE: {}'.format(url))
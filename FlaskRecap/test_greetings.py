@@ -0,0 +1,95 @@
+import os
+import shutil
+import sqlite3
+import tempfile
+import unittest
+
+import FlaskRecap
+from store import MemoryGreetingStore, SqliteGreetingStore
+
+
+class GreetingApiTestCase(unittest.TestCase):
+    """Tests the greeting endpoints on an in-memory store"""
+
+    def setUp(self):
+        self.original = FlaskRecap.greetings
+        FlaskRecap.greetings = MemoryGreetingStore({'en': 'hello'})
+        self.addCleanup(setattr, FlaskRecap, 'greetings', self.original)
+        self.client = FlaskRecap.app.test_client()
+
+    def test_add(self):
+        response = self.client.post('/greeting', json={
+            'lang': 'de', 'greeting': 'Hallo'})
+        self.assertEqual(201, response.status_code)
+        response = self.client.post('/greeting', json={
+            'lang': 'de', 'greeting': 'Guten Tag'})
+        self.assertEqual(200, response.status_code)
+        self.assertEqual({'greeting': 'Guten Tag'},
+                         self.client.get('/greeting/de').get_json())
+
+    """ Test bodies that are not {"lang": str, "greeting": str} get 422 """
+
+    def test_add_invalid(self):
+        for body in ([], ['de', 'Hallo'], 'de', 5, {'lang': 'de'},
+                     {'lang': 'de', 'greeting': 5},
+                     {'lang': ['de'], 'greeting': 'Hallo'}):
+            response = self.client.post('/greeting', json=body)
+            self.assertEqual(422, response.status_code, body)
+        self.assertEqual(422, self.client.post(
+            '/greeting', data='not json').status_code)
+        self.assertEqual({'en': 'hello'},
+                         self.client.get('/greeting').get_json()['greetings'])
+
+
+class SqliteGreetingStoreTestCase(unittest.TestCase):
+    """Tests the SQLite store shared by worker processes"""
+
+    def setUp(self):
+        directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, directory)
+        self.path = os.path.join(directory, 'greetings.db')
+
+    """ Test nothing is opened until the store is first used """
+
+    def test_lazy(self):
+        store = SqliteGreetingStore(self.path, {'en': 'hello'})
+        self.assertFalse(os.path.exists(self.path))
+        self.assertEqual({'en': 'hello'}, dict(store.all()))
+        connection = sqlite3.connect(self.path)
+        self.addCleanup(connection.close)
+        self.assertEqual('wal', connection.execute(
+            'PRAGMA journal_mode').fetchone()[0])
+
+    """ Test an existing file keeps its greetings over the seed """
+
+    def test_existing_file(self):
+        SqliteGreetingStore(self.path, {'en': 'hello'}).put('de', 'Hallo')
+        store = SqliteGreetingStore(self.path, {'fi': 'Hei'})
+        self.assertEqual({'en': 'hello', 'de': 'Hallo'}, dict(store.all()))
+
+    """ Test a forked worker opens its own connection and shares writes """
+
+    @unittest.skipUnless(hasattr(os, 'fork'), 'needs fork()')
+    def test_fork(self):
+        store = SqliteGreetingStore(self.path, {'en': 'hello'},
+                                    refresh_interval=0)
+        parent_connection = store._connection()
+        pid = os.fork()
+        if pid == 0:
+            status = 0
+            try:
+                if store._connection() is parent_connection or \
+                        not store.put('fr', 'Bonjour'):
+                    status = 1
+            except Exception:
+                status = 2
+            os._exit(status)
+        _, status = os.waitpid(pid, 0)
+        self.assertEqual(0, os.WEXITSTATUS(status))
+        self.assertIs(parent_connection, store._connection())
+        self.assertEqual('Bonjour', store.get('fr'))
+
+
+# Make the tests conveniently executable
+if __name__ == "__main__":
+    unittest.main()
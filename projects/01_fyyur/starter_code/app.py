@@ -3,15 +3,39 @@
 #----------------------------------------------------------------------------#
 
 import json
+import math
+import click
+from datetime import datetime, timedelta
+from itertools import groupby
 import dateutil.parser
 import babel
-from flask import Flask, render_template, request, Response, flash, redirect, url_for
+import babel.dates
+from functools import lru_cache, wraps
+from flask import Flask, render_template, request, Response, flash, redirect, url_for, jsonify, abort, make_response
 from flask_moment import Moment
-from flask_sqlalchemy import SQLAlchemy
+from sqlalchemy.exc import SQLAlchemyError
+from sqlalchemy.orm.exc import StaleDataError
+from flask_migrate import Migrate
 import logging
 from logging import Formatter, FileHandler
 from flask_wtf import Form
 from forms import *
+from compression import CompressionMiddleware, load_manifest
+from profiling import profiled
+from cache import (
+  LRUCache, EntityVersions, FragmentCacheExtension, PageCache, SnapshotCache,
+  TimedTemplate,
+  render_stats, track_versions)
+from facets import FacetIndex, parse_filters, facet_links
+from geo import GridIndex, PostgisSearch, has_postgis
+from scheduling import Booking, find_conflicts
+from availability import OccupancyIndex
+from jobs import JobQueue, SqlJobStore
+from instrumentation import RequestTimer, setup_logging
+from metrics import Metrics
+from routing import RoutingSQLAlchemy, primary_reads, use_primary
+from edits import (
+  normalized, snapshot_of, form_values, changed_values, is_stale, apply_changes)
 #----------------------------------------------------------------------------#
 # App Config.
 #----------------------------------------------------------------------------#
@@ -19,62 +43,446 @@ from forms import *
 app = Flask(__name__)
 moment = Moment(app)
 app.config.from_object('config')
-db = SQLAlchemy(app)
-
-# TODO: connect to a local postgresql database
+db = RoutingSQLAlchemy(app)
+migrate = Migrate(app, db)
+app.wsgi_app = profiled(
+  app.wsgi_app,
+  directory=app.config['PROFILE_DIR'],
+  sample_rate=app.config['PROFILE_SAMPLE_RATE'],
+  token=app.config['PROFILE_TOKEN'],
+  mode=app.config['PROFILE_MODE'],
+  max_bytes=app.config['PROFILE_MAX_BYTES'])
+app.wsgi_app = CompressionMiddleware(
+  app.wsgi_app,
+  minimum_size=app.config['COMPRESS_MIN_SIZE'],
+  level=app.config['COMPRESS_LEVEL'],
+  static_folder=app.static_folder,
+  static_url_path=app.static_url_path)
+static_manifest = load_manifest(app.static_folder)
+request_timer = RequestTimer(app, db.engine)
+# Registered before the page cache so cache hits are counted too.
+metrics = Metrics(app, engine=db.engine)
+
+@app.url_defaults
+def fingerprint_static_url(endpoint, values):
+  # Points url_for('static', ...) at the content-hashed copy when the
+  # precompress build step has been run.
+  if endpoint == 'static' and values.get('filename') in static_manifest:
+    values['filename'] = static_manifest[values['filename']]
+
+entity_versions = EntityVersions()
+app.jinja_env.template_class = TimedTemplate
+app.jinja_env.add_extension(FragmentCacheExtension)
+app.jinja_env.fragment_versions = entity_versions
+app.jinja_env.fragment_cache = LRUCache(
+  app.config['FRAGMENT_CACHE_MAX_BYTES'], app.config['FRAGMENT_CACHE_TTL'])
+page_cache = PageCache(entity_versions, app)
+# Job status is kept in the db so a poll can land on any worker.
+jobs = JobQueue(app, workers=app.config['JOB_WORKERS'],
+  max_attempts=app.config['JOB_MAX_ATTEMPTS'],
+  backoff=app.config['JOB_RETRY_BACKOFF'],
+  store=SqlJobStore(db.engine, db.metadata,
+    keep_seconds=app.config['JOB_STATUS_KEEP_SECONDS']))
+entity_snapshots = SnapshotCache(entity_versions, LRUCache(
+  app.config['SNAPSHOT_CACHE_MAX_BYTES'], app.config['SNAPSHOT_CACHE_TTL']))
+metrics.watch_cache('fragments', app.jinja_env.fragment_cache)
+metrics.watch_cache('snapshots', entity_snapshots.cache)
+if page_cache.cache is not None:
+  metrics.watch_cache('pages', page_cache.cache)
+
+def from_primary(loader):
+  # Snapshots, facet and location indexes and calendars outlive the request
+  # that fills them, so they load from the primary: rows read from a lagging
+  # replica would be served until the next rebuild.
+  @wraps(loader)
+  def load(*args):
+    with primary_reads():
+      return loader(*args)
+  return load
 
 #----------------------------------------------------------------------------#
 # Models.
 #----------------------------------------------------------------------------#
 
+# Genres are normalized into their own table so genre filters become
+# indexed joins instead of string matching.
+venue_genres = db.Table('venue_genres',
+  db.Column('venue_id', db.Integer,
+    db.ForeignKey('Venue.id', ondelete='CASCADE'), primary_key=True),
+  db.Column('genre_id', db.Integer,
+    db.ForeignKey('Genre.id', ondelete='CASCADE'), primary_key=True),
+  db.Index('ix_venue_genres_genre_id', 'genre_id', 'venue_id'))
+
+artist_genres = db.Table('artist_genres',
+  db.Column('artist_id', db.Integer,
+    db.ForeignKey('Artist.id', ondelete='CASCADE'), primary_key=True),
+  db.Column('genre_id', db.Integer,
+    db.ForeignKey('Genre.id', ondelete='CASCADE'), primary_key=True),
+  db.Index('ix_artist_genres_genre_id', 'genre_id', 'artist_id'))
+
+class Genre(db.Model):
+    __tablename__ = 'Genre'
+
+    id = db.Column(db.Integer, primary_key=True)
+    name = db.Column(db.String(120), nullable=False, unique=True)
+
 class Venue(db.Model):
     __tablename__ = 'Venue'
+    __table_args__ = (
+      db.Index('ix_venue_state_city', 'state', 'city'),
+    )
 
     id = db.Column(db.Integer, primary_key=True)
-    name = db.Column(db.String)
-    city = db.Column(db.String(120))
-    state = db.Column(db.String(120))
+    name = db.Column(db.String, nullable=False)
+    city = db.Column(db.String(120), nullable=False)
+    state = db.Column(db.String(120), nullable=False)
     address = db.Column(db.String(120))
     phone = db.Column(db.String(120))
     image_link = db.Column(db.String(500))
     facebook_link = db.Column(db.String(120))
-
-    # TODO: implement any missing fields, as a database migration using Flask-Migrate
+    website = db.Column(db.String(500))
+    seeking_talent = db.Column(db.Boolean, nullable=False, default=False)
+    seeking_description = db.Column(db.String(500))
+    latitude = db.Column(db.Float)
+    longitude = db.Column(db.Float)
+    version_id = db.Column(db.Integer, nullable=False, default=1)
+    genres = db.relationship('Genre', secondary=venue_genres, lazy='selectin')
+    shows = db.relationship('Show', backref='venue', lazy=True,
+      cascade='all, delete-orphan', passive_deletes=True)
+
+    # Optimistic locking: UPDATEs match on the version the edit form was
+    # based on. Bumped only by edits.apply_changes, not on every flush.
+    __mapper_args__ = {
+      'version_id_col': version_id,
+      'version_id_generator': False,
+    }
 
 class Artist(db.Model):
     __tablename__ = 'Artist'
+    __table_args__ = (
+      db.Index('ix_artist_state_city', 'state', 'city'),
+    )
 
     id = db.Column(db.Integer, primary_key=True)
-    name = db.Column(db.String)
-    city = db.Column(db.String(120))
-    state = db.Column(db.String(120))
+    name = db.Column(db.String, nullable=False)
+    city = db.Column(db.String(120), nullable=False)
+    state = db.Column(db.String(120), nullable=False)
     phone = db.Column(db.String(120))
-    genres = db.Column(db.String(120))
     image_link = db.Column(db.String(500))
     facebook_link = db.Column(db.String(120))
+    website = db.Column(db.String(500))
+    seeking_venue = db.Column(db.Boolean, nullable=False, default=False)
+    seeking_description = db.Column(db.String(500))
+    latitude = db.Column(db.Float)
+    longitude = db.Column(db.Float)
+    version_id = db.Column(db.Integer, nullable=False, default=1)
+    genres = db.relationship('Genre', secondary=artist_genres, lazy='selectin')
+    shows = db.relationship('Show', backref='artist', lazy=True,
+      cascade='all, delete-orphan', passive_deletes=True)
+
+    # Optimistic locking: UPDATEs match on the version the edit form was
+    # based on. Bumped only by edits.apply_changes, not on every flush.
+    __mapper_args__ = {
+      'version_id_col': version_id,
+      'version_id_generator': False,
+    }
+
+class Show(db.Model):
+    __tablename__ = 'Show'
+    # Detail pages list a venue's (or artist's) shows ordered by start time
+    # and split them at "now"; both are served by these composite indexes.
+    __table_args__ = (
+      db.Index('ix_show_venue_id_start_time', 'venue_id', 'start_time'),
+      db.Index('ix_show_artist_id_start_time', 'artist_id', 'start_time'),
+    )
 
-    # TODO: implement any missing fields, as a database migration using Flask-Migrate
+    id = db.Column(db.Integer, primary_key=True)
+    venue_id = db.Column(db.Integer,
+      db.ForeignKey('Venue.id', ondelete='CASCADE'), nullable=False)
+    artist_id = db.Column(db.Integer,
+      db.ForeignKey('Artist.id', ondelete='CASCADE'), nullable=False)
+    start_time = db.Column(db.DateTime, nullable=False)
+    end_time = db.Column(db.DateTime, nullable=False)
+
+track_versions(entity_versions, db.session, Venue, 'venue')
+track_versions(entity_versions, db.session, Artist, 'artist')
+track_versions(entity_versions, db.session, Show, 'show',
+  related=lambda show: [('venue', show.venue_id), ('artist', show.artist_id)])
+
+#----------------------------------------------------------------------------#
+# Facets.
+#----------------------------------------------------------------------------#
+
+def yes_no(flag):
+  return ['yes' if flag else 'no']
+
+venue_facets = FacetIndex({
+  'genre': lambda venue: [genre.name for genre in venue.genres],
+  'state': lambda venue: [venue.state],
+  'city': lambda venue: ['{}, {}'.format(venue.city, venue.state)],
+  'seeking_talent': lambda venue: yes_no(venue.seeking_talent),
+}, ttl=app.config['FACET_INDEX_TTL'])
+venue_facets.track(db.session, Venue)
+
+artist_facets = FacetIndex({
+  'genre': lambda artist: [genre.name for genre in artist.genres],
+  'state': lambda artist: [artist.state],
+  'city': lambda artist: ['{}, {}'.format(artist.city, artist.state)],
+  'seeking_venue': lambda artist: yes_no(artist.seeking_venue),
+}, ttl=app.config['FACET_INDEX_TTL'])
+artist_facets.track(db.session, Artist)
+
+#----------------------------------------------------------------------------#
+# Scheduling.
+#----------------------------------------------------------------------------#
 
-# TODO Implement Show and Artist models, and complete all model relationships and properties, as a database migration.
+def existing_bookings(venue_ids, artist_ids, start, end):
+  # A show can only overlap [start, end) if it starts before `end` and no
+  # earlier than SHOW_MAX_DURATION_MINUTES before `start`, which keeps the
+  # lookup a bounded range scan of the (venue_id|artist_id, start_time)
+  # indexes instead of every show of the venue or artist.
+  lower = start - timedelta(minutes=app.config['SHOW_MAX_DURATION_MINUTES'])
+  rows = set()
+  for column, ids in ((Show.venue_id, venue_ids), (Show.artist_id, artist_ids)):
+    rows.update(db.session.query(
+        Show.id, Show.venue_id, Show.artist_id, Show.start_time, Show.end_time
+      ).filter(column.in_(ids), Show.start_time > lower, Show.start_time < end))
+  return [Booking(*row) for row in rows]
+
+def schedule_conflicts(bookings):
+  if not bookings:
+    return []
+  existing = existing_bookings(
+    set(booking.venue_id for booking in bookings),
+    set(booking.artist_id for booking in bookings),
+    min(booking.start_time for booking in bookings),
+    max(booking.end_time for booking in bookings))
+  return find_conflicts(bookings, existing)
+
+occupancy = OccupancyIndex(
+  slot_minutes=app.config['CALENDAR_SLOT_MINUTES'], ttl=app.config['CALENDAR_TTL'],
+  window_days=app.config['CALENDAR_WINDOW_DAYS'],
+  max_resources=app.config['CALENDAR_MAX_RESOURCES'])
+occupancy.track(db.session, Show)
+
+def calendar_loader(model, kind, entity_id):
+  column = Show.venue_id if kind == 'venue' else Show.artist_id
+  @from_primary
+  def load_shows(first_day, last_day):
+    if model.query.get(entity_id) is None:
+      return None
+    # Shows overlapping the window, as a bounded range scan of the
+    # (venue_id|artist_id, start_time) index; see existing_bookings.
+    start = datetime.combine(first_day, datetime.min.time())
+    end = datetime.combine(last_day + timedelta(days=1), datetime.min.time())
+    lower = start - timedelta(minutes=app.config['SHOW_MAX_DURATION_MINUTES'])
+    return db.session.query(Show.id, Show.start_time, Show.end_time).filter(
+      column == entity_id, Show.start_time > lower, Show.start_time < end,
+      Show.end_time > start).all()
+  return load_shows
+
+def calendar_response(model, kind, entity_id):
+  # Busy/free slots per day between ?from= and ?to= (YYYY-MM-DD, inclusive).
+  try:
+    first_day = datetime.strptime(
+      request.args.get('from', datetime.now().strftime('%Y-%m-%d')), '%Y-%m-%d').date()
+    last_day = datetime.strptime(request.args['to'], '%Y-%m-%d').date() \
+      if 'to' in request.args else first_day + timedelta(days=6)
+  except ValueError:
+    abort(400)
+  if last_day < first_day or \
+      (last_day - first_day).days >= app.config['CALENDAR_MAX_DAYS']:
+    abort(400)
+
+  resource = occupancy.ensure_resource((kind, entity_id),
+    calendar_loader(model, kind, entity_id), first_day, last_day)
+  if resource is None:
+    abort(404)
+  return jsonify({
+    "success": True,
+    "{}_id".format(kind): entity_id,
+    "slot_minutes": occupancy.slot_minutes,
+    "from": first_day.isoformat(),
+    "to": last_day.isoformat(),
+    "days": occupancy.calendar(resource, first_day, last_day),
+  })
+
+#----------------------------------------------------------------------------#
+# Locations.
+#----------------------------------------------------------------------------#
+
+def coordinates(entity):
+  return (entity.latitude, entity.longitude)
+
+venue_locations = GridIndex(coordinates,
+  cell_degrees=app.config['GEO_GRID_CELL_DEGREES'], ttl=app.config['GEO_INDEX_TTL'])
+venue_locations.track(db.session, Venue)
+
+artist_locations = GridIndex(coordinates,
+  cell_degrees=app.config['GEO_GRID_CELL_DEGREES'], ttl=app.config['GEO_INDEX_TTL'])
+artist_locations.track(db.session, Artist)
+
+geo_backend = {}
+
+def find_nearby(model, locations, lat, lng, radius, limit=100):
+  # [(distance_miles, id)] nearest first, from PostGIS when the extension is
+  # installed and from the in-process grid otherwise.
+  backend = app.config['GEO_BACKEND']
+  if backend == 'auto':
+    if 'postgis' not in geo_backend:
+      geo_backend['postgis'] = has_postgis(db.session)
+    backend = 'postgis' if geo_backend['postgis'] else 'grid'
+  if backend == 'postgis':
+    return PostgisSearch(model.__tablename__).within(
+      db.session, lat, lng, radius, limit)
+  locations.ensure_loaded(from_primary(lambda: db.session.query(
+    model.id, model.latitude, model.longitude
+  ).filter(model.latitude.isnot(None)).all()))
+  return locations.within(lat, lng, radius, limit)
+
+def nearby_results(model, locations):
+  lat = request.args.get('lat', type=float)
+  lng = request.args.get('lng', type=float)
+  radius = request.args.get('radius', 25, type=float)
+  # float() accepts nan and inf; a huge radius would scan the whole grid.
+  if lat is None or lng is None or not all(
+      map(math.isfinite, (lat, lng, radius))) or abs(lat) > 90 or \
+      not 0 < radius <= app.config['GEO_MAX_RADIUS_MILES']:
+    abort(400)
+  hits = find_nearby(model, locations, lat, lng, radius)
+  names = dict(db.session.query(model.id, model.name).filter(
+    model.id.in_([id for _, id in hits])))
+  return {
+    "count": len(hits),
+    "data": [{
+      "id": id,
+      "name": names.get(id),
+      "distance": distance,
+    } for distance, id in hits if id in names]
+  }, 'within {:g} miles of {:g}, {:g}'.format(radius, lat, lng)
 
 #----------------------------------------------------------------------------#
 # Filters.
 #----------------------------------------------------------------------------#
 
-def format_datetime(value, format='medium'):
-  date = dateutil.parser.parse(value)
-  if format == 'full':
-      format="EEEE MMMM, d, y 'at' h:mma"
-  elif format == 'medium':
-      format="EE MM, dd, y h:mma"
-  return babel.dates.format_datetime(date, format)
+DATETIME_FORMATS = {
+  'full': "EEEE MMMM, d, y 'at' h:mma",
+  'medium': "EE MM, dd, y h:mma",
+}
+
+BABEL_DATETIME_FORMATS = ('short', 'medium', 'long', 'full')
+
+@lru_cache(maxsize=64)
+def datetime_pattern(format):
+  return babel.dates.parse_pattern(DATETIME_FORMATS.get(format, format))
+
+@lru_cache(maxsize=16)
+def datetime_locale(locale):
+  return babel.Locale.parse(locale)
+
+# Memoized on (value, format, locale): a page lists many shows sharing the
+# same start times, and the filter runs once per show on every render.
+@lru_cache(maxsize=4096)
+def format_datetime(value, format='medium', locale=None):
+  # Shows loaded from the db already hold datetimes; only strings are parsed.
+  if isinstance(value, str):
+    value = dateutil.parser.parse(value)
+  locale = datetime_locale(locale or babel.dates.LC_TIME)
+  if format not in DATETIME_FORMATS and format in BABEL_DATETIME_FORMATS:
+    # babel's named formats join a date and a time pattern through the
+    # locale's get_datetime_format, so leave those to babel.
+    return babel.dates.format_datetime(value, format, locale=locale)
+  return datetime_pattern(format).apply(value, locale)
 
 app.jinja_env.filters['datetime'] = format_datetime
 
+#----------------------------------------------------------------------------#
+# Follow-up jobs.
+#----------------------------------------------------------------------------#
+
+# Run on the job queue after a create has committed, so the request does not
+# wait for them. Raising makes the queue retry.
+
+def warm_snapshot(model, kind, id):
+  if get_snapshot(model, kind, id) is None:
+    raise LookupError('{} {} not found'.format(kind, id))
+
+def warm_calendars(venue_id, artist_id):
+  for model, kind, id in ((Venue, 'venue', venue_id), (Artist, 'artist', artist_id)):
+    if not occupancy.ensure_resource((kind, id), calendar_loader(model, kind, id)):
+      raise LookupError('{} {} not found'.format(kind, id))
+    warm_snapshot(model, kind, id)
+
+def with_job(response, job):
+  # Lets clients poll /jobs/<id> for the follow-up work of a write.
+  response = make_response(response)
+  if job is not None:
+    response.headers['X-Job-Id'] = job.id
+  return response
+
 #----------------------------------------------------------------------------#
 # Controllers.
 #----------------------------------------------------------------------------#
 
+def get_snapshot(model, kind, id, version_id=None):
+  # Detail and edit pages read venues/artists through the snapshot cache.
+  @from_primary
+  def load():
+    entity = model.query.get(id)
+    return snapshot_of(entity) if entity is not None else None
+  return entity_snapshots.get(kind, id, load, version_id)
+
+def get_snapshot_or_404(model, kind, id, version_id=None):
+  snapshot = get_snapshot(model, kind, id, version_id)
+  if snapshot is None:
+    abort(404)
+  return snapshot
+
+def get_edit_snapshot_or_404(model, kind, id):
+  # The edit form echoes version_id back, so it has to be the primary's:
+  # another worker may have committed an edit that neither this process's
+  # snapshot cache nor a lagging replica has seen, and every save from the
+  # form would then be rejected as stale. One indexed lookup checks it.
+  use_primary()
+  version_id = db.session.query(model.version_id).filter(
+    model.id == id).scalar()
+  if version_id is None:
+    abort(404)
+  return get_snapshot_or_404(model, kind, id, version_id)
+
+def related_version(kind, shows):
+  # Keys a page's show list on the venues or artists it names, so renaming
+  # one re-renders it. Versions only grow and the set of ids only changes
+  # with the page's own version, so their sum changes with any of them.
+  ids = set(show['{}_id'.format(kind)] for show in shows)
+  return sum(entity_versions.get(kind, id) for id in ids)
+
+# Both walk ix_show_*_start_time, so rows come back already in time order.
+def venue_shows_query(venue_id):
+  return db.session.query(
+      Show.start_time, Artist.id, Artist.name, Artist.image_link
+    ).join(Artist, Show.artist_id == Artist.id
+    ).filter(Show.venue_id == venue_id
+    ).order_by(Show.start_time)
+
+def artist_shows_query(artist_id):
+  return db.session.query(
+      Show.start_time, Venue.id, Venue.name, Venue.image_link
+    ).join(Venue, Show.venue_id == Venue.id
+    ).filter(Show.artist_id == artist_id
+    ).order_by(Show.start_time)
+
+def split_shows(query, fields):
+  # `query` yields (start_time, id, name, image_link) rows ordered by
+  # start_time; returns them as (past, upcoming) dicts keyed by `fields`.
+  now = datetime.now()
+  past, upcoming = [], []
+  for start_time, id, name, image_link in query:
+    show = dict(zip(fields, (id, name, image_link)))
+    show['start_time'] = start_time
+    (upcoming if start_time >= now else past).append(show)
+  return past, upcoming
+
 @app.route('/')
 def index():
   return render_template('pages/home.html')
@@ -85,30 +493,38 @@ def index():
 
 @app.route('/venues')
 def venues():
-  # TODO: replace with real venues data.
-  #       num_shows should be aggregated based on number of upcoming shows per venue.
-  data=[{
-    "city": "San Francisco",
-    "state": "CA",
-    "venues": [{
-      "id": 1,
-      "name": "The Musical Hop",
-      "num_upcoming_shows": 0,
-    }, {
-      "id": 3,
-      "name": "Park Square Live Music & Coffee",
-      "num_upcoming_shows": 1,
-    }]
-  }, {
-    "city": "New York",
-    "state": "NY",
-    "venues": [{
-      "id": 2,
-      "name": "The Dueling Pianos Bar",
-      "num_upcoming_shows": 0,
-    }]
-  }]
-  return render_template('pages/venues.html', areas=data);
+  # One grouped query: upcoming show counts are aggregated in the db and
+  # venues come back already ordered by the (state, city) index.
+  upcoming = db.session.query(
+      Show.venue_id, db.func.count(Show.id).label('num_upcoming_shows')
+    ).filter(Show.start_time >= datetime.now()
+    ).group_by(Show.venue_id).subquery()
+  query = db.session.query(
+      Venue.id, Venue.name, Venue.city, Venue.state,
+      db.func.coalesce(upcoming.c.num_upcoming_shows, 0)
+    ).outerjoin(upcoming, upcoming.c.venue_id == Venue.id)
+
+  # Facet filters are resolved against the in-memory bitmaps; the db only
+  # sees the resulting primary keys.
+  venue_facets.ensure_loaded(from_primary(Venue.query.all))
+  filters = parse_filters(venue_facets, request.args)
+  if filters:
+    query = query.filter(Venue.id.in_(venue_facets.ids(filters)))
+  rows = query.order_by(Venue.state, Venue.city, Venue.name).all()
+
+  data = []
+  for (state, city), group in groupby(rows, key=lambda row: (row[3], row[2])):
+    data.append({
+      "city": city,
+      "state": state,
+      "venues": [{
+        "id": id,
+        "name": name,
+        "num_upcoming_shows": num_upcoming_shows,
+      } for id, name, _, _, num_upcoming_shows in group]
+    })
+  return render_template('pages/venues.html', areas=data,
+    facets=facet_links(venue_facets, filters, 'venues'))
 
 @app.route('/venues/search', methods=['POST'])
 def search_venues():
@@ -125,90 +541,45 @@ def search_venues():
   }
   return render_template('pages/search_venues.html', results=response, search_term=request.form.get('search_term', ''))
 
+@app.route('/venues/nearby')
+def nearby_venues():
+  # e.g. /venues/nearby?lat=37.77&lng=-122.42&radius=25
+  results, search_term = nearby_results(Venue, venue_locations)
+  return render_template('pages/search_venues.html', results=results, search_term=search_term)
+
 @app.route('/venues/<int:venue_id>')
 def show_venue(venue_id):
   # shows the venue page with the given venue_id
-  # TODO: replace with real venue data from the venues table, using venue_id
-  data1={
-    "id": 1,
-    "name": "The Musical Hop",
-    "genres": ["Jazz", "Reggae", "Swing", "Classical", "Folk"],
-    "address": "1015 Folsom Street",
-    "city": "San Francisco",
-    "state": "CA",
-    "phone": "123-123-1234",
-    "website": "https://www.themusicalhop.com",
-    "facebook_link": "https://www.facebook.com/TheMusicalHop",
-    "seeking_talent": True,
-    "seeking_description": "We are on the lookout for a local artist to play every two weeks. Please call us.",
-    "image_link": "https://images.unsplash.com/photo-1543900694-133f37abaaa5?ixlib=rb-1.2.1&ixid=eyJhcHBfaWQiOjEyMDd9&auto=format&fit=crop&w=400&q=60",
-    "past_shows": [{
-      "artist_id": 4,
-      "artist_name": "Guns N Petals",
-      "artist_image_link": "https://images.unsplash.com/photo-1549213783-8284d0336c4f?ixlib=rb-1.2.1&ixid=eyJhcHBfaWQiOjEyMDd9&auto=format&fit=crop&w=300&q=80",
-      "start_time": "2019-05-21T21:30:00.000Z"
-    }],
-    "upcoming_shows": [],
-    "past_shows_count": 1,
-    "upcoming_shows_count": 0,
-  }
-  data2={
-    "id": 2,
-    "name": "The Dueling Pianos Bar",
-    "genres": ["Classical", "R&B", "Hip-Hop"],
-    "address": "335 Delancey Street",
-    "city": "New York",
-    "state": "NY",
-    "phone": "914-003-1132",
-    "website": "https://www.theduelingpianos.com",
-    "facebook_link": "https://www.facebook.com/theduelingpianos",
-    "seeking_talent": False,
-    "image_link": "https://images.unsplash.com/photo-1497032205916-ac775f0649ae?ixlib=rb-1.2.1&ixid=eyJhcHBfaWQiOjEyMDd9&auto=format&fit=crop&w=750&q=80",
-    "past_shows": [],
-    "upcoming_shows": [],
-    "past_shows_count": 0,
-    "upcoming_shows_count": 0,
+  venue = get_snapshot_or_404(Venue, 'venue', venue_id)
+  past_shows, upcoming_shows = split_shows(
+    venue_shows_query(venue_id),
+    ('artist_id', 'artist_name', 'artist_image_link'))
+
+  data = {
+    "id": venue["id"],
+    "name": venue["name"],
+    "genres": venue["genres"],
+    "address": venue["address"],
+    "city": venue["city"],
+    "state": venue["state"],
+    "phone": venue["phone"],
+    "website": venue["website"],
+    "facebook_link": venue["facebook_link"],
+    "seeking_talent": venue["seeking_talent"],
+    "seeking_description": venue["seeking_description"],
+    "image_link": venue["image_link"],
+    "past_shows": past_shows,
+    "upcoming_shows": upcoming_shows,
+    "past_shows_count": len(past_shows),
+    "upcoming_shows_count": len(upcoming_shows),
+    "artists_version": related_version('artist', past_shows + upcoming_shows),
   }
-  data3={
-    "id": 3,
-    "name": "Park Square Live Music & Coffee",
-    "genres": ["Rock n Roll", "Jazz", "Classical", "Folk"],
-    "address": "34 Whiskey Moore Ave",
-    "city": "San Francisco",
-    "state": "CA",
-    "phone": "415-000-1234",
-    "website": "https://www.parksquarelivemusicandcoffee.com",
-    "facebook_link": "https://www.facebook.com/ParkSquareLiveMusicAndCoffee",
-    "seeking_talent": False,
-    "image_link": "https://images.unsplash.com/photo-1485686531765-ba63b07845a7?ixlib=rb-1.2.1&ixid=eyJhcHBfaWQiOjEyMDd9&auto=format&fit=crop&w=747&q=80",
-    "past_shows": [{
-      "artist_id": 5,
-      "artist_name": "Matt Quevedo",
-      "artist_image_link": "https://images.unsplash.com/photo-1495223153807-b916f75de8c5?ixlib=rb-1.2.1&ixid=eyJhcHBfaWQiOjEyMDd9&auto=format&fit=crop&w=334&q=80",
-      "start_time": "2019-06-15T23:00:00.000Z"
-    }],
-    "upcoming_shows": [{
-      "artist_id": 6,
-      "artist_name": "The Wild Sax Band",
-      "artist_image_link": "https://images.unsplash.com/photo-1558369981-f9ca78462e61?ixlib=rb-1.2.1&ixid=eyJhcHBfaWQiOjEyMDd9&auto=format&fit=crop&w=794&q=80",
-      "start_time": "2035-04-01T20:00:00.000Z"
-    }, {
-      "artist_id": 6,
-      "artist_name": "The Wild Sax Band",
-      "artist_image_link": "https://images.unsplash.com/photo-1558369981-f9ca78462e61?ixlib=rb-1.2.1&ixid=eyJhcHBfaWQiOjEyMDd9&auto=format&fit=crop&w=794&q=80",
-      "start_time": "2035-04-08T20:00:00.000Z"
-    }, {
-      "artist_id": 6,
-      "artist_name": "The Wild Sax Band",
-      "artist_image_link": "https://images.unsplash.com/photo-1558369981-f9ca78462e61?ixlib=rb-1.2.1&ixid=eyJhcHBfaWQiOjEyMDd9&auto=format&fit=crop&w=794&q=80",
-      "start_time": "2035-04-15T20:00:00.000Z"
-    }],
-    "past_shows_count": 1,
-    "upcoming_shows_count": 1,
-  }
-  data = list(filter(lambda d: d['id'] == venue_id, [data1, data2, data3]))[0]
   return render_template('pages/show_venue.html', venue=data)
 
+@app.route('/venues/<int:venue_id>/calendar')
+def venue_calendar(venue_id):
+  return calendar_response(Venue, 'venue', venue_id)
+
 #  Create Venue
 #  ----------------------------------------------------------------
 
@@ -219,15 +590,8 @@ def create_venue_form():
 
 @app.route('/venues/create', methods=['POST'])
 def create_venue_submission():
-  # TODO: insert form data as a new Venue record in the db, instead
-  # TODO: modify data to be the data object returned from db insertion
-
-  # on successful db insert, flash success
-  flash('Venue ' + request.form['name'] + ' was successfully listed!')
-  # TODO: on unsuccessful db insert, flash an error instead.
-  # e.g., flash('An error occurred. Venue ' + data.name + ' could not be listed.')
-  # see: http://flask.pocoo.org/docs/1.0/patterns/flashing/
-  return render_template('pages/home.html')
+  form = VenueForm()
+  return create_from_form(Venue, form, VENUE_FIELDS, 'forms/new_venue.html', 'venue')
 
 @app.route('/venues/<venue_id>', methods=['DELETE'])
 def delete_venue(venue_id):
@@ -242,18 +606,17 @@ def delete_venue(venue_id):
 #  ----------------------------------------------------------------
 @app.route('/artists')
 def artists():
-  # TODO: replace with real data returned from querying the database
-  data=[{
-    "id": 4,
-    "name": "Guns N Petals",
-  }, {
-    "id": 5,
-    "name": "Matt Quevedo",
-  }, {
-    "id": 6,
-    "name": "The Wild Sax Band",
-  }]
-  return render_template('pages/artists.html', artists=data)
+  query = db.session.query(Artist.id, Artist.name)
+  artist_facets.ensure_loaded(from_primary(Artist.query.all))
+  filters = parse_filters(artist_facets, request.args)
+  if filters:
+    query = query.filter(Artist.id.in_(artist_facets.ids(filters)))
+  data = [{
+    "id": id,
+    "name": name,
+  } for id, name in query.order_by(Artist.name)]
+  return render_template('pages/artists.html', artists=data,
+    facets=facet_links(artist_facets, filters, 'artists'))
 
 @app.route('/artists/search', methods=['POST'])
 def search_artists():
@@ -270,137 +633,136 @@ def search_artists():
   }
   return render_template('pages/search_artists.html', results=response, search_term=request.form.get('search_term', ''))
 
+@app.route('/artists/nearby')
+def nearby_artists():
+  results, search_term = nearby_results(Artist, artist_locations)
+  return render_template('pages/search_artists.html', results=results, search_term=search_term)
+
 @app.route('/artists/<int:artist_id>')
 def show_artist(artist_id):
-  # shows the venue page with the given venue_id
-  # TODO: replace with real venue data from the venues table, using venue_id
-  data1={
-    "id": 4,
-    "name": "Guns N Petals",
-    "genres": ["Rock n Roll"],
-    "city": "San Francisco",
-    "state": "CA",
-    "phone": "326-123-5000",
-    "website": "https://www.gunsnpetalsband.com",
-    "facebook_link": "https://www.facebook.com/GunsNPetals",
-    "seeking_venue": True,
-    "seeking_description": "Looking for shows to perform at in the San Francisco Bay Area!",
-    "image_link": "https://images.unsplash.com/photo-1549213783-8284d0336c4f?ixlib=rb-1.2.1&ixid=eyJhcHBfaWQiOjEyMDd9&auto=format&fit=crop&w=300&q=80",
-    "past_shows": [{
-      "venue_id": 1,
-      "venue_name": "The Musical Hop",
-      "venue_image_link": "https://images.unsplash.com/photo-1543900694-133f37abaaa5?ixlib=rb-1.2.1&ixid=eyJhcHBfaWQiOjEyMDd9&auto=format&fit=crop&w=400&q=60",
-      "start_time": "2019-05-21T21:30:00.000Z"
-    }],
-    "upcoming_shows": [],
-    "past_shows_count": 1,
-    "upcoming_shows_count": 0,
+  # shows the artist page with the given artist_id
+  artist = get_snapshot_or_404(Artist, 'artist', artist_id)
+  past_shows, upcoming_shows = split_shows(
+    artist_shows_query(artist_id),
+    ('venue_id', 'venue_name', 'venue_image_link'))
+
+  data = {
+    "id": artist["id"],
+    "name": artist["name"],
+    "genres": artist["genres"],
+    "city": artist["city"],
+    "state": artist["state"],
+    "phone": artist["phone"],
+    "website": artist["website"],
+    "facebook_link": artist["facebook_link"],
+    "seeking_venue": artist["seeking_venue"],
+    "seeking_description": artist["seeking_description"],
+    "image_link": artist["image_link"],
+    "past_shows": past_shows,
+    "upcoming_shows": upcoming_shows,
+    "past_shows_count": len(past_shows),
+    "upcoming_shows_count": len(upcoming_shows),
+    "venues_version": related_version('venue', past_shows + upcoming_shows),
   }
-  data2={
-    "id": 5,
-    "name": "Matt Quevedo",
-    "genres": ["Jazz"],
-    "city": "New York",
-    "state": "NY",
-    "phone": "300-400-5000",
-    "facebook_link": "https://www.facebook.com/mattquevedo923251523",
-    "seeking_venue": False,
-    "image_link": "https://images.unsplash.com/photo-1495223153807-b916f75de8c5?ixlib=rb-1.2.1&ixid=eyJhcHBfaWQiOjEyMDd9&auto=format&fit=crop&w=334&q=80",
-    "past_shows": [{
-      "venue_id": 3,
-      "venue_name": "Park Square Live Music & Coffee",
-      "venue_image_link": "https://images.unsplash.com/photo-1485686531765-ba63b07845a7?ixlib=rb-1.2.1&ixid=eyJhcHBfaWQiOjEyMDd9&auto=format&fit=crop&w=747&q=80",
-      "start_time": "2019-06-15T23:00:00.000Z"
-    }],
-    "upcoming_shows": [],
-    "past_shows_count": 1,
-    "upcoming_shows_count": 0,
-  }
-  data3={
-    "id": 6,
-    "name": "The Wild Sax Band",
-    "genres": ["Jazz", "Classical"],
-    "city": "San Francisco",
-    "state": "CA",
-    "phone": "432-325-5432",
-    "seeking_venue": False,
-    "image_link": "https://images.unsplash.com/photo-1558369981-f9ca78462e61?ixlib=rb-1.2.1&ixid=eyJhcHBfaWQiOjEyMDd9&auto=format&fit=crop&w=794&q=80",
-    "past_shows": [],
-    "upcoming_shows": [{
-      "venue_id": 3,
-      "venue_name": "Park Square Live Music & Coffee",
-      "venue_image_link": "https://images.unsplash.com/photo-1485686531765-ba63b07845a7?ixlib=rb-1.2.1&ixid=eyJhcHBfaWQiOjEyMDd9&auto=format&fit=crop&w=747&q=80",
-      "start_time": "2035-04-01T20:00:00.000Z"
-    }, {
-      "venue_id": 3,
-      "venue_name": "Park Square Live Music & Coffee",
-      "venue_image_link": "https://images.unsplash.com/photo-1485686531765-ba63b07845a7?ixlib=rb-1.2.1&ixid=eyJhcHBfaWQiOjEyMDd9&auto=format&fit=crop&w=747&q=80",
-      "start_time": "2035-04-08T20:00:00.000Z"
-    }, {
-      "venue_id": 3,
-      "venue_name": "Park Square Live Music & Coffee",
-      "venue_image_link": "https://images.unsplash.com/photo-1485686531765-ba63b07845a7?ixlib=rb-1.2.1&ixid=eyJhcHBfaWQiOjEyMDd9&auto=format&fit=crop&w=747&q=80",
-      "start_time": "2035-04-15T20:00:00.000Z"
-    }],
-    "past_shows_count": 0,
-    "upcoming_shows_count": 3,
-  }
-  data = list(filter(lambda d: d['id'] == artist_id, [data1, data2, data3]))[0]
   return render_template('pages/show_artist.html', artist=data)
 
+@app.route('/artists/<int:artist_id>/calendar')
+def artist_calendar(artist_id):
+  return calendar_response(Artist, 'artist', artist_id)
+
 #  Update
 #  ----------------------------------------------------------------
+VENUE_FIELDS = ('name', 'city', 'state', 'address', 'phone', 'image_link',
+  'facebook_link')
+ARTIST_FIELDS = ('name', 'city', 'state', 'phone', 'image_link',
+  'facebook_link')
+
+def genres_named(names):
+  known = dict((genre.name, genre) for genre in
+    Genre.query.filter(Genre.name.in_(names)).all())
+  return [known.get(name) or Genre(name=name) for name in names]
+
+def create_from_form(model, form, fields, template, kind):
+  # Commits the new row, then leaves cache warming to the job queue.
+  if not form.validate():
+    for field, errors in form.errors.items():
+      flash('{}: {}'.format(field, ', '.join(errors)))
+    return render_template(template, form=form)
+  name = normalized(form.name.data)
+  entity = model(genres=genres_named(sorted(set(form.genres.data))),
+    **dict((field, normalized(form[field].data)) for field in fields))
+  job = None
+  try:
+    db.session.add(entity)
+    db.session.commit()
+    flash('{} {} was successfully listed!'.format(kind.title(), name))
+    job = jobs.submit('warm ' + kind, warm_snapshot, model, kind, entity.id)
+  except SQLAlchemyError:
+    db.session.rollback()
+    flash('An error occurred. {} {} could not be listed.'.format(kind.title(), name))
+  finally:
+    db.session.close()
+  return with_job(render_template('pages/home.html'), job)
+
+def submit_edit(entity, form, fields, template, kind, next_url):
+  # Writes only the fields that changed, guarded by the entity's version.
+  context = {kind: entity}
+  if not form.validate():
+    for field, errors in form.errors.items():
+      flash('{}: {}'.format(field, ', '.join(errors)))
+    return render_template(template, form=form, **context)
+  if is_stale(entity, form):
+    flash('{} was changed by someone else while you were editing it. '
+      'Review the current values and try again.'.format(entity.name))
+    return render_template(template,
+      form=type(form)(formdata=None,
+        data=form_values(snapshot_of(entity), fields)), **context)
+
+  changes = changed_values(entity, form, fields)
+  if not changes:
+    flash('No changes to save.')
+    return redirect(next_url)
+  name = changes.get('name', entity.name)
+  try:
+    apply_changes(entity, changes, genres_named)
+    db.session.commit()
+    flash('{} {} was successfully updated!'.format(kind.title(), name))
+  except StaleDataError:
+    db.session.rollback()
+    flash('{} was changed by someone else while you were editing it. '
+      'Your changes were not saved.'.format(name))
+  except SQLAlchemyError:
+    db.session.rollback()
+    flash('An error occurred. {} {} could not be updated.'.format(kind.title(), name))
+  finally:
+    db.session.close()
+  return redirect(next_url)
+
 @app.route('/artists/<int:artist_id>/edit', methods=['GET'])
 def edit_artist(artist_id):
-  form = ArtistForm()
-  artist={
-    "id": 4,
-    "name": "Guns N Petals",
-    "genres": ["Rock n Roll"],
-    "city": "San Francisco",
-    "state": "CA",
-    "phone": "326-123-5000",
-    "website": "https://www.gunsnpetalsband.com",
-    "facebook_link": "https://www.facebook.com/GunsNPetals",
-    "seeking_venue": True,
-    "seeking_description": "Looking for shows to perform at in the San Francisco Bay Area!",
-    "image_link": "https://images.unsplash.com/photo-1549213783-8284d0336c4f?ixlib=rb-1.2.1&ixid=eyJhcHBfaWQiOjEyMDd9&auto=format&fit=crop&w=300&q=80"
-  }
-  # TODO: populate form with fields from artist with ID <artist_id>
+  artist = get_edit_snapshot_or_404(Artist, 'artist', artist_id)
+  form = ArtistForm(formdata=None, data=form_values(artist, ARTIST_FIELDS))
   return render_template('forms/edit_artist.html', form=form, artist=artist)
 
 @app.route('/artists/<int:artist_id>/edit', methods=['POST'])
 def edit_artist_submission(artist_id):
-  # TODO: take values from the form submitted, and update existing
-  # artist record with ID <artist_id> using the new attributes
-
-  return redirect(url_for('show_artist', artist_id=artist_id))
+  artist = Artist.query.get_or_404(artist_id)
+  return submit_edit(artist, ArtistForm(), ARTIST_FIELDS,
+    'forms/edit_artist.html', 'artist',
+    url_for('show_artist', artist_id=artist_id))
 
 @app.route('/venues/<int:venue_id>/edit', methods=['GET'])
 def edit_venue(venue_id):
-  form = VenueForm()
-  venue={
-    "id": 1,
-    "name": "The Musical Hop",
-    "genres": ["Jazz", "Reggae", "Swing", "Classical", "Folk"],
-    "address": "1015 Folsom Street",
-    "city": "San Francisco",
-    "state": "CA",
-    "phone": "123-123-1234",
-    "website": "https://www.themusicalhop.com",
-    "facebook_link": "https://www.facebook.com/TheMusicalHop",
-    "seeking_talent": True,
-    "seeking_description": "We are on the lookout for a local artist to play every two weeks. Please call us.",
-    "image_link": "https://images.unsplash.com/photo-1543900694-133f37abaaa5?ixlib=rb-1.2.1&ixid=eyJhcHBfaWQiOjEyMDd9&auto=format&fit=crop&w=400&q=60"
-  }
-  # TODO: populate form with values from venue with ID <venue_id>
+  venue = get_edit_snapshot_or_404(Venue, 'venue', venue_id)
+  form = VenueForm(formdata=None, data=form_values(venue, VENUE_FIELDS))
   return render_template('forms/edit_venue.html', form=form, venue=venue)
 
 @app.route('/venues/<int:venue_id>/edit', methods=['POST'])
 def edit_venue_submission(venue_id):
-  # TODO: take values from the form submitted, and update existing
-  # venue record with ID <venue_id> using the new attributes
-  return redirect(url_for('show_venue', venue_id=venue_id))
+  venue = Venue.query.get_or_404(venue_id)
+  return submit_edit(venue, VenueForm(), VENUE_FIELDS,
+    'forms/edit_venue.html', 'venue',
+    url_for('show_venue', venue_id=venue_id))
 
 #  Create Artist
 #  ----------------------------------------------------------------
@@ -413,14 +775,8 @@ def create_artist_form():
 @app.route('/artists/create', methods=['POST'])
 def create_artist_submission():
   # called upon submitting the new artist listing form
-  # TODO: insert form data as a new Venue record in the db, instead
-  # TODO: modify data to be the data object returned from db insertion
-
-  # on successful db insert, flash success
-  flash('Artist ' + request.form['name'] + ' was successfully listed!')
-  # TODO: on unsuccessful db insert, flash an error instead.
-  # e.g., flash('An error occurred. Artist ' + data.name + ' could not be listed.')
-  return render_template('pages/home.html')
+  form = ArtistForm()
+  return create_from_form(Artist, form, ARTIST_FIELDS, 'forms/new_artist.html', 'artist')
 
 
 #  Shows
@@ -429,44 +785,20 @@ def create_artist_submission():
 @app.route('/shows')
 def shows():
   # displays list of shows at /shows
-  # TODO: replace with real venues data.
-  #       num_shows should be aggregated based on number of upcoming shows per venue.
-  data=[{
-    "venue_id": 1,
-    "venue_name": "The Musical Hop",
-    "artist_id": 4,
-    "artist_name": "Guns N Petals",
-    "artist_image_link": "https://images.unsplash.com/photo-1549213783-8284d0336c4f?ixlib=rb-1.2.1&ixid=eyJhcHBfaWQiOjEyMDd9&auto=format&fit=crop&w=300&q=80",
-    "start_time": "2019-05-21T21:30:00.000Z"
-  }, {
-    "venue_id": 3,
-    "venue_name": "Park Square Live Music & Coffee",
-    "artist_id": 5,
-    "artist_name": "Matt Quevedo",
-    "artist_image_link": "https://images.unsplash.com/photo-1495223153807-b916f75de8c5?ixlib=rb-1.2.1&ixid=eyJhcHBfaWQiOjEyMDd9&auto=format&fit=crop&w=334&q=80",
-    "start_time": "2019-06-15T23:00:00.000Z"
-  }, {
-    "venue_id": 3,
-    "venue_name": "Park Square Live Music & Coffee",
-    "artist_id": 6,
-    "artist_name": "The Wild Sax Band",
-    "artist_image_link": "https://images.unsplash.com/photo-1558369981-f9ca78462e61?ixlib=rb-1.2.1&ixid=eyJhcHBfaWQiOjEyMDd9&auto=format&fit=crop&w=794&q=80",
-    "start_time": "2035-04-01T20:00:00.000Z"
-  }, {
-    "venue_id": 3,
-    "venue_name": "Park Square Live Music & Coffee",
-    "artist_id": 6,
-    "artist_name": "The Wild Sax Band",
-    "artist_image_link": "https://images.unsplash.com/photo-1558369981-f9ca78462e61?ixlib=rb-1.2.1&ixid=eyJhcHBfaWQiOjEyMDd9&auto=format&fit=crop&w=794&q=80",
-    "start_time": "2035-04-08T20:00:00.000Z"
-  }, {
-    "venue_id": 3,
-    "venue_name": "Park Square Live Music & Coffee",
-    "artist_id": 6,
-    "artist_name": "The Wild Sax Band",
-    "artist_image_link": "https://images.unsplash.com/photo-1558369981-f9ca78462e61?ixlib=rb-1.2.1&ixid=eyJhcHBfaWQiOjEyMDd9&auto=format&fit=crop&w=794&q=80",
-    "start_time": "2035-04-15T20:00:00.000Z"
-  }]
+  rows = db.session.query(
+      Show.start_time, Venue.id, Venue.name,
+      Artist.id, Artist.name, Artist.image_link
+    ).join(Venue, Show.venue_id == Venue.id
+    ).join(Artist, Show.artist_id == Artist.id
+    ).order_by(Show.start_time).all()
+  data = [{
+    "venue_id": venue_id,
+    "venue_name": venue_name,
+    "artist_id": artist_id,
+    "artist_name": artist_name,
+    "artist_image_link": artist_image_link,
+    "start_time": start_time
+  } for start_time, venue_id, venue_name, artist_id, artist_name, artist_image_link in rows]
   return render_template('pages/shows.html', shows=data)
 
 @app.route('/shows/create')
@@ -478,14 +810,141 @@ def create_shows():
 @app.route('/shows/create', methods=['POST'])
 def create_show_submission():
   # called to create new shows in the db, upon submitting new show listing form
-  # TODO: insert form data as a new Show record in the db, instead
+  form = ShowForm()
+  if not form.validate():
+    for field, errors in form.errors.items():
+      flash('{}: {}'.format(field, ', '.join(errors)))
+    return render_template('forms/new_show.html', form=form)
+
+  venue_id, artist_id = int(form.venue_id.data), int(form.artist_id.data)
+  if Venue.query.get(venue_id) is None or Artist.query.get(artist_id) is None:
+    flash('An error occurred. Unknown venue or artist.')
+    return render_template('forms/new_show.html', form=form)
+
+  start_time = form.start_time.data
+  end_time = start_time + timedelta(minutes=form.duration.data)
+  conflicts = schedule_conflicts(
+    [Booking(None, venue_id, artist_id, start_time, end_time)])
+  if conflicts:
+    for _, (kind, _), show_id in conflicts:
+      flash('The {} is already booked at that time (show {}).'.format(kind, show_id))
+    return render_template('forms/new_show.html', form=form)
+
+  job = None
+  try:
+    db.session.add(Show(venue_id=venue_id, artist_id=artist_id,
+      start_time=start_time, end_time=end_time))
+    db.session.commit()
+    flash('Show was successfully listed!')
+    job = jobs.submit('warm calendars', warm_calendars, venue_id, artist_id)
+  except SQLAlchemyError:
+    # Also raised by the Postgres exclusion constraints when a concurrent
+    # request booked the same slot between our check and the insert.
+    db.session.rollback()
+    flash('An error occurred. Show could not be listed.')
+  finally:
+    db.session.close()
+  return with_job(render_template('pages/home.html'), job)
+
+def schedule_entry(number, entry):
+  # One import-shows entry as a Booking; raises ClickException naming the
+  # entry when it is malformed.
+  def invalid(problem):
+    return click.ClickException('entry {}: {}'.format(number, problem))
+  if not isinstance(entry, dict):
+    raise invalid('expected an object')
+  missing = [key for key in ('venue_id', 'artist_id', 'start_time')
+    if key not in entry]
+  if missing:
+    raise invalid('missing {}'.format(', '.join(missing)))
+  ids = []
+  for key in ('venue_id', 'artist_id'):
+    value = entry[key]
+    if isinstance(value, bool) or not isinstance(value, (int, str)) \
+        or not str(value).isdigit():
+      raise invalid('{} must be an integer id'.format(key))
+    ids.append(int(value))
+  if not isinstance(entry['start_time'], str):
+    raise invalid('start_time must be an ISO date and time')
+  try:
+    start_time = dateutil.parser.parse(entry['start_time'])
+  except (ValueError, OverflowError):
+    raise invalid('start_time must be an ISO date and time')
+  duration = entry.get('duration', app.config['SHOW_DURATION_MINUTES'])
+  if isinstance(duration, bool) or not isinstance(duration, int) \
+      or not 0 < duration <= app.config['SHOW_MAX_DURATION_MINUTES']:
+    raise invalid('duration must be 1 to {} minutes'.format(
+      app.config['SHOW_MAX_DURATION_MINUTES']))
+  return Booking('entry {}'.format(number), ids[0], ids[1],
+    start_time, start_time + timedelta(minutes=duration))
+
+@app.cli.command('import-shows')
+@click.argument('path', type=click.Path(exists=True, dir_okay=False))
+@click.option('--dry-run', is_flag=True, help='Only report conflicts.')
+def import_shows(path, dry_run):
+  """Validates a JSON schedule as one batch and imports it if conflict-free.
+
+  The file holds [{"venue_id", "artist_id", "start_time", "duration"}],
+  with ISO start times and optional durations in minutes.
+  """
+  try:
+    with open(path) as f:
+      entries = json.load(f)
+  except ValueError as error:
+    raise click.ClickException('{} is not valid JSON: {}'.format(path, error))
+  if not isinstance(entries, list):
+    raise click.ClickException('{} must hold a list of shows'.format(path))
+  bookings = [schedule_entry(number, entry)
+    for number, entry in enumerate(entries, 1)]
+
+  for model, column in ((Venue, 'venue_id'), (Artist, 'artist_id')):
+    ids = set(getattr(booking, column) for booking in bookings)
+    known = set(id for id, in db.session.query(model.id).filter(model.id.in_(ids)))
+    for booking in bookings:
+      if getattr(booking, column) not in known:
+        raise click.ClickException('{}: unknown {} {}'.format(
+          booking.ref, model.__tablename__.lower(), getattr(booking, column)))
+
+  conflicts = schedule_conflicts(bookings)
+  for booking, (kind, id), ref in conflicts:
+    click.echo('{}: {} {} is already booked by {}'.format(
+      booking.ref, kind, id, ref if isinstance(ref, str) else 'show {}'.format(ref)))
+  if conflicts:
+    raise click.ClickException('{} conflicts found'.format(len(conflicts)))
+  if dry_run:
+    click.echo('{} shows validated'.format(len(bookings)))
+    return
+  db.session.add_all([Show(venue_id=booking.venue_id,
+    artist_id=booking.artist_id, start_time=booking.start_time,
+    end_time=booking.end_time) for booking in bookings])
+  try:
+    db.session.commit()
+  except SQLAlchemyError as error:
+    # e.g. the exclusion constraints, when shows were booked meanwhile.
+    db.session.rollback()
+    raise click.ClickException('import failed: {}'.format(
+      getattr(error, 'orig', error)))
+  click.echo('{} shows imported'.format(len(bookings)))
+
+#  Jobs
+#  ----------------------------------------------------------------
 
-  # on successful db insert, flash success
-  flash('Show was successfully listed!')
-  # TODO: on unsuccessful db insert, flash an error instead.
-  # e.g., flash('An error occurred. Show could not be listed.')
-  # see: http://flask.pocoo.org/docs/1.0/patterns/flashing/
-  return render_template('pages/home.html')
+@app.route('/jobs/<job_id>')
+def job_status(job_id):
+  status = jobs.get(job_id)
+  if status is None:
+    abort(404)
+  return jsonify(dict(status, success=True))
+
+#  Stats
+#  ----------------------------------------------------------------
+
+@app.route('/stats/templates')
+def template_stats():
+  caches = {'fragments': app.jinja_env.fragment_cache.stats()}
+  if page_cache.cache is not None:
+    caches['pages'] = page_cache.cache.stats()
+  return jsonify({'templates': render_stats.snapshot(), 'caches': caches})
 
 @app.errorhandler(404)
 def not_found_error(error):
@@ -501,9 +960,9 @@ if not app.debug:
     file_handler.setFormatter(
         Formatter('%(asctime)s %(levelname)s: %(message)s [in %(pathname)s:%(lineno)d]')
     )
-    app.logger.setLevel(logging.INFO)
     file_handler.setLevel(logging.INFO)
-    app.logger.addHandler(file_handler)
+    # Request threads only enqueue records; a listener thread writes them.
+    setup_logging(app, file_handler)
     app.logger.info('errors')
 
 #----------------------------------------------------------------------------#
@@ -0,0 +1,199 @@
+#----------------------------------------------------------------------------#
+# Venue and artist availability.
+#
+# Occupancy is kept as one bitset per (resource, day), with one bit per
+# SLOT_MINUTES slot. A resource's shows within a window of days are loaded on
+# first request and then kept current from committed Show writes, so a
+# calendar request only reads a few ints per day instead of the raw Show
+# rows. The least recently used resources are evicted past max_resources.
+#----------------------------------------------------------------------------#
+
+import time
+from collections import OrderedDict
+from datetime import date, datetime, timedelta
+
+from facets import SyncedIndex
+
+MINUTES_PER_DAY = 24 * 60
+
+
+def slot_label(slot, slot_minutes):
+    minutes = slot * slot_minutes
+    return '{:02d}:{:02d}'.format(minutes // 60, minutes % 60)
+
+
+def runs(bits, slots, busy):
+    '''
+    [(first_slot, end_slot)] runs of set (busy) or clear (free) bits.
+    '''
+    found = []
+    start = None
+    for slot in range(slots):
+        if bool(bits >> slot & 1) == busy:
+            if start is None:
+                start = slot
+        elif start is not None:
+            found.append((start, slot))
+            start = None
+    if start is not None:
+        found.append((start, slots))
+    return found
+
+
+class OccupancyIndex(SyncedIndex):
+    '''
+    Per-day occupancy bitsets for venues and artists, keyed by
+    ('venue', id) / ('artist', id). Each resource holds the days of one
+    window of at least `window_days`, and at most `max_resources` are kept.
+    '''
+    state = ('resources', 'show_keys')
+
+    def __init__(self, slot_minutes=30, ttl=None, window_days=92,
+                 max_resources=10000):
+        self.slot_minutes = slot_minutes
+        self.slots = MINUTES_PER_DAY // slot_minutes
+        self.window_days = window_days
+        self.max_resources = max_resources
+        super(OccupancyIndex, self).__init__(ttl)
+        # Resources load lazily one at a time, so the index as a whole is
+        # always live and committed writes are applied straight away.
+        self.loaded_at = time.time()
+
+    def empty(self):
+        return OccupancyIndex(self.slot_minutes, window_days=self.window_days,
+                              max_resources=self.max_resources)
+
+    def _reset(self):
+        self.resources = OrderedDict()
+        self.show_keys = {}
+
+    def values_of(self, show):
+        return (show.venue_id, show.artist_id, show.start_time, show.end_time)
+
+    def set(self, id, values):
+        venue_id, artist_id, start, end = values
+        with self._lock:
+            self._unset(id)
+            for key in (('venue', venue_id), ('artist', artist_id)):
+                resource = self.resources.get(key)
+                if resource is not None and \
+                        self._in_window(resource, start, end):
+                    self._add(resource, id, start, end)
+                    self.show_keys.setdefault(id, set()).add(key)
+
+    def remove(self, id):
+        with self._lock:
+            self._unset(id)
+
+    def _in_window(self, resource, start, end):
+        first_day, last_day = resource['window']
+        return start.date() <= last_day and end.date() >= first_day
+
+    def _unset(self, id):
+        for key in self.show_keys.pop(id, ()):
+            resource = self.resources.get(key)
+            if resource is not None and id in resource['shows']:
+                start, end = resource['shows'].pop(id)
+                self._rebuild_days(resource, self._days(start, end))
+
+    def _add(self, resource, id, start, end):
+        resource['shows'][id] = (start, end)
+        days = resource['days']
+        for day, bits in self._day_bits(start, end):
+            days[day] = days.get(day, 0) | bits
+
+    def _rebuild_days(self, resource, days):
+        for day in days:
+            resource['days'].pop(day, None)
+        for start, end in resource['shows'].values():
+            for day, bits in self._day_bits(start, end):
+                if day in days:
+                    resource['days'][day] = resource['days'].get(day, 0) | bits
+
+    def _days(self, start, end):
+        day = start.date()
+        last = (end - timedelta(microseconds=1)).date()
+        days = []
+        while day <= last:
+            days.append(day)
+            day += timedelta(days=1)
+        return days
+
+    def _day_bits(self, start, end):
+        for day in self._days(start, end):
+            midnight = datetime.combine(day, datetime.min.time())
+            first = max(0, (start - midnight).total_seconds() // 60)
+            last = min(MINUTES_PER_DAY, (end - midnight).total_seconds() / 60)
+            first_slot = int(first // self.slot_minutes)
+            end_slot = int(-(-last // self.slot_minutes))
+            if end_slot > first_slot:
+                yield day, ((1 << (end_slot - first_slot)) - 1) << first_slot
+
+    def ensure_resource(self, key, loader, first_day=None, last_day=None):
+        '''
+        The occupancy of `key` covering `first_day` to `last_day` (today
+        and the next `window_days` by default), or None for an unknown
+        venue/artist. Loaded from `loader(first_day, last_day)` ([(id,
+        start, end)] of the shows overlapping those days, or None when the
+        resource does not exist) on first use, after `ttl`, or when the
+        days fall outside the loaded window.
+        '''
+        first_day = first_day or date.today()
+        last_day = last_day or first_day
+        with self._lock:
+            resource = self.resources.get(key)
+            if resource is not None:
+                self.resources.move_to_end(key)
+        if resource is not None and \
+                resource['window'][0] <= first_day and \
+                last_day <= resource['window'][1] and \
+                (self.ttl is None or
+                 time.time() - resource['loaded_at'] < self.ttl):
+            return resource
+        last_day = max(last_day,
+                       first_day + timedelta(days=self.window_days - 1))
+        shows = loader(first_day, last_day)
+        if shows is None:
+            return None
+        fresh = {'loaded_at': time.time(), 'window': (first_day, last_day),
+                 'shows': {}, 'days': {}}
+        for id, start, end in shows:
+            self._add(fresh, id, start, end)
+        with self._lock:
+            self._evict(key)
+            self.resources[key] = fresh
+            for id in fresh['shows']:
+                self.show_keys.setdefault(id, set()).add(key)
+            while len(self.resources) > self.max_resources:
+                self._evict(next(iter(self.resources)))
+        return fresh
+
+    def _evict(self, key):
+        resource = self.resources.pop(key, None)
+        if resource is None:
+            return
+        for id in resource['shows']:
+            keys = self.show_keys.get(id)
+            if keys is not None:
+                keys.discard(key)
+                if not keys:
+                    del self.show_keys[id]
+
+    def calendar(self, resource, first_day, last_day):
+        days = resource['days']
+        calendar = []
+        day = first_day
+        while day <= last_day:
+            bits = days.get(day, 0)
+            calendar.append({
+                'date': day.isoformat(),
+                'busy': self._labels(runs(bits, self.slots, True)),
+                'free': self._labels(runs(bits, self.slots, False)),
+            })
+            day += timedelta(days=1)
+        return calendar
+
+    def _labels(self, slot_runs):
+        return [[slot_label(start, self.slot_minutes),
+                 slot_label(end, self.slot_minutes)]
+                for start, end in slot_runs]
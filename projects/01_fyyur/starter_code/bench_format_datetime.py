@@ -0,0 +1,61 @@
+'''
+Microbenchmark for the `datetime` template filter on a 10k-show page.
+
+    $ python bench_format_datetime.py
+
+Compares the original parse-then-format filter against the memoized one,
+fed either native datetimes (as loaded from the db) or ISO strings.
+'''
+
+import random
+import timeit
+from datetime import datetime, timedelta
+
+import babel.dates
+import dateutil.parser
+
+from app import DATETIME_FORMATS, format_datetime
+
+SHOWS = 10000
+# Weekly recurring slots, so start times repeat across the page.
+DISTINCT_START_TIMES = 500
+
+
+def legacy_format_datetime(value, format='medium'):
+    date = dateutil.parser.parse(value)
+    return babel.dates.format_datetime(date, DATETIME_FORMATS[format])
+
+
+def main():
+    start = datetime(2035, 4, 1, 20, 0)
+    slots = [start + timedelta(days=7 * i)
+             for i in range(DISTINCT_START_TIMES)]
+    shows = [random.choice(slots) for _ in range(SHOWS)]
+    strings = [show.isoformat() + '.000Z' for show in shows]
+
+    def legacy():
+        for value in strings:
+            legacy_format_datetime(value, 'full')
+
+    def memoized_datetimes():
+        format_datetime.cache_clear()
+        for value in shows:
+            format_datetime(value, 'full')
+
+    def memoized_strings():
+        format_datetime.cache_clear()
+        for value in strings:
+            format_datetime(value, 'full')
+
+    baseline = min(timeit.repeat(legacy, number=1, repeat=3))
+    print('{:<28}{:>10.1f} ms'.format(
+        'legacy (parse + babel)', baseline * 1000))
+    for name, run in (('memoized, datetimes', memoized_datetimes),
+                      ('memoized, iso strings', memoized_strings)):
+        elapsed = min(timeit.repeat(run, number=1, repeat=3))
+        print('{:<28}{:>10.1f} ms  {:>6.1f}x'.format(
+            name, elapsed * 1000, baseline / elapsed))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,79 @@
+'''
+Benchmark for proximity search over synthetic venues.
+
+    $ python bench_geo.py [venues]
+
+Scatters venues (1M by default) over the continental US, clustered around
+a few hundred "cities", then times 25-mile radius and 10-nearest queries on
+the in-process GridIndex against a linear haversine scan.
+'''
+
+import random
+import sys
+import time
+
+from geo import GridIndex, haversine_miles
+
+QUERIES = 200
+LINEAR_QUERIES = 5
+RADIUS_MILES = 25
+
+
+def synthetic_venues(count, cities=300, seed=1):
+    rng = random.Random(seed)
+    centers = [(rng.uniform(25, 49), rng.uniform(-124, -67))
+               for _ in range(cities)]
+    for id in range(1, count + 1):
+        lat, lng = rng.choice(centers)
+        yield id, (lat + rng.gauss(0, 0.3), lng + rng.gauss(0, 0.3))
+
+
+def timed(label, run, repeat):
+    start = time.perf_counter()
+    for _ in range(repeat):
+        result = run()
+    elapsed = (time.perf_counter() - start) / repeat
+    print('{:<34}{:>10.3f} ms'.format(label, elapsed * 1000))
+    return result
+
+
+def main():
+    count = int(sys.argv[1]) if len(sys.argv) > 1 else 1000000
+    points = list(synthetic_venues(count))
+
+    index = GridIndex(lambda venue: venue)
+    start = time.perf_counter()
+    for id, point in points:
+        index.set(id, point)
+    print('indexed {} venues in {:.1f} s ({} cells)'.format(
+        count, time.perf_counter() - start, len(index.cells)))
+
+    rng = random.Random(2)
+    origins = [point for _, point in rng.sample(points, QUERIES)]
+    iterator = iter(origins * 2)
+
+    def grid_radius():
+        lat, lng = next(iterator)
+        return index.within(lat, lng, RADIUS_MILES)
+
+    def grid_nearest():
+        lat, lng = next(iterator)
+        return index.nearest(lat, lng, k=10)
+
+    def linear_radius():
+        lat, lng = origins[0]
+        return sorted((haversine_miles(lat, lng, p_lat, p_lng), id)
+                      for id, (p_lat, p_lng) in points
+                      if haversine_miles(lat, lng, p_lat, p_lng)
+                      <= RADIUS_MILES)
+
+    timed('grid, {}-mile radius'.format(RADIUS_MILES), grid_radius, QUERIES)
+    timed('grid, 10 nearest', grid_nearest, QUERIES)
+    linear = timed('linear scan, {}-mile radius'.format(RADIUS_MILES),
+                   linear_radius, LINEAR_QUERIES)
+    grid = index.within(origins[0][0], origins[0][1], RADIUS_MILES)
+    assert [id for _, id in grid] == [id for _, id in linear]
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,330 @@
+#----------------------------------------------------------------------------#
+# Template, fragment and page caching.
+#
+# Cached fragments are keyed by entity kind + id + version. Versions are
+# bumped from SQLAlchemy events whenever a change to a row commits, so stale
+# fragments are never looked up again and simply age out of the LRU.
+#----------------------------------------------------------------------------#
+
+import threading
+import time
+from collections import OrderedDict
+
+from flask import current_app, request, session
+from jinja2 import Template, nodes
+from jinja2.ext import Extension
+from sqlalchemy import event
+from sqlalchemy.orm import object_session
+
+from instrumentation import record_timing
+
+STAGED_KEY = 'version_bumps'
+
+
+class LRUCache(object):
+    '''
+    Thread-safe least-recently-used cache bounded by the total size in bytes
+    of its values, with an optional per-entry time to live in seconds.
+    '''
+
+    def __init__(self, max_bytes, default_ttl=None):
+        self.max_bytes = max_bytes
+        self.default_ttl = default_ttl
+        self.current_bytes = 0
+        self.hits = 0
+        self.misses = 0
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                self.misses += 1
+                return None
+            value, size, expires = entry
+            if expires is not None and expires < time.time():
+                self._remove(key)
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return value
+
+    def set(self, key, value, ttl=None):
+        size = _sizeof(value)
+        if size > self.max_bytes:
+            return False
+        ttl = self.default_ttl if ttl is None else ttl
+        expires = time.time() + ttl if ttl else None
+        with self._lock:
+            if key in self._entries:
+                self._remove(key)
+            self._entries[key] = (value, size, expires)
+            self.current_bytes += size
+            while self.current_bytes > self.max_bytes:
+                self._remove(next(iter(self._entries)))
+        return True
+
+    def delete(self, key):
+        with self._lock:
+            if key in self._entries:
+                self._remove(key)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self.current_bytes = 0
+
+    def stats(self):
+        return {
+            'entries': len(self._entries),
+            'bytes': self.current_bytes,
+            'max_bytes': self.max_bytes,
+            'hits': self.hits,
+            'misses': self.misses,
+        }
+
+    def _remove(self, key):
+        self.current_bytes -= self._entries.pop(key)[1]
+
+
+def _sizeof(value):
+    if isinstance(value, bytes):
+        return len(value)
+    if isinstance(value, tuple):
+        return sum(_sizeof(item) for item in value)
+    return len(str(value).encode('utf-8'))
+
+
+class EntityVersions(object):
+    '''
+    Monotonic version counters per (kind, id). Bumping an entity also bumps
+    the version of its kind (id None) and the global generation, which key
+    listing fragments and full pages respectively.
+    '''
+
+    def __init__(self):
+        self._versions = {}
+        self._lock = threading.Lock()
+        self.generation = 0
+
+    def get(self, kind, id=None):
+        return self._versions.get((kind, id), 0)
+
+    def bump(self, kind, id=None):
+        with self._lock:
+            for key in ((kind, id), (kind, None)):
+                self._versions[key] = self._versions.get(key, 0) + 1
+            self.generation += 1
+
+
+def track_versions(versions, session, model, kind, related=None):
+    '''
+    Bumps the version of `kind` for every inserted, updated or deleted
+    `model` row. `related(target)` may return extra (kind, id) pairs to
+    invalidate, e.g. the venue and artist of a show.
+
+    Bumps are staged at flush and applied once `session` commits: bumping at
+    flush would let a concurrent request cache the not yet committed old row
+    under the new version, where it would stay until its TTL.
+    '''
+    def stage(mapper, connection, target):
+        staged = object_session(target).info.setdefault(STAGED_KEY, [])
+        staged.append((versions, kind, target.id))
+        if related is not None:
+            for related_kind, related_id in related(target):
+                staged.append((versions, related_kind, related_id))
+
+    for name in ('after_insert', 'after_update', 'after_delete'):
+        event.listen(model, name, stage)
+    _listen_for_commits(session)
+
+
+_tracked_sessions = []
+
+
+def _listen_for_commits(session):
+    if any(tracked is session for tracked in _tracked_sessions):
+        return
+    _tracked_sessions.append(session)
+
+    @event.listens_for(session, 'after_commit')
+    def apply_staged(session):
+        for versions, kind, id in session.info.pop(STAGED_KEY, []):
+            versions.bump(kind, id)
+
+    @event.listens_for(session, 'after_rollback')
+    def discard_staged(session):
+        session.info.pop(STAGED_KEY, None)
+
+
+class SnapshotCache(object):
+    '''
+    Plain-dict snapshots of rows keyed by (kind, id, version), shared by the
+    detail and edit pages so a fresh snapshot costs no query.
+    '''
+
+    def __init__(self, versions, cache):
+        self.versions = versions
+        self.cache = cache
+
+    def get(self, kind, id, loader, version_id=None):
+        '''
+        The snapshot of `kind` `id`, from `loader()` on a miss. Returns None
+        (uncached) when the loader finds no row. With `version_id`, e.g. read
+        from the db, a cached snapshot of another version is reloaded too:
+        versions are per process and miss commits made by other workers.
+        '''
+        key = ('snapshot', kind, id, self.versions.get(kind, id))
+        snapshot = self.cache.get(key)
+        if snapshot is None or (version_id is not None and
+                                snapshot['version_id'] != version_id):
+            snapshot = loader()
+            if snapshot is not None:
+                self.cache.set(key, snapshot)
+        return snapshot
+
+
+class FragmentCacheExtension(Extension):
+    '''
+    Adds a `cache` tag to templates:
+
+        {% cache 'venue', venue.id %} ... {% endcache %}
+
+    The block output is stored under the template name, the tag position and
+    the current version of the entity, so it is rebuilt as soon as that
+    venue changes. Without an id the kind-wide version is used. An optional
+    third argument varies the key further, e.g. by the active filters:
+
+        {% cache 'venue', None, request.query_string %} ... {% endcache %}
+    '''
+    tags = set(['cache'])
+
+    def __init__(self, environment):
+        super(FragmentCacheExtension, self).__init__(environment)
+        environment.extend(fragment_cache=None, fragment_versions=None)
+
+    def parse(self, parser):
+        lineno = next(parser.stream).lineno
+        args = [nodes.Const(parser.name), nodes.Const(lineno),
+                parser.parse_expression()]
+        while len(args) < 5 and parser.stream.skip_if('comma'):
+            args.append(parser.parse_expression())
+        while len(args) < 5:
+            args.append(nodes.Const(None))
+        body = parser.parse_statements(['name:endcache'], drop_needle=True)
+        return nodes.CallBlock(self.call_method('_cache_support', args),
+                               [], [], body).set_lineno(lineno)
+
+    def _cache_support(self, template, lineno, kind, id, vary, caller):
+        cache = self.environment.fragment_cache
+        versions = self.environment.fragment_versions
+        if cache is None or versions is None:
+            return caller()
+        key = ('fragment', template, lineno, kind, id, vary,
+               versions.get(kind, id))
+        rv = cache.get(key)
+        if rv is None:
+            rv = caller()
+            cache.set(key, rv)
+        return rv
+
+
+class RenderStats(object):
+    '''
+    Per-template render count and timings, in milliseconds.
+    '''
+
+    def __init__(self):
+        self._stats = {}
+        self._lock = threading.Lock()
+
+    def record(self, name, seconds):
+        with self._lock:
+            count, total, slowest = self._stats.get(name, (0, 0.0, 0.0))
+            self._stats[name] = (count + 1, total + seconds,
+                                 max(slowest, seconds))
+
+    def snapshot(self):
+        with self._lock:
+            return dict((name, {
+                'count': count,
+                'total_ms': round(total * 1000, 3),
+                'avg_ms': round(total * 1000 / count, 3),
+                'max_ms': round(slowest * 1000, 3),
+            }) for name, (count, total, slowest) in self._stats.items())
+
+
+render_stats = RenderStats()
+
+
+class TimedTemplate(Template):
+    '''
+    Records top-level render time; included and extended templates are
+    counted as part of the template that pulled them in.
+    '''
+
+    def render(self, *args, **kwargs):
+        start = time.perf_counter()
+        try:
+            return super(TimedTemplate, self).render(*args, **kwargs)
+        finally:
+            elapsed = time.perf_counter() - start
+            render_stats.record(self.name, elapsed)
+            record_timing('render', elapsed)
+
+
+class PageCache(object):
+    '''
+    Full-page cache for anonymous GET requests to the HTML pages listed in
+    PAGE_CACHE_ENDPOINTS; JSON endpoints such as /metrics or job status are
+    never cached. A request is anonymous when it carries no session cookie
+    and the handler leaves the session untouched (e.g. no flashed messages).
+    Entries are keyed by the global generation so any write invalidates
+    every cached page.
+    '''
+
+    def __init__(self, versions, app=None):
+        self.versions = versions
+        self.cache = None
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        if not app.config.get('PAGE_CACHE_ENABLED'):
+            return
+        self.cache = LRUCache(app.config['PAGE_CACHE_MAX_BYTES'],
+                              app.config['PAGE_CACHE_TTL'])
+        self.endpoints = frozenset(app.config['PAGE_CACHE_ENDPOINTS'])
+        self.session_cookie_name = app.session_cookie_name
+        app.before_request(self.serve_cached)
+        app.after_request(self.store)
+
+    def key(self):
+        if request.method != 'GET' or request.endpoint not in self.endpoints:
+            return None
+        if request.cookies.get(self.session_cookie_name):
+            return None
+        return ('page', request.full_path, self.versions.generation)
+
+    def serve_cached(self):
+        key = self.key()
+        if key is None:
+            return None
+        cached = self.cache.get(key)
+        if cached is None:
+            return None
+        body, mimetype = cached
+        return current_app.response_class(
+            body, mimetype=mimetype, headers={'X-Page-Cache': 'HIT'})
+
+    def store(self, response):
+        key = self.key()
+        if key is None or response.status_code != 200 \
+                or response.mimetype != 'text/html' \
+                or response.direct_passthrough or session.modified \
+                or response.headers.get('X-Page-Cache'):
+            return response
+        self.cache.set(key, (response.get_data(), response.mimetype))
+        return response
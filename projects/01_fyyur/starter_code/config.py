@@ -1,4 +1,5 @@
 import os
+from routing import parse_replicas
 SECRET_KEY = os.urandom(32)
 # Grabs the folder where the script runs.
 basedir = os.path.abspath(os.path.dirname(__file__))
@@ -9,5 +10,87 @@ DEBUG = True
 # Connect to the database
 
 
-# TODO IMPLEMENT DATABASE URL
-SQLALCHEMY_DATABASE_URI = '<Put your local database url>'
+SQLALCHEMY_DATABASE_URI = os.environ.get(
+    'DATABASE_URL', 'postgresql://localhost:5432/fyyur')
+SQLALCHEMY_TRACK_MODIFICATIONS = False
+
+# Read replicas for GET requests (see routing.py), e.g.
+# DATABASE_REPLICA_URLS="2*postgresql://replica-a/fyyur postgresql://replica-b/fyyur"
+# weights replica-a twice as heavily. Unset, everything uses DATABASE_URL.
+SQLALCHEMY_REPLICAS = parse_replicas(os.environ.get('DATABASE_REPLICA_URLS'))
+SQLALCHEMY_REPLICA_CHECK_SECONDS = 10
+# Seconds a client keeps reading from the primary after it wrote.
+REPLICA_STICKY_SECONDS = 5
+
+
+# Queries at least this slow are logged to the fyyur.sql logger.
+SLOW_QUERY_MS = 100
+
+# Responses smaller than this many bytes are not worth compressing.
+COMPRESS_MIN_SIZE = 500
+COMPRESS_LEVEL = 6
+
+# Rendered template fragments, keyed by entity version.
+FRAGMENT_CACHE_MAX_BYTES = 16 * 1024 * 1024
+FRAGMENT_CACHE_TTL = 300
+
+# Venue/artist row snapshots shared by the detail and edit pages.
+SNAPSHOT_CACHE_MAX_BYTES = 4 * 1024 * 1024
+SNAPSHOT_CACHE_TTL = 300
+
+# Full-page cache for anonymous GETs; off by default.
+PAGE_CACHE_ENABLED = False
+PAGE_CACHE_TTL = 60
+PAGE_CACHE_MAX_BYTES = 64 * 1024 * 1024
+# Only these HTML pages are cached, never JSON endpoints such as /metrics.
+PAGE_CACHE_ENDPOINTS = ('index', 'venues', 'artists', 'shows',
+                        'show_venue', 'show_artist')
+
+# Seconds before a worker rebuilds its facet bitmaps from the db, bounding
+# how long writes made through other processes stay invisible.
+FACET_INDEX_TTL = 300
+
+# Proximity search: 'auto' uses PostGIS when the extension is installed and
+# the in-process grid otherwise; 'postgis' or 'grid' force one of them.
+GEO_BACKEND = 'auto'
+GEO_GRID_CELL_DEGREES = 0.25
+GEO_INDEX_TTL = 300
+# Larger ?radius= values on the nearby pages are rejected.
+GEO_MAX_RADIUS_MILES = 500
+
+# Show length used for double-booking checks, in minutes. Shows longer than
+# the maximum are rejected, which bounds the overlap lookups.
+SHOW_DURATION_MINUTES = 120
+SHOW_MAX_DURATION_MINUTES = 720
+
+# Venue/artist calendars: slot size in minutes, seconds before a worker
+# reloads a resource's shows, and the longest range one request may ask for.
+# A worker loads at least CALENDAR_WINDOW_DAYS of a resource's shows at a
+# time and keeps at most CALENDAR_MAX_RESOURCES venues and artists.
+CALENDAR_SLOT_MINUTES = 30
+CALENDAR_TTL = 300
+CALENDAR_MAX_DAYS = 92
+CALENDAR_WINDOW_DAYS = 92
+CALENDAR_MAX_RESOURCES = 10000
+
+# Background jobs run after creates commit (see jobs.py). JOB_WORKERS = 0
+# runs them inline instead; failed jobs are retried with exponential backoff
+# starting at JOB_RETRY_BACKOFF seconds.
+JOB_WORKERS = 2
+JOB_MAX_ATTEMPTS = 3
+JOB_RETRY_BACKOFF = 0.5
+# Job status rows (the job_status table) are pruned after this long.
+JOB_STATUS_KEEP_SECONDS = 3600
+
+# Prometheus metrics at /metrics. Under multi-process servers point
+# METRICS_DIR at a directory shared by the workers so /metrics sums them.
+METRICS_DIR = os.environ.get('METRICS_DIR')
+METRICS_FLUSH_SECONDS = 5
+
+# Request profiling (see profiling.py), off unless PROFILE_DIR is set along
+# with a token for the X-Profile header and/or a sample rate such as 0.001.
+PROFILE_DIR = os.environ.get('PROFILE_DIR')
+PROFILE_TOKEN = os.environ.get('PROFILE_TOKEN')
+PROFILE_SAMPLE_RATE = float(os.environ.get('PROFILE_SAMPLE_RATE', 0))
+PROFILE_MODE = os.environ.get('PROFILE_MODE', 'sample')
+PROFILE_MAX_BYTES = 50 * 1024 * 1024
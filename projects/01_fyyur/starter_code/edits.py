@@ -0,0 +1,77 @@
+#----------------------------------------------------------------------------#
+# Incremental edits.
+#
+# The edit forms post every field back, changed or not. Rather than copying
+# them all onto the row, only the fields that differ from the loaded state
+# are assigned, so an unchanged form issues no UPDATE at all and a partial
+# edit only writes (and invalidates caches for) what really changed.
+#
+# Venues and artists carry a version_id that the edit form echoes back. It is
+# bumped by hand on each real change and checked by SQLAlchemy in the UPDATE's
+# WHERE clause, so a save based on a stale form is rejected instead of
+# silently overwriting someone else's edit.
+#----------------------------------------------------------------------------#
+
+
+def snapshot_of(entity):
+    '''
+    Column values of a venue or artist plus its sorted genre names, as a
+    plain dict that can be cached and shared across requests.
+    '''
+    snapshot = dict((column.key, getattr(entity, column.key))
+                    for column in entity.__table__.columns)
+    snapshot['genres'] = sorted(genre.name for genre in entity.genres)
+    return snapshot
+
+
+def form_values(snapshot, fields):
+    '''
+    Form data for editing the entity in `snapshot`: its `fields`, genre
+    names and version.
+    '''
+    values = dict((name, snapshot[name]) for name in fields)
+    values['genres'] = list(snapshot['genres'])
+    values['version'] = snapshot['version_id']
+    return values
+
+
+def normalized(value):
+    # Blank optional inputs come back as '' while the column holds NULL.
+    if isinstance(value, str):
+        return value.strip() or None
+    return value
+
+
+def changed_values(entity, form, fields):
+    '''
+    {field: new value} for the form fields that differ from `entity`, with
+    'genres' as a sorted list of names when the genre selection changed.
+    '''
+    changes = {}
+    for name in fields:
+        value = normalized(form[name].data)
+        if value != getattr(entity, name):
+            changes[name] = value
+    genres = sorted(set(form.genres.data or ()))
+    if genres != sorted(genre.name for genre in entity.genres):
+        changes['genres'] = genres
+    return changes
+
+
+def is_stale(entity, form):
+    return str(form.version.data) != str(entity.version_id)
+
+
+def apply_changes(entity, changes, genres_named):
+    '''
+    Assigns `changes` and bumps the version; `genres_named(names)` resolves
+    genre names to Genre rows.
+    '''
+    for name, value in changes.items():
+        if name == 'genres':
+            entity.genres = genres_named(value)
+        else:
+            setattr(entity, name, value)
+    # Also makes genre-only edits UPDATE the row, so they are versioned and
+    # reach the cache and index listeners like any other change.
+    entity.version_id = entity.version_id + 1
@@ -56,3 +56,9 @@ def deploy():
 
 def rollback():
     local("heroku rollback")
+
+# static assets
+
+
+def precompress():
+    local("python compression.py static")
@@ -0,0 +1,285 @@
+#----------------------------------------------------------------------------#
+# Faceted browsing.
+#
+# A FacetIndex keeps one bitmap per facet value (a Python int with bit `id`
+# set for every matching entity). Any combination of filters is answered by
+# OR-ing the selected values of a facet and AND-ing across facets, so facet
+# counts never scan the venue or artist tables.
+#
+# The index is built from the db on first use and then kept current from
+# SQLAlchemy events: changes are staged at flush and applied on commit, so a
+# rolled back write never reaches the index.
+#----------------------------------------------------------------------------#
+
+import logging
+import threading
+import time
+
+from flask import current_app, has_app_context, url_for
+from sqlalchemy import event
+from sqlalchemy.orm import object_session
+
+log = logging.getLogger(__name__)
+
+STAGED_KEY = 'facet_changes'
+
+
+def popcount(bitmap):
+    return bin(bitmap).count('1')
+
+
+def iter_ids(bitmap):
+    while bitmap:
+        lowest = bitmap & -bitmap
+        yield lowest.bit_length() - 1
+        bitmap ^= lowest
+
+
+class SyncedIndex(object):
+    '''
+    Base for in-memory indexes mirroring a table. Subclasses implement
+    values_of(entity), set(id, values) and remove(id), keep their data in
+    the attributes named by `state`, and return a blank copy from empty().
+    '''
+    state = ()
+
+    def __init__(self, ttl=None):
+        self.ttl = ttl
+        self.loaded_at = None
+        self.refreshing = False
+        self._lock = threading.Lock()
+        self._load_lock = threading.Lock()
+        self._reset()
+
+    def ensure_loaded(self, loader):
+        '''
+        Builds the index from `loader()` on first use; concurrent first
+        requests wait for that one build. After `ttl` seconds, so workers
+        converge on writes made by other processes, one background thread
+        rebuilds it while requests keep reading the current copy. Either
+        way the rebuild happens off to the side and is swapped in under the
+        lock.
+        '''
+        if self.loaded_at is None:
+            with self._load_lock:
+                if self.loaded_at is None:
+                    self._rebuild(loader)
+            return
+        if self.ttl is None or time.time() - self.loaded_at < self.ttl:
+            return
+        with self._lock:
+            if self.refreshing:
+                return
+            self.refreshing = True
+        if not has_app_context():
+            return self._refresh(None, loader)
+        thread = threading.Thread(
+            target=self._refresh, name='refresh-index',
+            args=(current_app._get_current_object(), loader))
+        thread.daemon = True
+        thread.start()
+
+    def _refresh(self, app, loader):
+        try:
+            if app is None:
+                self._rebuild(loader)
+            else:
+                with app.app_context():
+                    self._rebuild(loader)
+        except Exception:
+            log.exception('rebuilding %s failed', type(self).__name__)
+        finally:
+            self.refreshing = False
+
+    def _rebuild(self, loader):
+        fresh = self.empty()
+        for entity in loader():
+            values = fresh.values_of(entity)
+            if values is not None:
+                fresh.set(entity.id, values)
+        with self._lock:
+            for name in self.state:
+                setattr(self, name, getattr(fresh, name))
+            self.loaded_at = time.time()
+
+    def invalidate(self):
+        with self._lock:
+            self._reset()
+            self.loaded_at = None
+
+    def track(self, session, model):
+        '''
+        Keeps the index in step with inserts, updates and deletes of `model`
+        committed through `session`.
+        '''
+        def stage(mapper, connection, target):
+            _staged(target).append((self, target.id, self.values_of(target)))
+
+        def stage_delete(mapper, connection, target):
+            _staged(target).append((self, target.id, None))
+
+        event.listen(model, 'after_insert', stage)
+        event.listen(model, 'after_update', stage)
+        event.listen(model, 'after_delete', stage_delete)
+        _listen_for_commits(session)
+
+
+class FacetIndex(SyncedIndex):
+    '''
+    `facets` maps a facet name to a function returning the facet values of an
+    entity, e.g. {'genre': lambda venue: [g.name for g in venue.genres]}.
+
+    Writers never change a published bitmaps dict: they copy the facets
+    they touch and swap the result in under the lock, so readers work on a
+    consistent (all, bitmaps) view without holding it.
+    '''
+    state = ('all', 'bitmaps', 'entries')
+
+    def __init__(self, facets, ttl=None):
+        self.facets = facets
+        super(FacetIndex, self).__init__(ttl)
+
+    def empty(self):
+        return FacetIndex(self.facets)
+
+    def _reset(self):
+        self.all = 0
+        self.bitmaps = dict((name, {}) for name in self.facets)
+        self.entries = {}
+
+    def values_of(self, entity):
+        return dict((name, frozenset(str(value) for value in extract(entity)))
+                    for name, extract in self.facets.items())
+
+    def view(self):
+        with self._lock:
+            return self.all, self.bitmaps
+
+    def set(self, id, values):
+        with self._lock:
+            bitmaps = dict(self.bitmaps)
+            self._unset(id, bitmaps)
+            bit = 1 << id
+            for name, facet_values in values.items():
+                facet = bitmaps[name] = dict(bitmaps[name])
+                for value in facet_values:
+                    facet[value] = facet.get(value, 0) | bit
+            self.entries[id] = values
+            self.all, self.bitmaps = self.all | bit, bitmaps
+
+    def remove(self, id):
+        with self._lock:
+            bitmaps = dict(self.bitmaps)
+            self._unset(id, bitmaps)
+            self.bitmaps = bitmaps
+
+    def _unset(self, id, bitmaps):
+        # Clears `id` from `bitmaps`, a copy of self.bitmaps, copying each
+        # facet it changes.
+        values = self.entries.pop(id, None)
+        if values is None:
+            return
+        mask = ~(1 << id)
+        self.all &= mask
+        for name, facet_values in values.items():
+            facet = bitmaps[name] = dict(bitmaps[name])
+            for value in facet_values:
+                bitmap = facet.get(value, 0) & mask
+                if bitmap:
+                    facet[value] = bitmap
+                else:
+                    facet.pop(value, None)
+
+    def match(self, filters, skip=None, view=None):
+        '''
+        Bitmap of entities matching `filters` ({facet: [values]}): values of
+        one facet are OR-ed, facets are AND-ed. `skip` ignores one facet.
+        '''
+        bitmap, bitmaps = view or self.view()
+        for name, values in filters.items():
+            if name == skip or not values:
+                continue
+            selected = 0
+            for value in values:
+                selected |= bitmaps[name].get(value, 0)
+            bitmap &= selected
+        return bitmap
+
+    def ids(self, filters):
+        return list(iter_ids(self.match(filters)))
+
+    def counts(self, filters):
+        '''
+        Per facet value, the number of entities that would match if that
+        value were selected. Each facet is counted against the filters of
+        the other facets so alternatives within a facet stay visible.
+        '''
+        view = self.view()
+        counts = {}
+        for name in self.facets:
+            base = self.match(filters, skip=name, view=view)
+            counts[name] = dict(
+                (value, popcount(base & bitmap))
+                for value, bitmap in view[1][name].items())
+        return counts
+
+
+def _staged(target):
+    return object_session(target).info.setdefault(STAGED_KEY, [])
+
+
+_tracked_sessions = []
+
+
+def _listen_for_commits(session):
+    if any(tracked is session for tracked in _tracked_sessions):
+        return
+    _tracked_sessions.append(session)
+
+    @event.listens_for(session, 'after_commit')
+    def apply_staged(session):
+        for index, id, values in session.info.pop(STAGED_KEY, []):
+            if index.loaded_at is None:
+                continue
+            if values is None:
+                index.remove(id)
+            else:
+                index.set(id, values)
+
+    @event.listens_for(session, 'after_rollback')
+    def discard_staged(session):
+        session.info.pop(STAGED_KEY, None)
+
+
+def parse_filters(index, args):
+    return dict((name, args.getlist(name)) for name in index.facets
+                if args.getlist(name))
+
+
+def facet_links(index, filters, endpoint):
+    '''
+    Facet values with their counts and a link toggling each value, ready for
+    the pages/facets.html partial.
+    '''
+    counts = index.counts(filters)
+    links = []
+    for name in index.facets:
+        selected = filters.get(name, [])
+        values = []
+        for value in sorted(set(counts[name]) | set(selected)):
+            toggled = dict(filters)
+            if value in selected:
+                toggled[name] = [v for v in selected if v != value]
+            else:
+                toggled[name] = selected + [value]
+            values.append({
+                'value': value,
+                'count': counts[name].get(value, 0),
+                'selected': value in selected,
+                'url': url_for(endpoint, **dict(
+                    (key, chosen) for key, chosen in toggled.items()
+                    if chosen)),
+            })
+        if values:
+            links.append({'name': name, 'values': values})
+    return links
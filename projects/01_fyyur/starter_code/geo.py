@@ -0,0 +1,174 @@
+#----------------------------------------------------------------------------#
+# Proximity search.
+#
+# With PostGIS available, radius and nearest-neighbour queries run in the db
+# against a GiST index on the venue/artist geography. Otherwise a GridIndex
+# buckets coordinates into fixed-size lat/lng cells in memory, so a query
+# only inspects the handful of cells overlapping its bounding box instead of
+# every row.
+#----------------------------------------------------------------------------#
+
+import math
+
+from sqlalchemy import text
+
+from facets import SyncedIndex
+
+EARTH_RADIUS_MILES = 3958.8
+MILES_PER_DEGREE_LAT = 69.05
+METERS_PER_MILE = 1609.344
+
+
+def normalize_lng(lng):
+    '''
+    The same longitude in [-180, 180).
+    '''
+    return (lng + 180.0) % 360.0 - 180.0
+
+
+def haversine_miles(lat1, lng1, lat2, lng2):
+    lat1, lng1, lat2, lng2 = map(math.radians, (lat1, lng1, lat2, lng2))
+    a = math.sin((lat2 - lat1) / 2) ** 2 + \
+        math.cos(lat1) * math.cos(lat2) * math.sin((lng2 - lng1) / 2) ** 2
+    return 2 * EARTH_RADIUS_MILES * math.asin(min(1.0, math.sqrt(a)))
+
+
+class GridIndex(SyncedIndex):
+    '''
+    In-process spatial index: points are bucketed by
+    (floor(lat / cell_degrees), floor(lng / cell_degrees)).
+    '''
+    state = ('cells', 'entries')
+
+    def __init__(self, extract, cell_degrees=0.25, ttl=None):
+        self.extract = extract
+        self.cell_degrees = cell_degrees
+        super(GridIndex, self).__init__(ttl)
+
+    def empty(self):
+        return GridIndex(self.extract, self.cell_degrees)
+
+    def _reset(self):
+        self.cells = {}
+        self.entries = {}
+
+    def values_of(self, entity):
+        point = self.extract(entity)
+        if point is None or None in point:
+            return None
+        return (float(point[0]), normalize_lng(float(point[1])))
+
+    def cell(self, lat, lng):
+        return (int(math.floor(lat / self.cell_degrees)),
+                int(math.floor(lng / self.cell_degrees)))
+
+    def set(self, id, point):
+        with self._lock:
+            self._unset(id)
+            self.cells.setdefault(self.cell(*point), {})[id] = point
+            self.entries[id] = point
+
+    def remove(self, id):
+        with self._lock:
+            self._unset(id)
+
+    def _unset(self, id):
+        point = self.entries.pop(id, None)
+        if point is None:
+            return
+        key = self.cell(*point)
+        bucket = self.cells.get(key)
+        if bucket is not None:
+            bucket.pop(id, None)
+            if not bucket:
+                del self.cells[key]
+
+    def within(self, lat, lng, radius_miles, limit=None):
+        '''
+        [(distance_miles, id)] of points within `radius_miles`, nearest
+        first.
+        '''
+        lng = normalize_lng(lng)
+        lat_span = radius_miles / MILES_PER_DEGREE_LAT
+        cos_lat = max(math.cos(math.radians(lat)), 1e-6)
+        lng_span = min(180.0, lat_span / cos_lat)
+        # Rows beyond the poles hold no points.
+        low_lat, low_lng = self.cell(max(-90.0, lat - lat_span),
+                                     lng - lng_span)
+        high_lat, high_lng = self.cell(min(90.0, lat + lat_span),
+                                       lng + lng_span)
+        # A box crossing the antimeridian continues on the other side, so
+        # its cell columns are mapped back into [-180, 180).
+        columns = set(self.cell(0, normalize_lng(
+            (column + 0.5) * self.cell_degrees))[1]
+            for column in range(low_lng, high_lng + 1))
+
+        cells = self.cells
+        rows = range(low_lat, high_lat + 1)
+        if len(rows) * len(columns) > len(cells):
+            # A wide box has more cells than are occupied; walk those.
+            keys = [key for key in list(cells)
+                    if key[0] in rows and key[1] in columns]
+        else:
+            keys = [(row, column) for row in rows for column in columns]
+        found = []
+        for key in keys:
+            bucket = cells.get(key)
+            if not bucket:
+                continue
+            for id, (point_lat, point_lng) in list(bucket.items()):
+                distance = haversine_miles(lat, lng, point_lat, point_lng)
+                if distance <= radius_miles:
+                    found.append((distance, id))
+        found.sort()
+        return found[:limit] if limit else found
+
+    def nearest(self, lat, lng, k=10, max_radius_miles=500):
+        '''
+        The `k` nearest points, found by widening the search radius until
+        enough points fall inside it.
+        '''
+        radius = self.cell_degrees * MILES_PER_DEGREE_LAT
+        while True:
+            found = self.within(lat, lng, radius, limit=k)
+            if len(found) >= k or radius >= max_radius_miles:
+                return found
+            radius = min(radius * 2, max_radius_miles)
+
+
+# Must match the expression of the GiST indexes in the geo migration.
+GEOGRAPHY = 'ST_SetSRID(ST_MakePoint(longitude, latitude), 4326)::geography'
+ORIGIN = 'ST_SetSRID(ST_MakePoint(:lng, :lat), 4326)::geography'
+
+
+class PostgisSearch(object):
+    '''
+    Radius search pushed down to PostGIS, served by the geography index.
+    '''
+
+    def __init__(self, table):
+        self.query = text(
+            'SELECT id, ST_Distance({geog}, {origin}) / :meters_per_mile '
+            'FROM "{table}" '
+            'WHERE ST_DWithin({geog}, {origin}, :meters) '
+            'ORDER BY {geog} <-> {origin} '
+            'LIMIT :limit'.format(geog=GEOGRAPHY, origin=ORIGIN, table=table))
+
+    def within(self, session, lat, lng, radius_miles, limit=100):
+        rows = session.execute(self.query, {
+            'lat': lat,
+            'lng': lng,
+            'meters': radius_miles * METERS_PER_MILE,
+            'meters_per_mile': METERS_PER_MILE,
+            'limit': limit,
+        })
+        return [(miles, id) for id, miles in rows]
+
+
+def has_postgis(session):
+    bind = session.get_bind()
+    if bind.dialect.name != 'postgresql':
+        return False
+    return session.execute(text(
+        "SELECT 1 FROM pg_extension WHERE extname = 'postgis'")).first() \
+        is not None
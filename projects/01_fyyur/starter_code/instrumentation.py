@@ -0,0 +1,156 @@
+#----------------------------------------------------------------------------#
+# Request timing and slow-query logging.
+#
+# Every request is timed end to end and broken down into db time (summed from
+# SQLAlchemy cursor events), template rendering and JSON serialization. The
+# breakdown goes out as a Server-Timing header and as one JSON log line per
+# request; queries slower than SLOW_QUERY_MS are logged on their own.
+#
+# Logs go through a QueueHandler: request threads only enqueue records and a
+# QueueListener thread does the formatting and file writes.
+#----------------------------------------------------------------------------#
+
+import atexit
+import json
+import logging
+import os
+import queue
+import time
+from logging.handlers import QueueHandler, QueueListener
+
+from flask import g, has_request_context, request
+from sqlalchemy import event
+
+request_log = logging.getLogger('fyyur.requests')
+query_log = logging.getLogger('fyyur.sql')
+
+PHASES = ('db', 'render', 'serialize')
+
+
+def record_timing(phase, seconds):
+    '''
+    Adds `seconds` to `phase` of the current request; a no-op outside one.
+    '''
+    if has_request_context() and hasattr(g, 'timings'):
+        g.timings[phase] = g.timings.get(phase, 0.0) + seconds
+
+
+def timed_json_encoder(base):
+    class TimedJSONEncoder(base):
+        def encode(self, o):
+            start = time.perf_counter()
+            try:
+                return super(TimedJSONEncoder, self).encode(o)
+            finally:
+                record_timing('serialize', time.perf_counter() - start)
+    return TimedJSONEncoder
+
+
+class RequestTimer(object):
+
+    def __init__(self, app=None, engine=None):
+        if app is not None:
+            self.init_app(app, engine)
+
+    def init_app(self, app, engine):
+        self.slow_query_seconds = app.config['SLOW_QUERY_MS'] / 1000.0
+        app.before_request(self.start)
+        app.after_request(self.finish)
+        app.json_encoder = timed_json_encoder(app.json_encoder)
+        event.listen(engine, 'before_cursor_execute', self.before_execute)
+        event.listen(engine, 'after_cursor_execute', self.after_execute)
+        event.listen(engine, 'handle_error', self.execute_failed)
+
+    def start(self):
+        g.request_started = time.perf_counter()
+        g.timings = {}
+        g.query_count = 0
+
+    # Start times are keyed by execution, so a statement that fails (and
+    # never reaches after_execute) cannot shift the pairing of later ones
+    # on the same pooled connection.
+    def before_execute(self, conn, cursor, statement, parameters, context,
+                       executemany):
+        conn.info.setdefault('query_started', {})[
+            _execution(context, cursor)] = time.perf_counter()
+
+    def execute_failed(self, exception_context):
+        connection = exception_context.connection
+        if connection is not None:
+            connection.info.get('query_started', {}).pop(_execution(
+                exception_context.execution_context,
+                exception_context.cursor), None)
+
+    def after_execute(self, conn, cursor, statement, parameters, context,
+                      executemany):
+        started = conn.info.get('query_started', {}).pop(
+            _execution(context, cursor), None)
+        if started is None:
+            return
+        elapsed = time.perf_counter() - started
+        record_timing('db', elapsed)
+        if has_request_context() and hasattr(g, 'query_count'):
+            g.query_count += 1
+        if elapsed >= self.slow_query_seconds:
+            query_log.warning(json.dumps({
+                'event': 'slow_query',
+                'ms': round(elapsed * 1000, 3),
+                'statement': ' '.join(statement.split()),
+                'endpoint': request.endpoint if has_request_context() else None,
+            }))
+
+    def finish(self, response):
+        if not hasattr(g, 'request_started'):
+            return response
+        total = time.perf_counter() - g.request_started
+        timings = dict((phase, g.timings.get(phase, 0.0)) for phase in PHASES)
+        timings['app'] = max(0.0, total - sum(timings.values()))
+        timings['total'] = total
+
+        response.headers['Server-Timing'] = ', '.join(
+            '{};dur={:.3f}'.format(phase, seconds * 1000)
+            for phase, seconds in timings.items())
+        if request_log.isEnabledFor(logging.INFO):
+            entry = {
+                'method': request.method,
+                'path': request.path,
+                'endpoint': request.endpoint,
+                'status': response.status_code,
+                'queries': g.query_count,
+            }
+            entry.update(('{}_ms'.format(phase), round(seconds * 1000, 3))
+                         for phase, seconds in timings.items())
+            request_log.info(json.dumps(entry))
+        return response
+
+
+def _execution(context, cursor):
+    # Some dialect-internal statements run without an execution context.
+    return context if context is not None else cursor
+
+
+def setup_logging(app, handler, loggers=(request_log, query_log)):
+    '''
+    Routes app.logger and `loggers` through a queue to `handler`, which is
+    written to from a background listener thread.
+    '''
+    records = queue.Queue(-1)
+    listener = QueueListener(records, handler, respect_handler_level=True)
+    listener.start()
+    atexit.register(listener.stop)
+    queue_handler = QueueHandler(records)
+    for logger in (app.logger,) + tuple(loggers):
+        logger.setLevel(logging.INFO)
+        logger.addHandler(queue_handler)
+
+    def restart():
+        # Threads do not survive fork(), so workers forked from a preloaded
+        # app start their own listener, on a fresh queue in case the
+        # parent's lock was held at the fork.
+        listener.queue = queue_handler.queue = queue.Queue(-1)
+        listener._thread = None
+        listener.start()
+
+    if hasattr(os, 'register_at_fork'):
+        os.register_at_fork(after_in_child=restart)
+    return listener
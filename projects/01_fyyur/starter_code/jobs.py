@@ -0,0 +1,213 @@
+#----------------------------------------------------------------------------#
+# Background jobs.
+#
+# Create requests commit their row and return; follow-up work that can lag
+# behind (warming caches, reloading indexes) is handed to a small pool of
+# worker threads. Failed jobs are retried with exponential backoff and their
+# status stays queryable for a while so callers can poll it; under several
+# worker processes, keep it in a SqlJobStore that all of them read.
+#----------------------------------------------------------------------------#
+
+import logging
+import queue
+import threading
+import time
+import traceback
+import uuid
+from collections import OrderedDict
+
+from sqlalchemy import Column, Float, Integer, String, Table, Text
+from sqlalchemy.exc import SQLAlchemyError
+
+log = logging.getLogger(__name__)
+
+PENDING = 'pending'
+RUNNING = 'running'
+RETRYING = 'retrying'
+SUCCEEDED = 'succeeded'
+FAILED = 'failed'
+
+
+class Job(object):
+
+    def __init__(self, name, func, args, max_attempts):
+        self.id = uuid.uuid4().hex
+        self.name = name
+        self.func = func
+        self.args = args
+        self.max_attempts = max_attempts
+        self.attempts = 0
+        self.status = PENDING
+        self.error = None
+        self.created_at = time.time()
+        self.finished_at = None
+
+    def to_dict(self):
+        return {
+            'id': self.id,
+            'name': self.name,
+            'status': self.status,
+            'attempts': self.attempts,
+            'max_attempts': self.max_attempts,
+            'error': self.error,
+            'created_at': self.created_at,
+            'finished_at': self.finished_at,
+        }
+
+
+class MemoryJobStore(object):
+    '''
+    Job status in this process only, for the last `keep` jobs. Polls that
+    reach another worker get nothing, so only use it with one worker.
+    '''
+
+    def __init__(self, keep=1000):
+        self.keep = keep
+        self._jobs = OrderedDict()
+        self._lock = threading.Lock()
+
+    def save(self, job):
+        with self._lock:
+            self._jobs[job.id] = job.to_dict()
+            while len(self._jobs) > self.keep:
+                self._jobs.popitem(last=False)
+
+    def get(self, job_id):
+        return self._jobs.get(job_id)
+
+
+class SqlJobStore(object):
+    '''
+    Job status in a `job_status` table added to `metadata`, so whichever
+    worker a poll reaches can answer it. Rows older than `keep_seconds` are
+    pruned as new jobs come in.
+    '''
+
+    def __init__(self, engine, metadata, keep_seconds=3600, prune_every=100):
+        self.engine = engine
+        self.keep_seconds = keep_seconds
+        self.prune_every = prune_every
+        self._saved = 0
+        self.table = Table(
+            'job_status', metadata,
+            Column('id', String(32), primary_key=True),
+            Column('name', String(120), nullable=False),
+            Column('status', String(16), nullable=False),
+            Column('attempts', Integer, nullable=False),
+            Column('max_attempts', Integer, nullable=False),
+            Column('error', Text),
+            Column('created_at', Float, nullable=False, index=True),
+            Column('finished_at', Float))
+
+    def save(self, job):
+        values = job.to_dict()
+        with self.engine.begin() as connection:
+            updated = connection.execute(self.table.update().where(
+                self.table.c.id == job.id).values(values)).rowcount
+            if not updated:
+                connection.execute(self.table.insert().values(values))
+                self._saved += 1
+                if self._saved % self.prune_every == 0:
+                    connection.execute(self.table.delete().where(
+                        self.table.c.created_at <
+                        time.time() - self.keep_seconds))
+
+    def get(self, job_id):
+        with self.engine.connect() as connection:
+            row = connection.execute(self.table.select().where(
+                self.table.c.id == job_id)).first()
+        return dict(row) if row is not None else None
+
+
+class JobQueue(object):
+    '''
+    Runs jobs on `workers` daemon threads, each inside an app context from
+    `app`. With workers=0 jobs run inline when submitted, which keeps tests
+    and single-process tooling deterministic. Status goes to `store`, a
+    MemoryJobStore unless one shared by the workers is given.
+    '''
+
+    def __init__(self, app, workers=2, max_attempts=3, backoff=0.5,
+                 store=None):
+        self.app = app
+        self.workers = workers
+        self.max_attempts = max_attempts
+        self.backoff = backoff
+        self.store = store if store is not None else MemoryJobStore()
+        self._lock = threading.Lock()
+        self._queue = queue.Queue()
+        self._threads = []
+
+    def submit(self, name, func, *args):
+        job = Job(name, func, args, self.max_attempts)
+        self._save(job)
+        if self.workers:
+            self._start()
+            self._queue.put(job)
+        else:
+            while job.status in (PENDING, RETRYING):
+                self._run(job)
+        return job
+
+    def get(self, job_id):
+        '''
+        The status of a job as a dict (see Job.to_dict), or None.
+        '''
+        return self.store.get(job_id)
+
+    def _save(self, job):
+        # A status that fails to save must not fail the job or the request
+        # that submitted it.
+        try:
+            self.store.save(job)
+        except SQLAlchemyError:
+            log.exception('saving the status of job %s failed', job.id)
+
+    def _start(self):
+        with self._lock:
+            if self._threads:
+                return
+            for number in range(self.workers):
+                thread = threading.Thread(target=self._work,
+                                          name='jobs-{}'.format(number))
+                thread.daemon = True
+                thread.start()
+                self._threads.append(thread)
+
+    def _work(self):
+        while True:
+            job = self._queue.get()
+            try:
+                self._run(job)
+                if job.status == RETRYING:
+                    retry = threading.Timer(
+                        self.backoff * 2 ** (job.attempts - 1),
+                        self._queue.put, (job,))
+                    retry.daemon = True
+                    retry.start()
+            finally:
+                self._queue.task_done()
+
+    def _run(self, job):
+        job.status = RUNNING
+        job.attempts += 1
+        self._save(job)
+        try:
+            with self.app.app_context():
+                job.func(*job.args)
+        except Exception as error:
+            job.error = '{}: {}'.format(type(error).__name__, error)
+            if job.attempts < job.max_attempts:
+                job.status = RETRYING
+                log.warning('job %s (%s) failed, retrying: %s',
+                            job.name, job.id, job.error)
+                self._save(job)
+                return
+            job.status = FAILED
+            log.error('job %s (%s) failed after %d attempts\n%s', job.name,
+                      job.id, job.attempts, traceback.format_exc())
+        else:
+            job.status = SUCCEEDED
+            job.error = None
+        job.finished_at = time.time()
+        self._save(job)
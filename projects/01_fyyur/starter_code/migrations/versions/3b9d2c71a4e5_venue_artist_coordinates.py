@@ -0,0 +1,53 @@
+"""Venue and artist coordinates
+
+Revision ID: 3b9d2c71a4e5
+Revises: e10cf4f2d6d0
+Create Date: 2026-10-19 02:10:12.318204
+
+Latitude/longitude for proximity search. When PostGIS is installed the
+coordinates also get GiST geography indexes for ST_DWithin / KNN queries.
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '3b9d2c71a4e5'
+down_revision = 'e10cf4f2d6d0'
+branch_labels = None
+depends_on = None
+
+# Keep in sync with geo.GEOGRAPHY.
+GEOGRAPHY = 'ST_SetSRID(ST_MakePoint(longitude, latitude), 4326)::geography'
+TABLES = ('Venue', 'Artist')
+
+
+def has_postgis():
+    bind = op.get_bind()
+    if bind.dialect.name != 'postgresql':
+        return False
+    return bind.execute(sa.text(
+        "SELECT 1 FROM pg_extension WHERE extname = 'postgis'")).first() \
+        is not None
+
+
+def upgrade():
+    for table in TABLES:
+        op.add_column(table, sa.Column('latitude', sa.Float(), nullable=True))
+        op.add_column(table, sa.Column('longitude', sa.Float(), nullable=True))
+    if has_postgis():
+        for table in TABLES:
+            op.execute('CREATE INDEX ix_{}_geography ON "{}" USING gist '
+                       '(({}))'.format(table.lower(), table, GEOGRAPHY))
+
+
+def downgrade():
+    if has_postgis():
+        for table in TABLES:
+            op.execute('DROP INDEX IF EXISTS ix_{}_geography'.format(
+                table.lower()))
+    for table in TABLES:
+        with op.batch_alter_table(table) as batch_op:
+            batch_op.drop_column('longitude')
+            batch_op.drop_column('latitude')
@@ -0,0 +1,83 @@
+"""Show end time and double-booking constraints
+
+Revision ID: 7c41e0f5d8a2
+Revises: 3b9d2c71a4e5
+Create Date: 2026-10-19 02:48:37.902114
+
+Existing shows get the default two hour slot. On Postgres with btree_gist,
+exclusion constraints reject overlapping shows for the same venue or artist
+even when two bookings race past the application check.
+
+Shows booked before this check existed may already overlap, and an exclusion
+constraint cannot be added over rows that violate it (nor as NOT VALID). The
+constraint for a column is then skipped with a warning; find_conflicts
+tolerates those rows, and once they are fixed the constraint can be added by
+hand with the ALTER TABLE below.
+
+"""
+import logging
+
+from alembic import op
+import sqlalchemy as sa
+
+log = logging.getLogger('alembic.runtime.migration')
+
+
+# revision identifiers, used by Alembic.
+revision = '7c41e0f5d8a2'
+down_revision = '3b9d2c71a4e5'
+branch_labels = None
+depends_on = None
+
+DEFAULT_DURATION = {
+    'postgresql': "start_time + interval '2 hours'",
+    'sqlite': "datetime(start_time, '+2 hours')",
+}
+
+
+def has_btree_gist():
+    bind = op.get_bind()
+    if bind.dialect.name != 'postgresql':
+        return False
+    return bind.execute(sa.text(
+        "SELECT 1 FROM pg_available_extensions WHERE name = 'btree_gist'")
+    ).first() is not None
+
+
+def overlapping_pairs(column):
+    return op.get_bind().execute(sa.text(
+        'SELECT count(*) FROM "Show" a JOIN "Show" b '
+        'ON a.{0} = b.{0} AND a.id < b.id '
+        'AND a.start_time < b.end_time AND b.start_time < a.end_time'
+        .format(column))).scalar()
+
+
+def upgrade():
+    bind = op.get_bind()
+    op.add_column('Show', sa.Column('end_time', sa.DateTime(), nullable=True))
+    op.execute('UPDATE "Show" SET end_time = {}'.format(
+        DEFAULT_DURATION.get(bind.dialect.name, DEFAULT_DURATION['postgresql'])))
+    with op.batch_alter_table('Show') as batch_op:
+        batch_op.alter_column('end_time', nullable=False)
+
+    if has_btree_gist():
+        op.execute('CREATE EXTENSION IF NOT EXISTS btree_gist')
+        for column in ('venue_id', 'artist_id'):
+            overlaps = overlapping_pairs(column)
+            if overlaps:
+                log.warning('skipping ex_show_%s_overlap: %d pairs of '
+                            'existing shows overlap', column, overlaps)
+                continue
+            op.execute(
+                'ALTER TABLE "Show" ADD CONSTRAINT ex_show_{0}_overlap '
+                'EXCLUDE USING gist ({0} WITH =, '
+                'tsrange(start_time, end_time) WITH &&)'.format(column))
+
+
+def downgrade():
+    if has_btree_gist():
+        for column in ('venue_id', 'artist_id'):
+            op.execute('ALTER TABLE "Show" DROP CONSTRAINT IF EXISTS '
+                       'ex_show_{}_overlap'.format(column))
+    with op.batch_alter_table('Show') as batch_op:
+        batch_op.drop_column('end_time')
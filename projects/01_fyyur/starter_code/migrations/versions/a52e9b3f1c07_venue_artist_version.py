@@ -0,0 +1,29 @@
+"""Venue and artist version for optimistic locking
+
+Revision ID: a52e9b3f1c07
+Revises: 7c41e0f5d8a2
+Create Date: 2026-10-19 04:12:51.230417
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'a52e9b3f1c07'
+down_revision = '7c41e0f5d8a2'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    for table in ('Venue', 'Artist'):
+        with op.batch_alter_table(table) as batch_op:
+            batch_op.add_column(sa.Column('version_id', sa.Integer(),
+                                          nullable=False, server_default='1'))
+
+
+def downgrade():
+    for table in ('Venue', 'Artist'):
+        with op.batch_alter_table(table) as batch_op:
+            batch_op.drop_column('version_id')
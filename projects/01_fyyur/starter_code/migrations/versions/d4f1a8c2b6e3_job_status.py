@@ -0,0 +1,37 @@
+"""Job status shared by all workers
+
+Revision ID: d4f1a8c2b6e3
+Revises: a52e9b3f1c07
+Create Date: 2026-10-19 11:05:12.418305
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'd4f1a8c2b6e3'
+down_revision = 'a52e9b3f1c07'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_table('job_status',
+        sa.Column('id', sa.String(length=32), nullable=False),
+        sa.Column('name', sa.String(length=120), nullable=False),
+        sa.Column('status', sa.String(length=16), nullable=False),
+        sa.Column('attempts', sa.Integer(), nullable=False),
+        sa.Column('max_attempts', sa.Integer(), nullable=False),
+        sa.Column('error', sa.Text(), nullable=True),
+        sa.Column('created_at', sa.Float(), nullable=False),
+        sa.Column('finished_at', sa.Float(), nullable=True),
+        sa.PrimaryKeyConstraint('id')
+    )
+    op.create_index(op.f('ix_job_status_created_at'), 'job_status',
+                    ['created_at'], unique=False)
+
+
+def downgrade():
+    op.drop_index(op.f('ix_job_status_created_at'), table_name='job_status')
+    op.drop_table('job_status')
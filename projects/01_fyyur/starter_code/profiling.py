@@ -0,0 +1,181 @@
+# Shared module, copied into several projects. The original is in
+# projects/01_fyyur/starter_code/; edit it there and run
+# `python sync_shared.py` at the repo root to update the copies.
+#----------------------------------------------------------------------------#
+# On-demand request profiling.
+#
+# profiled(app, ...) wraps a WSGI app so that selected requests are profiled:
+# those carrying `X-Profile: <token>`, plus a random `sample_rate` fraction
+# of all requests. With neither configured the app is returned unwrapped, so
+# profiling costs nothing when it is off.
+#
+# The default 'sample' mode polls the request thread's stack every
+# `interval` seconds and writes collapsed stacks (.folded), ready for
+# flamegraph.pl or speedscope. 'cprofile' mode writes cProfile stats (.prof)
+# for snakeviz/flameprof instead. Output older than what fits in `max_bytes`
+# is deleted.
+#----------------------------------------------------------------------------#
+
+import cProfile
+import hmac
+import os
+import random
+import re
+import sys
+import threading
+import time
+from collections import Counter
+
+from werkzeug.wsgi import ClosingIterator
+
+PROFILE_HEADER = 'HTTP_X_PROFILE'
+UNSAFE_CHARS = re.compile(r'[^A-Za-z0-9_.-]+')
+
+
+def profiled(app, directory=None, sample_rate=0.0, token=None,
+             mode='sample', interval=0.002, max_bytes=50 * 1024 * 1024):
+    if not directory or not (token or sample_rate > 0):
+        return app
+    return ProfilerMiddleware(app, directory, sample_rate, token, mode,
+                              interval, max_bytes)
+
+
+class StackSampler(object):
+    '''
+    Counts the collapsed stacks of one thread, sampled from another.
+    '''
+    suffix = '.folded'
+
+    def __init__(self, interval):
+        self.interval = interval
+        self.counts = Counter()
+        self._done = threading.Event()
+
+    def start(self):
+        self.thread_id = threading.get_ident()
+        self._thread = threading.Thread(target=self._run, name='profiler')
+        self._thread.daemon = True
+        self._thread.start()
+
+    def stop(self):
+        self._done.set()
+        self._thread.join()
+
+    def _run(self):
+        while not self._done.wait(self.interval):
+            frame = sys._current_frames().get(self.thread_id)
+            stack = []
+            while frame is not None:
+                code = frame.f_code
+                stack.append('{} ({}:{})'.format(
+                    code.co_name, os.path.basename(code.co_filename),
+                    code.co_firstlineno))
+                frame = frame.f_back
+            if stack:
+                self.counts[';'.join(reversed(stack))] += 1
+
+    def write(self, path):
+        with open(path, 'w') as f:
+            for stack, count in self.counts.most_common():
+                f.write('{} {}\n'.format(stack, count))
+
+
+class TracingProfiler(object):
+    suffix = '.prof'
+
+    def __init__(self, interval=None):
+        self.profile = cProfile.Profile()
+
+    def start(self):
+        self.profile.enable()
+
+    def stop(self):
+        self.profile.disable()
+
+    def write(self, path):
+        self.profile.dump_stats(path)
+
+
+PROFILERS = {'sample': StackSampler, 'cprofile': TracingProfiler}
+
+
+class ProfilerMiddleware(object):
+
+    def __init__(self, app, directory, sample_rate=0.0, token=None,
+                 mode='sample', interval=0.002, max_bytes=50 * 1024 * 1024):
+        self.app = app
+        self.directory = directory
+        self.sample_rate = sample_rate
+        self.token = token
+        self.profiler_class = PROFILERS[mode]
+        self.interval = interval
+        self.max_bytes = max_bytes
+        self._lock = threading.Lock()
+        os.makedirs(directory, exist_ok=True)
+
+    def wanted(self, environ):
+        header = environ.get(PROFILE_HEADER)
+        if header and self.token and self._token_matches(header):
+            return True
+        return self.sample_rate > 0 and random.random() < self.sample_rate
+
+    def _token_matches(self, header):
+        # compare_digest only takes ASCII str, so compare bytes: WSGI header
+        # values are latin-1 decoded, and the client sends the token as
+        # UTF-8.
+        try:
+            sent = header.encode('latin-1')
+        except UnicodeEncodeError:
+            return False
+        return hmac.compare_digest(sent, self.token.encode('utf-8'))
+
+    def __call__(self, environ, start_response):
+        if not self.wanted(environ):
+            return self.app(environ, start_response)
+
+        profiler = self.profiler_class(self.interval)
+        started = time.time()
+        profiler.start()
+        try:
+            body = self.app(environ, start_response)
+        except Exception:
+            self.finish(profiler, environ, started)
+            raise
+        # Keep profiling while the body is iterated; stop when it is closed.
+        return ClosingIterator(
+            body, lambda: self.finish(profiler, environ, started))
+
+    def finish(self, profiler, environ, started):
+        profiler.stop()
+        elapsed_ms = int((time.time() - started) * 1000)
+        name = '{}.{:06d}-{}-{}-{}ms{}'.format(
+            time.strftime('%Y%m%dT%H%M%S', time.gmtime(started)),
+            int(started % 1 * 1000000),
+            environ.get('REQUEST_METHOD', ''),
+            UNSAFE_CHARS.sub('_', environ.get('PATH_INFO', '')).strip('_')[:80],
+            elapsed_ms, profiler.suffix)
+        profiler.write(os.path.join(self.directory, name))
+        self.prune()
+
+    def prune(self):
+        '''
+        Deletes the oldest profiles until the rest fit in max_bytes.
+        '''
+        with self._lock:
+            entries = []
+            for name in os.listdir(self.directory):
+                path = os.path.join(self.directory, name)
+                try:
+                    stat = os.stat(path)
+                except OSError:
+                    continue
+                entries.append((stat.st_mtime, stat.st_size, path))
+            total = sum(size for _, size, _ in entries)
+            for _, size, path in sorted(entries):
+                if total <= self.max_bytes:
+                    break
+                try:
+                    os.remove(path)
+                except OSError:
+                    pass
+                total -= size
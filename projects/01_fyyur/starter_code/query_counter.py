@@ -0,0 +1,84 @@
+# Shared module, copied into several projects. The original is in
+# projects/01_fyyur/starter_code/; edit it there and run
+# `python sync_shared.py` at the repo root to update the copies.
+'''
+Query budgets for tests.
+
+    class VenueTestCase(QueryBudgetMixin, unittest.TestCase):
+        def test_venue_page(self):
+            with self.assertMaxQueries(db.engine, 3):
+                self.client().get('/venues/1')
+
+Counts every statement sent to the engine inside the block. When the budget
+is exceeded the failure names the most repeated statements, which for an
+N+1 pattern is the per-row query issued in the loop.
+'''
+
+import re
+from collections import Counter
+from contextlib import contextmanager
+
+from sqlalchemy import event
+
+# "IN (?, ?, ?)" / "IN (%(id_1)s, %(id_2)s)" differ only by list length.
+PLACEHOLDER_LIST = re.compile(r'\((?:\s*(?:\?|%\(\w+\)s|:\w+)\s*,)+'
+                              r'\s*(?:\?|%\(\w+\)s|:\w+)\s*\)')
+
+
+def normalize(statement):
+    statement = ' '.join(statement.split())
+    return PLACEHOLDER_LIST.sub('(...)', statement)
+
+
+class QueryCounter(object):
+    '''
+    Records the statements executed on `engine` while active.
+    '''
+
+    def __init__(self, engine):
+        self.engine = engine
+        self.statements = []
+
+    def __enter__(self):
+        event.listen(self.engine, 'before_cursor_execute', self._record)
+        return self
+
+    def __exit__(self, *exc_info):
+        event.remove(self.engine, 'before_cursor_execute', self._record)
+
+    def _record(self, conn, cursor, statement, parameters, context,
+                executemany):
+        self.statements.append(statement)
+
+    @property
+    def count(self):
+        return len(self.statements)
+
+    def repeated(self):
+        '''
+        [(count, statement)] of statements run more than once, most
+        frequent first.
+        '''
+        counts = Counter(normalize(statement) for statement in self.statements)
+        return [(count, statement)
+                for statement, count in counts.most_common() if count > 1]
+
+    def report(self, limit=3):
+        lines = ['{} queries'.format(self.count)]
+        for count, statement in self.repeated()[:limit]:
+            lines.append('  {}x {}'.format(count, statement))
+        return '\n'.join(lines)
+
+
+class QueryBudgetMixin(object):
+    '''
+    Adds assertMaxQueries to a unittest.TestCase.
+    '''
+
+    @contextmanager
+    def assertMaxQueries(self, engine, budget):
+        with QueryCounter(engine) as counter:
+            yield counter
+        if counter.count > budget:
+            self.fail('query budget of {} exceeded: {}'.format(
+                budget, counter.report()))
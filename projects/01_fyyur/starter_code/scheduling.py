@@ -0,0 +1,85 @@
+#----------------------------------------------------------------------------#
+# Show scheduling conflicts.
+#
+# A venue or artist can only be in one show at a time, so the accepted
+# bookings of each are disjoint intervals. Kept sorted by start, a new
+# booking [start, end) can only overlap its immediate neighbours, which a
+# binary search finds in O(log n).
+#----------------------------------------------------------------------------#
+
+from bisect import bisect_right
+from collections import namedtuple
+
+Booking = namedtuple('Booking', 'ref venue_id artist_id start_time end_time')
+
+
+class IntervalIndex(object):
+    '''
+    Disjoint half-open intervals per key, e.g. ('venue', 3).
+    '''
+
+    def __init__(self):
+        self._starts = {}
+        self._ends = {}
+        self._refs = {}
+
+    def conflict(self, key, start, end):
+        '''
+        Returns the ref of a booking overlapping [start, end), or None.
+        '''
+        starts = self._starts.get(key)
+        if not starts:
+            return None
+        ends = self._ends[key]
+        i = bisect_right(starts, start)
+        if i > 0 and ends[i - 1] > start:
+            return self._refs[key][i - 1]
+        if i < len(starts) and starts[i] < end:
+            return self._refs[key][i]
+        return None
+
+    def add(self, key, start, end, ref=None):
+        '''
+        Records [start, end); the caller checks conflict() first so the
+        intervals of a key stay disjoint.
+        '''
+        starts = self._starts.setdefault(key, [])
+        i = bisect_right(starts, start)
+        starts.insert(i, start)
+        self._ends.setdefault(key, []).insert(i, end)
+        self._refs.setdefault(key, []).insert(i, ref)
+
+
+def booking_keys(booking):
+    return (('venue', booking.venue_id), ('artist', booking.artist_id))
+
+
+def find_conflicts(bookings, existing=()):
+    '''
+    Validates a whole schedule at once. `existing` are bookings already in
+    the db. Returns [(booking, key, conflicting_ref)] for every booking that
+    overlaps an existing one or an earlier booking of the same batch on the
+    same venue or artist; conflicting bookings are not added to the index,
+    so one bad row is reported once rather than cascading.
+    '''
+    index = IntervalIndex()
+    for booking in sorted(existing, key=lambda b: b.start_time):
+        for key in booking_keys(booking):
+            # Legacy overlaps already in the db would break disjointness.
+            if index.conflict(key, booking.start_time,
+                              booking.end_time) is None:
+                index.add(key, booking.start_time, booking.end_time,
+                          booking.ref)
+
+    conflicts = []
+    for booking in sorted(bookings, key=lambda b: b.start_time):
+        clashes = [(key, index.conflict(key, booking.start_time,
+                                        booking.end_time))
+                   for key in booking_keys(booking)]
+        clashes = [(key, ref) for key, ref in clashes if ref is not None]
+        if clashes:
+            conflicts.extend((booking, key, ref) for key, ref in clashes)
+            continue
+        for key in booking_keys(booking):
+            index.add(key, booking.start_time, booking.end_time, booking.ref)
+    return conflicts
@@ -0,0 +1,879 @@
+import json
+import logging
+import os
+import shutil
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+import unittest
+from collections import namedtuple
+from datetime import date, datetime, timedelta
+
+import babel.dates
+
+# Run against an in-memory SQLite db; EXPLAIN QUERY PLAN stands in for
+# Postgres EXPLAIN when checking that the hot queries hit their indexes.
+os.environ.setdefault('DATABASE_URL', 'sqlite://')
+
+from app import (
+    app, db, jobs, request_timer, Venue, Artist, Show, Genre, venue_genres, venue_facets,
+    venue_shows_query, artist_shows_query, entity_versions, format_datetime,
+    venue_locations, get_snapshot)
+from cache import EntityVersions, PageCache
+from availability import OccupancyIndex
+from facets import FacetIndex
+from geo import GridIndex
+from jobs import JobQueue
+from metrics import Metrics, metric_key
+from flask import Flask, jsonify
+from query_counter import QueryBudgetMixin, QueryCounter
+from compression import CompressionMiddleware, precompress_static
+from profiling import profiled
+from instrumentation import setup_logging
+from routing import ReplicaSet, primary_reads
+from sqlalchemy import create_engine
+from sqlalchemy.exc import SQLAlchemyError
+from werkzeug.test import Client
+from werkzeug.wrappers import Response
+
+
+class FyyurTestCase(QueryBudgetMixin, unittest.TestCase):
+    """This class represents the Fyyur test case"""
+
+    def setUp(self):
+        """Define test variables and initialize app."""
+        app.config['TESTING'] = True
+        app.config['WTF_CSRF_ENABLED'] = False
+        # Run follow-up jobs inline so they see the in-memory db.
+        jobs.workers = 0
+        self.client = app.test_client
+        self.ctx = app.app_context()
+        self.ctx.push()
+        db.create_all()
+        venue_facets.invalidate()
+
+        jazz = Genre(name='Jazz')
+        self.venue = Venue(name='The Musical Hop', city='San Francisco',
+                           state='CA', genres=[jazz])
+        self.artist = Artist(name='The Wild Sax Band', city='San Francisco',
+                             state='CA', genres=[jazz])
+        db.session.add_all([self.venue, self.artist])
+        db.session.flush()
+        now = datetime.now().replace(microsecond=0)
+        self.upcoming = now + timedelta(days=7)
+        db.session.add_all([
+            Show(venue_id=self.venue.id, artist_id=self.artist.id,
+                 start_time=now - timedelta(days=7),
+                 end_time=now - timedelta(days=7, hours=-2)),
+            Show(venue_id=self.venue.id, artist_id=self.artist.id,
+                 start_time=self.upcoming,
+                 end_time=self.upcoming + timedelta(hours=2)),
+        ])
+        db.session.commit()
+
+    def tearDown(self):
+        """Executed after reach test"""
+        db.session.remove()
+        db.drop_all()
+        self.ctx.pop()
+
+    def explain(self, query):
+        statement = query.statement if hasattr(query, 'statement') else query
+        compiled = statement.compile(dialect=db.engine.dialect)
+        params = tuple(compiled.params[name] for name in compiled.positiontup)
+        rows = db.session.connection().execute(
+            'EXPLAIN QUERY PLAN ' + str(compiled), params).fetchall()
+        return ' '.join(str(row[-1]) for row in rows)
+
+    """ Test that the hot queries use their indexes """
+
+    def test_venue_shows_use_index(self):
+        plan = self.explain(venue_shows_query(self.venue.id))
+        self.assertIn('ix_show_venue_id_start_time', plan)
+
+    def test_artist_shows_use_index(self):
+        plan = self.explain(artist_shows_query(self.artist.id))
+        self.assertIn('ix_show_artist_id_start_time', plan)
+
+    def test_area_lookup_uses_index(self):
+        plan = self.explain(Venue.query.filter(
+            Venue.state == 'CA', Venue.city == 'San Francisco'))
+        self.assertIn('ix_venue_state_city', plan)
+
+    def test_genre_filter_uses_index(self):
+        plan = self.explain(Venue.query.join(venue_genres).filter(
+            venue_genres.c.genre_id == 1))
+        self.assertIn('ix_venue_genres_genre_id', plan)
+
+    """ Test the venue page splits past and upcoming shows """
+
+    def test_show_venue(self):
+        response = self.client().get(f'/venues/{self.venue.id}')
+
+        self.assertEqual(200, response.status_code)
+        self.assertIn(b'1 Upcoming Show', response.data)
+        self.assertIn(b'1 Past Show', response.data)
+
+    """ Test listing and detail pages stay within a fixed query budget """
+
+    def test_query_budgets(self):
+        for number in range(5):
+            artist = Artist(name=f'Artist {number}', city='Oakland', state='CA')
+            db.session.add(artist)
+            db.session.flush()
+            start_time = self.upcoming + timedelta(days=number + 1)
+            db.session.add(Show(venue_id=self.venue.id, artist_id=artist.id,
+                                start_time=start_time,
+                                end_time=start_time + timedelta(hours=2)))
+        db.session.commit()
+        venue_id = self.venue.id
+
+        for url, budget in ((f'/venues/{venue_id}', 2), ('/venues', 3),
+                            ('/artists', 3), ('/shows', 1)):
+            with self.assertMaxQueries(db.engine, budget):
+                self.assertEqual(200, self.client().get(url).status_code)
+
+    """ Test that facet filters and counts follow committed writes """
+
+    def test_venue_facets(self):
+        response = self.client().get('/venues?genre=Jazz')
+        self.assertIn(b'The Musical Hop', response.data)
+
+        db.session.add(Venue(name='Park Square', city='New York',
+                             state='NY', seeking_talent=True))
+        db.session.commit()
+
+        filters = {'state': ['NY']}
+        self.assertEqual(1, len(venue_facets.ids(filters)))
+        counts = venue_facets.counts(filters)
+        self.assertEqual(1, counts['seeking_talent']['yes'])
+        self.assertEqual(1, counts['state']['CA'])
+
+        response = self.client().get('/venues?genre=Jazz&state=NY')
+        self.assertNotIn(b'The Musical Hop', response.data)
+
+    """ Test that double-booking a venue is rejected """
+
+    def test_create_show_conflict(self):
+        other = Artist(name='Guns N Petals', city='San Francisco',
+                       state='CA')
+        db.session.add(other)
+        db.session.commit()
+
+        def book(start_time):
+            return self.client().post('/shows/create', data={
+                'venue_id': self.venue.id,
+                'artist_id': other.id,
+                'start_time': start_time.strftime('%Y-%m-%d %H:%M:%S'),
+                'duration': 120,
+            })
+
+        response = book(self.upcoming + timedelta(hours=1))
+        self.assertIn(b'already booked', response.data)
+        self.assertEqual(2, Show.query.count())
+
+        response = book(self.upcoming + timedelta(hours=2))
+        self.assertIn(b'successfully listed', response.data)
+        self.assertEqual(3, Show.query.count())
+
+    """ Test import-shows rejects malformed schedules """
+
+    def import_shows(self, entries):
+        directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, directory)
+        path = os.path.join(directory, 'shows.json')
+        with open(path, 'w') as f:
+            json.dump(entries, f)
+        return app.test_cli_runner().invoke(args=['import-shows', path])
+
+    def test_import_shows(self):
+        start = (self.upcoming + timedelta(days=1)).isoformat()
+        entry = {'venue_id': self.venue.id, 'artist_id': self.artist.id,
+                 'start_time': start}
+        for entries, error in (
+                ({'shows': []}, 'must hold a list'),
+                ([{'venue_id': self.venue.id}], 'entry 1: missing artist_id'),
+                ([dict(entry, duration='90')], 'entry 1: duration'),
+                ([entry, dict(entry, venue_id=[1])], 'entry 2: venue_id'),
+                ([dict(entry, start_time='soon')], 'entry 1: start_time'),
+                ([dict(entry, artist_id=500)], 'entry 1: unknown artist 500')):
+            result = self.import_shows(entries)
+            self.assertEqual(1, result.exit_code, result.output)
+            self.assertIn(error, result.output)
+        self.assertEqual(2, Show.query.count())
+
+        result = self.import_shows([entry])
+        self.assertIn('1 shows imported', result.output)
+        self.assertEqual(3, Show.query.count())
+
+    """ Test the venue calendar follows new shows """
+
+    def test_venue_calendar(self):
+        day = self.upcoming.date().isoformat()
+        response = self.client().get(
+            f'/venues/{self.venue.id}/calendar?from={day}&to={day}')
+        data = response.get_json()
+
+        self.assertEqual(200, response.status_code)
+        self.assertEqual(1, len(data['days']))
+        self.assertEqual(1, len(data['days'][0]['busy']))
+
+        db.session.add(Show(venue_id=self.venue.id, artist_id=self.artist.id,
+                            start_time=self.upcoming + timedelta(hours=5),
+                            end_time=self.upcoming + timedelta(hours=6)))
+        db.session.commit()
+        data = self.client().get(
+            f'/venues/{self.venue.id}/calendar?from={day}&to={day}').get_json()
+        busy = data['days'][0]['busy']
+        self.assertTrue(len(busy) >= 1)
+        self.assertNotEqual(busy, response.get_json()['days'][0]['busy'])
+
+    """ Test cached show lists follow commits and the clock """
+
+    def test_fragment_invalidation(self):
+        venue_id = self.venue.id
+        self.assertIn(b'1 Upcoming Show',
+                      self.client().get(f'/venues/{venue_id}').data)
+
+        version = entity_versions.get('venue', venue_id)
+        db.session.add(Show(venue_id=venue_id, artist_id=self.artist.id,
+                            start_time=self.upcoming + timedelta(days=1),
+                            end_time=self.upcoming + timedelta(days=1, hours=2)))
+        db.session.flush()
+        self.assertEqual(version, entity_versions.get('venue', venue_id))
+        db.session.commit()
+        self.assertNotEqual(version, entity_versions.get('venue', venue_id))
+        self.assertIn(b'2 Upcoming Shows',
+                      self.client().get(f'/venues/{venue_id}').data)
+
+        # Moves the shows into the past without touching the versions, as
+        # the passing of time would.
+        db.session.execute(Show.__table__.update().values(
+            start_time=datetime.now() - timedelta(days=1)))
+        db.session.commit()
+        response = self.client().get(f'/venues/{venue_id}')
+        self.assertIn(b'0 Upcoming Shows', response.data)
+        self.assertIn(b'3 Past Shows', response.data)
+
+    """ Test renaming an artist or venue re-renders the other's page """
+
+    def test_fragment_follows_related_renames(self):
+        venue_id, artist_id = self.venue.id, self.artist.id
+        self.client().get(f'/venues/{venue_id}')
+        self.client().get(f'/artists/{artist_id}')
+
+        Artist.query.get(artist_id).name = 'The Renamed Band'
+        db.session.commit()
+        self.assertIn(b'The Renamed Band',
+                      self.client().get(f'/venues/{venue_id}').data)
+        self.client().get(f'/artists/{artist_id}')
+
+        Venue.query.get(venue_id).name = 'The Renamed Hall'
+        db.session.commit()
+        self.assertIn(b'The Renamed Hall',
+                      self.client().get(f'/artists/{artist_id}').data)
+
+    """ Test the edit form is filled from the cached venue snapshot """
+
+    def test_edit_venue_form_uses_snapshot(self):
+        venue_id = self.venue.id
+        self.client().get(f'/venues/{venue_id}')
+        with QueryCounter(db.engine) as counter:
+            response = self.client().get(f'/venues/{venue_id}/edit')
+
+        self.assertEqual(200, response.status_code)
+        self.assertIn(b'value="San Francisco"', response.data)
+        # Only the version check; the row comes from the snapshot.
+        self.assertEqual(1, counter.count)
+
+    def test_edit_venue_form_follows_other_workers(self):
+        venue_id = self.venue.id
+        self.client().get(f'/venues/{venue_id}/edit')
+        # An edit committed by another process: this one's entity versions
+        # never see it.
+        db.session.execute(Venue.__table__.update().values(
+            city='Oakland', version_id=2))
+        db.session.commit()
+
+        response = self.client().get(f'/venues/{venue_id}/edit')
+        self.assertIn(b'value="Oakland"', response.data)
+        self.assertIn(b'name="version" type="hidden" value="2"', response.data)
+        self.assertEqual(302, self.edit_venue(
+            venue_id, city='Berkeley', version='2').status_code)
+        self.assertEqual('Berkeley', Venue.query.get(venue_id).city)
+
+    """ Test venue edits write only changes and reject stale forms """
+
+    def edit_venue(self, venue_id, **changes):
+        data = {'name': 'The Musical Hop', 'city': 'San Francisco',
+                'state': 'CA', 'address': '1015 Folsom Street',
+                'genres': ['Jazz'],
+                'facebook_link': 'https://www.facebook.com/TheMusicalHop',
+                'version': '1'}
+        data.update(changes)
+        return self.client().post(f'/venues/{venue_id}/edit', data=data)
+
+    def test_edit_venue(self):
+        venue_id = self.venue.id
+        self.assertEqual(302, self.edit_venue(venue_id).status_code)
+        self.assertEqual(2, Venue.query.get(venue_id).version_id)
+
+        # Resubmitting the same values is a no-op and keeps the version.
+        self.edit_venue(venue_id, version='2')
+        self.assertEqual(2, Venue.query.get(venue_id).version_id)
+
+        self.edit_venue(venue_id, version='2', genres=['Jazz', 'Folk'])
+        venue = Venue.query.get(venue_id)
+        self.assertEqual(3, venue.version_id)
+        self.assertEqual(['Folk', 'Jazz'],
+                         sorted(genre.name for genre in venue.genres))
+
+        response = self.edit_venue(venue_id, version='2', city='Oakland')
+        self.assertEqual(200, response.status_code)
+        self.assertEqual('San Francisco', Venue.query.get(venue_id).city)
+
+    """ Test creating a venue and polling its follow-up job """
+
+    def test_create_venue(self):
+        response = self.client().post('/venues/create', data={
+            'name': 'Park Square Live Music & Coffee', 'city': 'San Francisco',
+            'state': 'CA', 'address': '34 Whiskey Moore Ave',
+            'genres': ['Jazz', 'Folk'],
+            'facebook_link': 'https://www.facebook.com/ParkSquareLiveMusicAndCoffee'})
+        self.assertEqual(200, response.status_code)
+        venue = Venue.query.filter_by(name='Park Square Live Music & Coffee').one()
+        self.assertEqual(['Folk', 'Jazz'],
+                         sorted(genre.name for genre in venue.genres))
+
+        job_id = response.headers['X-Job-Id']
+        job = self.client().get('/jobs/' + job_id)
+        self.assertEqual('succeeded', job.get_json()['status'])
+        self.assertEqual(404, self.client().get('/jobs/unknown').status_code)
+
+        # Another worker's queue answers the poll from the shared table.
+        other_worker = JobQueue(app, workers=0, store=jobs.store)
+        self.assertEqual('succeeded', other_worker.get(job_id)['status'])
+
+    """ Test requests report their timing breakdown """
+
+    def test_request_timing(self):
+        threshold = request_timer.slow_query_seconds
+        request_timer.slow_query_seconds = 0
+        try:
+            with self.assertLogs('fyyur.sql', 'WARNING') as slow:
+                response = self.client().get(f'/venues/{self.venue.id}/calendar')
+        finally:
+            request_timer.slow_query_seconds = threshold
+        phases = [part.split(';')[0]
+                  for part in response.headers['Server-Timing'].split(', ')]
+
+        self.assertEqual(['db', 'render', 'serialize', 'app', 'total'], phases)
+        self.assertIn('slow_query', slow.output[0])
+
+    """ Test failed statements leave no start time behind """
+
+    def test_failed_query_timing(self):
+        with db.engine.connect() as connection:
+            for _ in range(3):
+                with self.assertRaises(SQLAlchemyError):
+                    connection.execute('SELECT * FROM no_such_table')
+            connection.execute('SELECT 1')
+            self.assertEqual({}, connection.info.get('query_started', {}))
+
+    """ Test /metrics exposes request latency and cache counters """
+
+    def test_metrics(self):
+        self.client().get(f'/venues/{self.venue.id}')
+        response = self.client().get('/metrics')
+        body = response.get_data(as_text=True)
+
+        self.assertEqual(200, response.status_code)
+        self.assertIn('# TYPE http_request_duration_seconds histogram', body)
+        self.assertIn('http_request_duration_seconds_count{endpoint="show_venue"'
+                      ',method="GET",status="200"}', body)
+        self.assertIn('cache_hits_total{cache="fragments"}', body)
+        self.assertIn('http_requests_in_flight 1', body)
+
+    """ Test requests carrying the profile token are profiled """
+
+    def test_profiler(self):
+        directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, directory)
+        self.assertIs(app.wsgi_app, profiled(app.wsgi_app, directory))
+        client = Client(profiled(app.wsgi_app, directory, token='secret',
+                                 mode='cprofile', max_bytes=10 ** 6),
+                        Response)
+
+        client.get('/venues')
+        self.assertEqual([], os.listdir(directory))
+        response = client.get('/venues', headers={'X-Profile': 'secret'},
+                              buffered=True)
+
+        self.assertEqual(200, response.status_code)
+        self.assertEqual(1, len(os.listdir(directory)))
+
+        response = client.get('/venues', environ_base={
+            'HTTP_X_PROFILE': '\xe9'}, buffered=True)
+        self.assertEqual(200, response.status_code)
+        self.assertEqual(1, len(os.listdir(directory)))
+
+    """ Test GET reads go to the replica and writes to the primary """
+
+    def test_replica_routing(self):
+        venue_id = self.venue.id
+        directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, directory)
+        replica = create_engine(
+            'sqlite:///' + os.path.join(directory, 'replica.db'))
+        self.addCleanup(replica.dispose)
+        db.Model.metadata.create_all(replica)
+        replica.execute(Genre.__table__.insert(), name='Blues')
+        replicas = ReplicaSet([(replica, 1)], check_interval=0)
+        self.addCleanup(app.extensions.__setitem__, 'replicas',
+                        app.extensions['replicas'])
+        app.extensions['replicas'] = replicas
+
+        def genres(method, write=False):
+            db.session.remove()
+            with app.test_request_context(method=method):
+                if write:
+                    db.session.add(Genre(name='Rock'))
+                    db.session.flush()
+                return sorted(genre.name for genre in Genre.query)
+
+        self.assertEqual(['Blues'], genres('GET'))
+        self.assertEqual(['Jazz'], genres('POST'))
+        db.session.remove()
+        with app.test_request_context(method='GET'):
+            with primary_reads():
+                self.assertEqual(['Jazz'], [g.name for g in Genre.query])
+            self.assertEqual(['Blues'], [g.name for g in Genre.query])
+        # Caches outliving the request are filled from the primary.
+        venue_facets.invalidate()
+        self.client().get('/venues')
+        self.assertEqual(1, len(venue_facets.ids({'genre': ['Jazz']})))
+        db.session.remove()
+        with app.test_request_context(method='GET'):
+            self.assertEqual('The Musical Hop', get_snapshot(
+                Venue, 'venue', venue_id)['name'])
+        self.assertEqual(['Jazz', 'Rock'], genres('GET', write=True))
+        replicas.mark_down(replica)
+        self.assertEqual(['Jazz'], genres('GET'))
+        replicas.check()
+        self.assertEqual(['Blues'], genres('GET'))
+
+        response = self.client().post('/venues/create', data={
+            'name': 'The Dueling Pianos Bar', 'city': 'New York',
+            'state': 'NY', 'address': '335 Delancey Street',
+            'genres': ['Jazz'],
+            'facebook_link': 'https://www.facebook.com/theduelingpianos'})
+        self.assertIn('db_primary=1', ' '.join(
+            response.headers.getlist('Set-Cookie')))
+
+    """ Test proximity search pages """
+
+    def test_nearby_venues(self):
+        venue_locations.invalidate()
+        self.venue.latitude, self.venue.longitude = 37.7749, -122.4194
+        db.session.add(Venue(name='Park Square', city='San Jose', state='CA',
+                             latitude=37.3382, longitude=-121.8863))
+        db.session.commit()
+
+        response = self.client().get(
+            '/venues/nearby?lat=37.80&lng=-122.27&radius=25')
+        self.assertEqual(200, response.status_code)
+        self.assertIn(b'The Musical Hop', response.data)
+        self.assertNotIn(b'Park Square', response.data)
+
+        response = self.client().get(
+            '/venues/nearby?lat=37.80&lng=-122.27&radius=60')
+        self.assertIn(b'Park Square', response.data)
+        for query in ('lat=37.80', 'lat=nan&lng=-122.27',
+                      'lat=37.80&lng=inf', 'lat=37.80&lng=-122.27&radius=nan',
+                      'lat=37.80&lng=-122.27&radius=100000',
+                      'lat=91&lng=0', 'lat=37.80&lng=-122.27&radius=-1'):
+            self.assertEqual(400, self.client().get(
+                '/venues/nearby?' + query).status_code)
+
+    def test_nearby_artists(self):
+        self.artist.latitude, self.artist.longitude = 37.7749, -122.4194
+        db.session.commit()
+
+        response = self.client().get(
+            '/artists/nearby?lat=37.78&lng=-122.42&radius=5')
+        self.assertEqual(200, response.status_code)
+        self.assertIn(b'The Wild Sax Band', response.data)
+
+    """ Test the datetime filter keeps babel's named formats """
+
+    def test_format_datetime(self):
+        value = datetime(2035, 4, 1, 20, 30)
+        for format in ('short', 'long'):
+            self.assertEqual(
+                babel.dates.format_datetime(value, format, locale='en_US'),
+                format_datetime(value, format, 'en_US'))
+        self.assertEqual('Sunday April, 1, 2035 at 8:30PM',
+                         format_datetime('2035-04-01 20:30:00', 'full', 'en_US'))
+        self.assertEqual('2035-04', format_datetime(value, 'yyyy-MM', 'en_US'))
+
+    def test_404_show_venue_not_found(self):
+        response = self.client().get('/venues/50000')
+
+        self.assertEqual(404, response.status_code)
+
+
+Place = namedtuple('Place', ['id', 'state'])
+
+
+class FacetIndexTestCase(unittest.TestCase):
+    """Tests FacetIndex loading and copy-on-write updates"""
+
+    def setUp(self):
+        self.index = FacetIndex({'state': lambda place: [place.state]},
+                                ttl=60)
+        self.loads = 0
+
+    def loader(self, places):
+        def load():
+            self.loads += 1
+            return places
+        return load
+
+    def test_readers_keep_their_view(self):
+        self.index.ensure_loaded(self.loader([Place(1, 'CA'), Place(2, 'NY')]))
+        view = self.index.view()
+        self.index.set(3, {'state': frozenset(['TX'])})
+        self.index.remove(1)
+
+        self.assertEqual(['CA', 'NY'], sorted(view[1]['state']))
+        self.assertEqual(0b110, self.index.match({}, view=view))
+        self.assertEqual({'NY': 1, 'TX': 1}, self.index.counts({})['state'])
+
+    def test_stale_index_rebuilds_in_the_background(self):
+        self.index.ensure_loaded(self.loader([Place(1, 'CA')]))
+        self.index.ensure_loaded(self.loader([]))
+        self.assertEqual(1, self.loads)
+
+        self.index.loaded_at -= 120
+        with app.app_context():
+            self.index.ensure_loaded(self.loader([Place(2, 'NY')]))
+            # Requests keep reading the old copy meanwhile, and only one
+            # rebuild runs.
+            self.index.ensure_loaded(self.loader([]))
+        deadline = time.time() + 5
+        while self.index.refreshing and time.time() < deadline:
+            time.sleep(0.01)
+
+        self.assertEqual(2, self.loads)
+        self.assertEqual([2], self.index.ids({}))
+
+
+class GridIndexTestCase(unittest.TestCase):
+    """Tests radius and nearest queries on the in-process grid"""
+
+    def setUp(self):
+        self.grid = GridIndex(lambda point: point, cell_degrees=0.25)
+        points = {
+            1: (37.7749, -122.4194),   # San Francisco
+            2: (37.8044, -122.2712),   # Oakland, ~8.3 mi
+            3: (37.3382, -121.8863),   # San Jose, ~42 mi
+            4: (-17.0, 179.95),        # Fiji, east of the antimeridian
+            5: (-17.0, -179.95),       # and just west of it
+        }
+        for id, point in points.items():
+            self.grid.set(id, self.grid.values_of(point))
+
+    def test_within(self):
+        found = self.grid.within(37.7749, -122.4194, 10)
+        self.assertEqual([1, 2], [id for _, id in found])
+        self.assertAlmostEqual(8.34, found[1][0], places=2)
+        self.assertEqual([1], [id for _, id in self.grid.within(
+            37.7749, -122.4194, 10, limit=1)])
+        self.assertEqual([1, 2, 3], [id for _, id in self.grid.within(
+            37.7749, -122.4194, 50)])
+
+    def test_within_across_the_antimeridian(self):
+        for lng in (179.99, -179.99, 539.99):
+            self.assertEqual([4, 5], sorted(
+                id for _, id in self.grid.within(-17.0, lng, 10)))
+
+    def test_within_the_whole_globe(self):
+        started = time.perf_counter()
+        found = self.grid.within(0, 0, 1e9)
+        self.assertEqual([1, 2, 3, 4, 5], sorted(id for _, id in found))
+        self.assertLess(time.perf_counter() - started, 0.5)
+
+    def test_nearest(self):
+        self.assertEqual([2, 1, 3], [id for _, id in self.grid.nearest(
+            37.8044, -122.2712, k=3)])
+
+
+class OccupancyIndexTestCase(unittest.TestCase):
+    """Tests calendar windows and eviction"""
+
+    def setUp(self):
+        self.index = OccupancyIndex(slot_minutes=60, window_days=7,
+                                    max_resources=2)
+        self.loads = []
+
+    def loader(self, *shows):
+        def load(first_day, last_day):
+            self.loads.append((first_day, last_day))
+            return list(shows)
+        return load
+
+    def test_loads_a_window(self):
+        day = date(2035, 4, 2)
+        show = (1, datetime(2035, 4, 3, 20), datetime(2035, 4, 3, 22))
+        resource = self.index.ensure_resource(
+            ('venue', 1), self.loader(show), day, day)
+        self.assertEqual([(day, date(2035, 4, 8))], self.loads)
+        self.assertEqual([['20:00', '22:00']], self.index.calendar(
+            resource, date(2035, 4, 3), date(2035, 4, 3))[0]['busy'])
+
+        # Inside the window: served from memory. Past it: reloaded.
+        self.index.ensure_resource(('venue', 1), self.loader(),
+                                   date(2035, 4, 5), date(2035, 4, 8))
+        self.assertEqual(1, len(self.loads))
+        self.index.ensure_resource(('venue', 1), self.loader(),
+                                   date(2035, 4, 5), date(2035, 4, 9))
+        self.assertEqual((date(2035, 4, 5), date(2035, 4, 11)), self.loads[-1])
+
+        # Shows committed outside the window are not kept.
+        self.index.set(2, (1, 5, datetime(2035, 6, 1, 20),
+                           datetime(2035, 6, 1, 22)))
+        self.assertNotIn(2, self.index.show_keys)
+
+    def test_evicts_least_recently_used(self):
+        show = (1, datetime(2035, 4, 3, 20), datetime(2035, 4, 3, 22))
+        day = date(2035, 4, 2)
+        for key in (('venue', 1), ('artist', 1), ('venue', 1),
+                    ('venue', 2)):
+            self.index.ensure_resource(key, self.loader(show), day)
+
+        self.assertEqual([('venue', 1), ('venue', 2)],
+                         list(self.index.resources))
+        self.assertEqual(set([('venue', 1), ('venue', 2)]),
+                         self.index.show_keys[1])
+        self.assertIsNone(self.index.ensure_resource(
+            ('venue', 3), lambda first_day, last_day: None))
+
+
+class MetricsTestCase(unittest.TestCase):
+    """Tests Metrics stays bounded under threads and recycled workers"""
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.directory)
+        self.app = Flask(__name__)
+        self.app.config['METRICS_DIR'] = self.directory
+        self.app.config['METRICS_FLUSH_SECONDS'] = 3600
+
+        @self.app.route('/')
+        def index():
+            return 'ok'
+
+        self.metrics = Metrics(self.app)
+
+    def test_thread_shards_are_folded(self):
+        client = self.app.test_client()
+        threads = [threading.Thread(target=client.get, args=('/',))
+                   for _ in range(50)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        self.assertEqual(1, len(self.metrics._shards))
+        counts = self.metrics.snapshot()['histograms'][metric_key(
+            'http_request_duration_seconds', [('endpoint', 'index'),
+                                              ('method', 'GET'),
+                                              ('status', '200')])]
+        self.assertEqual(50, sum(counts[:-1]))
+
+    def test_exited_workers_are_merged(self):
+        exited = subprocess.Popen([sys.executable, '-c', 'pass'])
+        exited.wait()
+        with open(os.path.join(self.directory,
+                               'metrics-{}.json'.format(exited.pid)), 'w') as f:
+            json.dump({'histograms': {},
+                       'counters': {metric_key('jobs_total'): 5},
+                       'gauges': {metric_key('http_requests_in_flight'): 3}}, f)
+
+        for _ in range(2):
+            collected = self.metrics.collect()
+            self.assertEqual(5, collected['counters'][metric_key('jobs_total')])
+            self.assertEqual(0, collected['gauges'][metric_key(
+                'http_requests_in_flight')])
+        self.assertEqual(['metrics-{}.json'.format(os.getpid()),
+                          'metrics-exited.json'], sorted(
+            name for name in os.listdir(self.directory)
+            if name.endswith('.json')))
+
+
+class LoggingTestCase(unittest.TestCase):
+    """Tests a worker forked after setup_logging still writes its logs"""
+
+    @unittest.skipUnless(hasattr(os, 'fork'), 'needs fork()')
+    def test_forked_worker_logs(self):
+        directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, directory)
+        path = os.path.join(directory, 'app.log')
+        handler = logging.FileHandler(path)
+        self.addCleanup(handler.close)
+        logging_app = Flask('logging_test')
+        listener = setup_logging(logging_app, handler, loggers=())
+
+        pid = os.fork()
+        if pid == 0:
+            logging_app.logger.info('from the worker')
+            listener.stop()
+            os._exit(0)
+        os.waitpid(pid, 0)
+
+        with open(path) as f:
+            self.assertIn('from the worker', f.read())
+
+
+class PageCacheTestCase(unittest.TestCase):
+    """Tests PageCache against a small app"""
+
+    def setUp(self):
+        page_app = Flask(__name__)
+        page_app.config.update(PAGE_CACHE_ENABLED=True, PAGE_CACHE_TTL=60,
+                               PAGE_CACHE_MAX_BYTES=10 ** 6,
+                               PAGE_CACHE_ENDPOINTS=('index', 'data'))
+        self.rendered = 0
+
+        @page_app.route('/')
+        def index():
+            self.rendered += 1
+            return '<p>{}</p>'.format(self.rendered)
+
+        @page_app.route('/data')
+        def data():
+            self.rendered += 1
+            return jsonify(rendered=self.rendered)
+
+        @page_app.route('/metrics')
+        def metrics():
+            self.rendered += 1
+            return '<p>{}</p>'.format(self.rendered)
+
+        self.versions = EntityVersions()
+        PageCache(self.versions, page_app)
+        self.client = page_app.test_client()
+
+    def test_caches_html_pages(self):
+        first = self.client.get('/')
+        second = self.client.get('/')
+        self.assertEqual(first.data, second.data)
+        self.assertEqual('HIT', second.headers['X-Page-Cache'])
+
+        self.versions.bump('venue', 1)
+        self.assertNotEqual(first.data, self.client.get('/').data)
+
+    def test_skips_json_and_unlisted_endpoints(self):
+        for url in ('/data', '/metrics'):
+            first = self.client.get(url)
+            second = self.client.get(url)
+            self.assertNotIn('X-Page-Cache', second.headers)
+            self.assertNotEqual(first.data, second.data)
+
+
+class CompressionTestCase(unittest.TestCase):
+    """Tests CompressionMiddleware against a plain WSGI app"""
+
+    def setUp(self):
+        self.static = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.static)
+        with open(os.path.join(self.static, 'site.css'), 'w') as f:
+            f.write('body { color: black; }\n' * 100)
+        precompress_static(self.static)
+
+        def json_app(environ, start_response):
+            size = int(environ.get('QUERY_STRING') or 1000)
+            start_response('200 OK', [('Content-Type', 'application/json'),
+                                      ('ETag', '"v1"')])
+            return [b'[' + b'1,' * (size // 2) + b'1]']
+
+        self.client = Client(CompressionMiddleware(
+            json_app, minimum_size=500, static_folder=self.static), Response)
+
+    """ Test Accept-Encoding negotiation """
+
+    def test_negotiation(self):
+        response = self.client.get('/', headers={'Accept-Encoding': 'gzip'})
+        self.assertEqual('gzip', response.headers['Content-Encoding'])
+        self.assertEqual('Accept-Encoding', response.headers['Vary'])
+        self.assertEqual('W/"v1"', response.headers['ETag'])
+
+        for header in ('identity', 'gzip;q=0', ''):
+            response = self.client.get(
+                '/', headers={'Accept-Encoding': header})
+            self.assertNotIn('Content-Encoding', response.headers)
+            self.assertEqual('"v1"', response.headers['ETag'])
+
+    """ Test small responses are sent as they are """
+
+    def test_minimum_size(self):
+        response = self.client.get('/?100',
+                                   headers={'Accept-Encoding': 'gzip'})
+        self.assertNotIn('Content-Encoding', response.headers)
+        self.assertTrue(response.data.startswith(b'[1,'))
+
+    """ Test static files are served precompressed and immutable """
+
+    def test_precompressed_static(self):
+        with open(os.path.join(self.static, 'manifest.json')) as f:
+            fingerprinted = json.load(f)['site.css']
+        response = self.client.get('/static/' + fingerprinted,
+                                   headers={'Accept-Encoding': 'gzip'})
+
+        self.assertEqual(200, response.status_code)
+        self.assertEqual('gzip', response.headers['Content-Encoding'])
+        self.assertIn('immutable', response.headers['Cache-Control'])
+        with open(os.path.join(self.static, fingerprinted + '.gz'),
+                  'rb') as f:
+            self.assertEqual(f.read(), response.data)
+
+        response = self.client.get('/static/site.css',
+                                   headers={'Accept-Encoding': 'gzip'})
+        self.assertEqual('gzip', response.headers['Content-Encoding'])
+        self.assertNotIn('Cache-Control', response.headers)
+
+    """ Test precompressed files outside the static folder are not served """
+
+    def test_precompressed_outside_static(self):
+        outside = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, outside)
+        with open(os.path.join(outside, 'leak.txt.gz'), 'wb') as f:
+            f.write(b'secret')
+
+        for path in ('/static/' + outside + '/leak.txt',
+                     '/static/../' + os.path.basename(outside) + '/leak.txt'):
+            response = self.client.get(path,
+                                       headers={'Accept-Encoding': 'gzip'})
+            self.assertNotEqual(b'secret', response.data)
+
+
+
+class SharedModulesTestCase(unittest.TestCase):
+    """Tests the copies of modules shared with other projects match"""
+
+    ROOT = os.path.join(os.path.dirname(os.path.abspath(__file__)),
+                        '..', '..', '..')
+
+    @unittest.skipUnless(os.path.exists(os.path.join(ROOT, 'sync_shared.py')),
+                         'outside the full repo')
+    def test_copies_match(self):
+        result = subprocess.run(
+            [sys.executable, 'sync_shared.py', '--check'], cwd=self.ROOT,
+            stdout=subprocess.PIPE, universal_newlines=True)
+        self.assertEqual(0, result.returncode, result.stdout)
+
+# Make the tests conveniently executable
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,138 @@
+'''
+Benchmark of the serve.py worker models on the trivia endpoints.
+
+    $ python bench_workers.py [--seconds 10] [--concurrency 32]
+
+Starts the app under gunicorn once per worker class (sync, gthread,
+gevent), with the same number of processes, and has `concurrency` client
+threads request a mix of GET /categories, /questions?page=N and
+/categories/<id>/questions for `seconds`. Prints throughput, latency
+percentiles, errors and the workers' total memory as reported by
+serve.py --stats. Needs the trivia database (see README) and gunicorn and
+gevent installed.
+'''
+
+import argparse
+import json
+import os
+import random
+import shutil
+import signal
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from urllib.error import URLError
+from urllib.request import urlopen
+
+from serve import WORKER_CLASSES, read_stats
+
+TARGET = 'flaskr:create_app()'
+
+
+def paths(rng):
+    choice = rng.random()
+    if choice < 0.4:
+        return '/questions?page={}'.format(rng.randint(1, 2))
+    if choice < 0.7:
+        return '/categories/{}/questions'.format(rng.randint(1, 6))
+    return '/categories'
+
+
+def wait_until_up(base, timeout=30):
+    deadline = time.time() + timeout
+    while time.time() < deadline:
+        try:
+            urlopen(base + '/categories', timeout=1).read()
+            return
+        except (URLError, OSError):
+            time.sleep(0.2)
+    raise RuntimeError('server did not start on ' + base)
+
+
+def load(base, seconds, concurrency):
+    latencies, errors = [], [0]
+    lock = threading.Lock()
+    deadline = time.time() + seconds
+
+    def client(seed):
+        rng = random.Random(seed)
+        timings, failed = [], 0
+        while time.time() < deadline:
+            started = time.perf_counter()
+            try:
+                urlopen(base + paths(rng), timeout=10).read()
+            except (URLError, OSError):
+                failed += 1
+                continue
+            timings.append(time.perf_counter() - started)
+        with lock:
+            latencies.extend(timings)
+            errors[0] += failed
+
+    clients = [threading.Thread(target=client, args=(i,))
+               for i in range(concurrency)]
+    for thread in clients:
+        thread.start()
+    for thread in clients:
+        thread.join()
+    return sorted(latencies), errors[0]
+
+
+def percentile(values, fraction):
+    if not values:
+        return float('nan')
+    return values[min(int(len(values) * fraction), len(values) - 1)]
+
+
+def run(worker_class, args, port):
+    stats_dir = tempfile.mkdtemp()
+    base = 'http://127.0.0.1:{}'.format(port)
+    server = subprocess.Popen([
+        sys.executable, 'serve.py', TARGET, '--worker-class', worker_class,
+        '--workers', str(args.workers), '--bind', '127.0.0.1:{}'.format(port),
+        '--stats-dir', stats_dir])
+    try:
+        wait_until_up(base)
+        latencies, errors = load(base, args.seconds, args.concurrency)
+        memory = sum(worker['memory_kb'].get('pss', worker['memory_kb']['rss'])
+                     for worker in read_stats(stats_dir))
+    finally:
+        server.send_signal(signal.SIGTERM)
+        server.wait()
+        shutil.rmtree(stats_dir)
+    return {
+        'worker_class': worker_class,
+        'requests_per_second': len(latencies) / args.seconds,
+        'p50_ms': percentile(latencies, 0.5) * 1000,
+        'p99_ms': percentile(latencies, 0.99) * 1000,
+        'errors': errors,
+        'memory_mb': memory / 1024.0,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split('\n\n')[0])
+    parser.add_argument('--seconds', type=float, default=10)
+    parser.add_argument('--concurrency', type=int, default=32)
+    parser.add_argument('--workers', type=int, default=os.cpu_count() or 2)
+    parser.add_argument('--port', type=int, default=8765)
+    parser.add_argument('--json', action='store_true')
+    args = parser.parse_args()
+
+    results = [run(worker_class, args, args.port + number)
+               for number, worker_class in enumerate(WORKER_CLASSES)]
+    if args.json:
+        print(json.dumps(results, indent=2))
+        return
+    print('{:>8} {:>10} {:>9} {:>9} {:>7} {:>10}'.format(
+        'class', 'req/s', 'p50 (ms)', 'p99 (ms)', 'errors', 'pss (MB)'))
+    for result in results:
+        print('{worker_class:>8} {requests_per_second:>10.0f} '
+              '{p50_ms:>9.1f} {p99_ms:>9.1f} {errors:>7} '
+              '{memory_mb:>10.1f}'.format(**result))
+
+
+if __name__ == '__main__':
+    main()
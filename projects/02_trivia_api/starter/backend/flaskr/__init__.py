@@ -1,11 +1,12 @@
 import os
 from flask import Flask, request, abort, jsonify
-from flask_sqlalchemy import SQLAlchemy
 from flask_cors import CORS
 import random
-import autopep8
 
-from models import setup_db, Question, Category
+from models import setup_db, create_tables, db, Question, Category
+from compression import CompressionMiddleware
+from metrics import Metrics
+from profiling import profiled
 
 QUESTIONS_PER_PAGE = 10
 
@@ -15,6 +16,38 @@ def create_app(test_config=None):
     app = Flask(__name__)
     setup_db(app)
 
+    '''
+    `flask create-tables` creates missing tables; starting the app
+    does not touch the database
+    '''
+    @app.cli.command('create-tables')
+    def create_tables_command():
+        create_tables(app)
+
+    '''
+    Prometheus metrics at /metrics
+    '''
+    Metrics(app, engine=db.get_engine(app))
+
+    '''
+    Opt-in request profiling; a no-op unless PROFILE_DIR and a token
+    or sample rate are set in the environment.
+    '''
+    app.wsgi_app = profiled(
+        app.wsgi_app,
+        directory=os.environ.get('PROFILE_DIR'),
+        sample_rate=float(os.environ.get('PROFILE_SAMPLE_RATE', 0)),
+        token=os.environ.get('PROFILE_TOKEN'),
+        mode=os.environ.get('PROFILE_MODE', 'sample'))
+
+    '''
+    gzip (or brotli, when installed) for responses of at least
+    COMPRESS_MIN_SIZE bytes, negotiated through Accept-Encoding
+    '''
+    app.wsgi_app = CompressionMiddleware(
+        app.wsgi_app,
+        minimum_size=int(os.environ.get('COMPRESS_MIN_SIZE', 500)))
+
     '''
     Initializing CORS with the app
     '''
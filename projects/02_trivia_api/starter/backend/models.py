@@ -1,23 +1,38 @@
 import os
 from sqlalchemy import Column, String, Integer, create_engine
-from flask_sqlalchemy import SQLAlchemy
 import json
 
+from routing import RoutingSQLAlchemy, parse_replicas
+
 database_name = "trivia"
-database_path = "postgres://{}/{}".format('localhost:5432', database_name)
+database_path = os.environ.get(
+    'DATABASE_URL', "postgres://{}/{}".format('localhost:5432', database_name))
+# Whitespace-separated replica URIs, each optionally "<weight>*uri".
+replica_paths = parse_replicas(os.environ.get('DATABASE_REPLICA_URLS'))
 
-db = SQLAlchemy()
+db = RoutingSQLAlchemy()
 
 '''
 setup_db(app)
     binds a flask application and a SQLAlchemy service
+    GET requests read from `replicas` when given (see routing.py)
+    no connection is made here, so creating the app stays fast; the
+    schema comes from trivia.psql or `flask create-tables`
 '''
-def setup_db(app, database_path=database_path):
+def setup_db(app, database_path=database_path, replicas=replica_paths):
     app.config["SQLALCHEMY_DATABASE_URI"] = database_path
     app.config["SQLALCHEMY_TRACK_MODIFICATIONS"] = False
+    app.config["SQLALCHEMY_REPLICAS"] = replicas
     db.app = app
     db.init_app(app)
-    db.create_all()
+
+'''
+create_tables(app)
+    creates any missing tables
+'''
+def create_tables(app):
+    with app.app_context():
+        db.create_all()
 
 '''
 Question
@@ -0,0 +1,223 @@
+# Shared module, copied into several projects. The original is in
+# projects/01_fyyur/starter_code/; edit it there and run
+# `python sync_shared.py` at the repo root to update the copies.
+#----------------------------------------------------------------------------#
+# Read-replica routing for Flask-SQLAlchemy.
+#
+#   db = RoutingSQLAlchemy(app)
+#
+# SQLALCHEMY_REPLICAS lists replica URIs, or (URI, weight) pairs. Reads made
+# while handling a GET or HEAD request go to a replica chosen by weight among
+# the healthy ones; flushes, reads in any other request, and work outside a
+# request (CLI commands, jobs) use SQLALCHEMY_DATABASE_URI. A session keeps
+# the replica it first picked, so one page never mixes two replicas' lag.
+#
+# Read-your-writes: a session that has flushed reads from the primary until
+# it is closed, and a request that committed sets a cookie for
+# REPLICA_STICKY_SECONDS so the redirect after a POST reads the primary too.
+# A GET handler that writes can call use_primary() before its first query;
+# code filling a cache that outlives the request reads inside primary_reads()
+# so no replica's lag is kept around.
+#
+# Replicas are pinged every SQLALCHEMY_REPLICA_CHECK_SECONDS and skipped
+# while they fail, or as soon as a query on them loses its connection. With
+# no healthy replica, reads go to the primary. Without SQLALCHEMY_REPLICAS
+# this behaves exactly like SQLAlchemy.
+#----------------------------------------------------------------------------#
+
+import logging
+import os
+import random
+import threading
+import time
+from contextlib import contextmanager
+
+from flask import g, has_request_context, request
+from flask_sqlalchemy import SQLAlchemy, SignallingSession
+from sqlalchemy import create_engine, event, orm
+from sqlalchemy.exc import SQLAlchemyError
+
+log = logging.getLogger(__name__)
+
+READ_METHODS = ('GET', 'HEAD')
+REPLICA = 'routing_replica'
+WROTE = 'routing_wrote'
+
+
+def parse_replicas(value):
+    '''
+    Replicas from an environment variable: whitespace-separated URIs, each
+    optionally prefixed with "<weight>*".
+    '''
+    replicas = []
+    for item in (value or '').split():
+        weight, star, uri = item.partition('*')
+        if star and weight.isdigit():
+            replicas.append((uri, int(weight)))
+        else:
+            replicas.append((item, 1))
+    return replicas
+
+
+class ReplicaSet(object):
+    '''
+    Weighted choice over replica engines, skipping unhealthy ones.
+    '''
+
+    def __init__(self, engines, check_interval=10):
+        self.engines = [engine for engine, _ in engines]
+        self.weights = dict((engine, weight) for engine, weight in engines)
+        self.check_interval = check_interval
+        self.healthy = list(self.engines)
+        self._checker_pid = None
+        self._lock = threading.Lock()
+        for engine in self.engines:
+            event.listen(engine, 'handle_error', self._on_error)
+
+    @classmethod
+    def from_config(cls, replicas, engine_options=None, check_interval=10):
+        engines = []
+        for replica in replicas:
+            uri, weight = (replica, 1) if isinstance(replica, str) else replica
+            engines.append((create_engine(uri, **(engine_options or {})),
+                            weight))
+        return cls(engines, check_interval)
+
+    def __bool__(self):
+        return bool(self.engines)
+
+    def choose(self):
+        self._ensure_checker()
+        healthy = [engine for engine in self.healthy if self.weights[engine]]
+        if not healthy:
+            return None
+        point = random.uniform(0, sum(self.weights[e] for e in healthy))
+        for engine in healthy:
+            point -= self.weights[engine]
+            if point <= 0:
+                return engine
+        return healthy[-1]
+
+    def check(self):
+        '''
+        Pings every replica and returns the ones that answered.
+        '''
+        healthy = []
+        for engine in self.engines:
+            try:
+                with engine.connect() as connection:
+                    connection.execute('SELECT 1')
+            except SQLAlchemyError:
+                log.warning('replica %s is down', engine.url)
+                continue
+            healthy.append(engine)
+        self.healthy = healthy
+        return healthy
+
+    def mark_down(self, engine):
+        self.healthy = [e for e in self.healthy if e is not engine]
+
+    def _on_error(self, context):
+        if context.is_disconnect and context.engine is not None:
+            self.mark_down(context.engine)
+
+    def _ensure_checker(self):
+        # Started lazily, and again in each forked worker process.
+        if self._checker_pid == os.getpid() or not self.check_interval:
+            return
+        with self._lock:
+            if self._checker_pid == os.getpid():
+                return
+            self._checker_pid = os.getpid()
+            thread = threading.Thread(target=self._run, name='replica-check')
+            thread.daemon = True
+            thread.start()
+
+    def _run(self):
+        while True:
+            time.sleep(self.check_interval)
+            self.check()
+
+
+def reads_from_replica():
+    return has_request_context() and request.method in READ_METHODS and \
+        not g.get('routing_primary')
+
+
+class RoutingSession(SignallingSession):
+
+    def get_bind(self, mapper=None, clause=None):
+        bind = SignallingSession.get_bind(self, mapper, clause)
+        if self._flushing:
+            self.info[WROTE] = True
+        replicas = self.app.extensions.get('replicas')
+        # Models with a __bind_key__ keep their own engine.
+        if bind is not self.bind or not replicas or \
+                self.info.get(WROTE) or not reads_from_replica():
+            return bind
+        engine = self.info.get(REPLICA)
+        if engine is None or engine not in replicas.healthy:
+            engine = self.info[REPLICA] = replicas.choose()
+        return engine if engine is not None else bind
+
+    def commit(self):
+        SignallingSession.commit(self)
+        if self.info.get(WROTE) and has_request_context():
+            g.routing_committed = True
+
+
+def use_primary():
+    '''
+    Sends the rest of this request's queries to the primary.
+    '''
+    g.routing_primary = True
+
+
+@contextmanager
+def primary_reads():
+    '''
+    Sends the queries made inside the block to the primary; later queries
+    in the request go back to the replica. Outside a request everything
+    already reads the primary.
+    '''
+    if not has_request_context():
+        yield
+        return
+    previous = g.get('routing_primary', False)
+    g.routing_primary = True
+    try:
+        yield
+    finally:
+        g.routing_primary = previous
+
+
+class RoutingSQLAlchemy(SQLAlchemy):
+
+    def init_app(self, app):
+        app.config.setdefault('SQLALCHEMY_REPLICAS', ())
+        app.config.setdefault('SQLALCHEMY_REPLICA_CHECK_SECONDS', 10)
+        app.config.setdefault('REPLICA_STICKY_SECONDS', 5)
+        app.config.setdefault('REPLICA_STICKY_COOKIE', 'db_primary')
+        SQLAlchemy.init_app(self, app)
+        app.extensions['replicas'] = ReplicaSet.from_config(
+            app.config['SQLALCHEMY_REPLICAS'],
+            app.config.get('SQLALCHEMY_ENGINE_OPTIONS'),
+            app.config['SQLALCHEMY_REPLICA_CHECK_SECONDS'])
+        cookie = app.config['REPLICA_STICKY_COOKIE']
+
+        @app.before_request
+        def read_sticky_cookie():
+            if request.cookies.get(cookie):
+                g.routing_primary = True
+
+        @app.after_request
+        def set_sticky_cookie(response):
+            if g.pop('routing_committed', False) and \
+                    app.extensions['replicas']:
+                response.set_cookie(
+                    cookie, '1', httponly=True,
+                    max_age=app.config['REPLICA_STICKY_SECONDS'])
+            return response
+
+    def create_session(self, options):
+        return orm.sessionmaker(class_=RoutingSession, db=self, **options)
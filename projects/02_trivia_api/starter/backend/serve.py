@@ -0,0 +1,283 @@
+# Shared module, copied into several projects. The original is in
+# projects/01_fyyur/starter_code/; edit it there and run
+# `python sync_shared.py` at the repo root to update the copies.
+'''
+Production launcher for the app, in place of the app.run() dev server.
+
+    $ python serve.py app:app                              # Fyyur
+    $ python serve.py 'flaskr:create_app()' --worker-class gthread  # trivia
+    $ python serve.py src.api:app --worker-class gevent    # coffee shop
+    $ python serve.py app:APP --server uwsgi               # capstone
+    $ python serve.py --stats
+
+TARGET is "module:name" for an app object or "module:factory()" for an app
+factory. The app is loaded once in the master and workers are forked from
+it (--no-preload loads it in each worker instead), so imported code and
+anything built at startup is shared copy-on-write; pooled database
+connections opened while loading are closed before forking. Workers are
+recycled after --max-requests requests, staggered by a random jitter so
+they do not all restart at once.
+
+Worker models:
+    sync      one request per process; CPU-bound or fast DB-bound handlers
+    gthread   --threads per process; handlers that wait on I/O
+    gevent    --worker-connections greenlets per process; many idle
+              connections such as streams and long polls
+
+Each gunicorn worker writes its pid, age, request count and memory
+(proportional set size, which counts shared pages once) to --stats-dir;
+--stats prints them. METRICS_DIR defaults to a directory next to them, so
+/metrics sums all workers. Under uwsgi, its own stats server is enabled on
+a socket in --stats-dir (read it with uwsgitop).
+'''
+
+import argparse
+import importlib
+import json
+import multiprocessing
+import os
+import resource
+import sys
+import tempfile
+import threading
+import time
+
+WORKER_CLASSES = ('sync', 'gthread', 'gevent')
+DEFAULT_STATS_DIR = os.path.join(tempfile.gettempdir(), 'serve-stats')
+
+
+def load_target(target):
+    module_name, _, name = target.partition(':')
+    module = importlib.import_module(module_name)
+    name = name or 'app'
+    if name.endswith('()'):
+        return getattr(module, name[:-2])()
+    return getattr(module, name)
+
+
+def default_workers(worker_class):
+    cpus = multiprocessing.cpu_count()
+    # Sync workers sit idle while they wait on the database, so run more
+    # of them than there are cores.
+    return cpus * 2 + 1 if worker_class == 'sync' else cpus
+
+
+def dispose_engines(app):
+    '''
+    Closes the database connections the app opened while loading, which
+    forked workers would otherwise share.
+    '''
+    state = app.extensions.get('sqlalchemy')
+    if state is not None:
+        state.db.get_engine(app).dispose()
+    for engine in getattr(app.extensions.get('replicas'), 'engines', ()):
+        engine.dispose()
+
+
+def memory_kb():
+    '''
+    {'rss', 'pss', 'private'} in KiB; pss and private need Linux.
+    '''
+    memory = {'rss': resource.getrusage(resource.RUSAGE_SELF).ru_maxrss}
+    try:
+        with open('/proc/self/smaps_rollup') as f:
+            for line in f:
+                key, _, value = line.partition(':')
+                if key == 'Pss':
+                    memory['pss'] = int(value.split()[0])
+                elif key in ('Private_Clean', 'Private_Dirty'):
+                    memory['private'] = memory.get('private', 0) + \
+                        int(value.split()[0])
+    except (OSError, ValueError):
+        pass
+    return memory
+
+
+class WorkerStats(object):
+    '''
+    Per-worker counters, written to <directory>/worker-<pid>.json at most
+    every `interval` seconds.
+    '''
+
+    def __init__(self, directory, worker_class, interval=1.0):
+        self.directory = directory
+        self.worker_class = worker_class
+        self.interval = interval
+        self.requests = 0
+        self.booted_at = time.time()
+        self.written_at = 0
+        self._lock = threading.Lock()
+
+    def path(self, pid=None):
+        return os.path.join(self.directory, 'worker-{}.json'.format(
+            pid or os.getpid()))
+
+    def started(self):
+        self.requests = 0
+        self.booted_at = time.time()
+        self.write()
+
+    def request(self):
+        # gthread workers finish requests on several threads.
+        with self._lock:
+            self.requests += 1
+            due = time.time() - self.written_at >= self.interval
+        if due:
+            self.write()
+
+    def write(self):
+        with self._lock:
+            self.written_at = time.time()
+            self._write()
+
+    def _write(self):
+        stats = dict(pid=os.getpid(), worker_class=self.worker_class,
+                     booted_at=self.booted_at, requests=self.requests,
+                     memory_kb=memory_kb())
+        temporary = self.path() + '.tmp'
+        with open(temporary, 'w') as f:
+            json.dump(stats, f)
+        os.replace(temporary, self.path())
+
+    def exited(self):
+        try:
+            os.remove(self.path())
+        except OSError:
+            pass
+
+
+def read_stats(directory):
+    workers = []
+    for name in sorted(os.listdir(directory)):
+        if not (name.startswith('worker-') and name.endswith('.json')):
+            continue
+        try:
+            with open(os.path.join(directory, name)) as f:
+                workers.append(json.load(f))
+        except (OSError, ValueError):
+            continue
+    return workers
+
+
+def print_stats(directory):
+    now = time.time()
+    print('{:>8} {:>8} {:>9} {:>10} {:>10} {:>10}'.format(
+        'pid', 'class', 'age (s)', 'requests', 'pss (MB)', 'priv (MB)'))
+    for worker in read_stats(directory):
+        memory = worker['memory_kb']
+        print('{:>8} {:>8} {:>9.0f} {:>10} {:>10.1f} {:>10.1f}'.format(
+            worker['pid'], worker['worker_class'], now - worker['booted_at'],
+            worker['requests'], memory.get('pss', memory['rss']) / 1024.0,
+            memory.get('private', 0) / 1024.0))
+
+
+def run_gunicorn(args):
+    from gunicorn.app.base import BaseApplication
+
+    stats = WorkerStats(args.stats_dir, args.worker_class)
+    options = {
+        'bind': args.bind,
+        'workers': args.workers,
+        'worker_class': args.worker_class,
+        'threads': args.threads,
+        'worker_connections': args.worker_connections,
+        'preload_app': args.preload,
+        'max_requests': args.max_requests,
+        'max_requests_jitter': args.max_requests // 10,
+        'timeout': args.timeout,
+        'graceful_timeout': args.timeout,
+        'keepalive': 5,
+        'post_fork': lambda server, worker: stats.started(),
+        'post_request': lambda worker, req, environ, resp: stats.request(),
+        'worker_exit': lambda server, worker: stats.exited(),
+    }
+
+    class Application(BaseApplication):
+
+        def load_config(self):
+            for key, value in options.items():
+                self.cfg.set(key, value)
+
+        def load(self):
+            app = load_target(args.target)
+            if args.preload:
+                dispose_engines(app)
+            return app
+
+    Application().run()
+
+
+def run_uwsgi(args):
+    command = ['uwsgi', '--master', '--http', args.bind,
+               '--module', 'serve:application',
+               '--processes', str(args.workers),
+               '--max-requests', str(args.max_requests),
+               '--max-requests-delta', str(args.max_requests // 10),
+               '--harakiri', str(args.timeout),
+               '--stats', os.path.join(args.stats_dir, 'uwsgi.sock'),
+               '--memory-report', '--die-on-term', '--need-app',
+               '--enable-threads']
+    if args.worker_class == 'gthread':
+        command += ['--threads', str(args.threads)]
+    elif args.worker_class == 'gevent':
+        # Patching this process would not survive the exec below; uwsgi
+        # patches its own before it loads the app.
+        command += ['--gevent', str(args.worker_connections),
+                    '--gevent-monkey-patch']
+    if not args.preload:
+        command.append('--lazy-apps')
+    os.environ['SERVE_TARGET'] = args.target
+    os.environ['SERVE_PRELOAD'] = '1' if args.preload else ''
+    os.execvp(command[0], command)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.split('\n\n')[0])
+    parser.add_argument('target', nargs='?', help='"module:app" or '
+                        '"module:create_app()"')
+    parser.add_argument('--server', choices=('gunicorn', 'uwsgi'),
+                        default='gunicorn')
+    parser.add_argument('--bind', default='127.0.0.1:8000')
+    parser.add_argument('--worker-class', choices=WORKER_CLASSES,
+                        default='sync')
+    parser.add_argument('--workers', type=int,
+                        help='default: 2 x cores + 1 for sync, else cores')
+    parser.add_argument('--threads', type=int, default=4)
+    parser.add_argument('--worker-connections', type=int, default=1000)
+    parser.add_argument('--no-preload', dest='preload', action='store_false')
+    parser.add_argument('--max-requests', type=int, default=1000)
+    parser.add_argument('--timeout', type=int, default=30)
+    parser.add_argument('--stats-dir', default=DEFAULT_STATS_DIR)
+    parser.add_argument('--stats', action='store_true',
+                        help='print per-worker stats and exit')
+    args = parser.parse_args(argv)
+
+    os.makedirs(args.stats_dir, exist_ok=True)
+    if args.stats:
+        print_stats(args.stats_dir)
+        return
+    if not args.target:
+        parser.error('TARGET is required')
+    if args.workers is None:
+        args.workers = default_workers(args.worker_class)
+    os.environ.setdefault('METRICS_DIR', os.path.join(args.stats_dir,
+                                                      'metrics'))
+    sys.path.insert(0, os.getcwd())
+    if args.server == 'uwsgi':
+        run_uwsgi(args)
+        return
+    if args.worker_class == 'gevent':
+        # Patch before the app is imported, so that what it creates at
+        # load time (locks, sockets) is cooperative too.
+        from gevent import monkey
+        monkey.patch_all()
+    run_gunicorn(args)
+
+
+if __name__ == '__main__':
+    main()
+elif os.environ.get('SERVE_TARGET'):
+    # Entry point for uwsgi's --module serve:application.
+    application = load_target(os.environ['SERVE_TARGET'])
+    if os.environ.get('SERVE_PRELOAD'):
+        dispose_engines(application)
@@ -3,10 +3,15 @@ import unittest
 import json
 from flask_sqlalchemy import SQLAlchemy
 from flaskr import create_app
-from models import setup_db, Question, Category
+from models import setup_db, db, Question, Category
+from query_counter import QueryBudgetMixin
+from bench_startup import import_time, slowest
 
+# Milliseconds `import flaskr` may take in a fresh interpreter.
+IMPORT_BUDGET_MS = float(os.environ.get('IMPORT_BUDGET_MS', 400))
 
-class TriviaTestCase(unittest.TestCase):
+
+class TriviaTestCase(QueryBudgetMixin, unittest.TestCase):
     """This class represents the trivia test case"""
 
     def setUp(self):
@@ -111,6 +116,15 @@ class TriviaTestCase(unittest.TestCase):
                         len(data['questions']) > 0)
         self.assertTrue(data['total_questions'])
 
+    """ Test that listings run a fixed number of queries """
+
+    def test_questions_query_budget(self):
+        engine = db.get_engine(self.app)
+        for url, budget in (('/categories', 1), ('/questions', 2),
+                            ('/categories/1/questions', 2)):
+            with self.assertMaxQueries(engine, budget):
+                self.client().get(url)
+
     """ Test 404 invalid page number"""
 
     def test_404_questions_page_not_found(self):
@@ -130,7 +144,9 @@ class TriviaTestCase(unittest.TestCase):
             question,
             "please make sure the question exists before testing delete")
         question_id = str(question.id)
-        response = self.client().delete(f'questions/{question_id}')
+        # lookup, delete and the re-listed page, whatever the table size
+        with self.assertMaxQueries(db.get_engine(self.app), 3):
+            response = self.client().delete(f'questions/{question_id}')
         data = json.loads(response.data)
         question = Question.query.get(question.id)
 
@@ -273,6 +289,18 @@ class TriviaTestCase(unittest.TestCase):
     # nice SELF.SEARCHQUESTION SEARCH_ANSWER, DIFFICULT
 
 
+class ImportTimeTestCase(unittest.TestCase):
+    """Guards the cold-start cost of importing the app"""
+
+    def test_import_time(self):
+        total, modules = import_time('flaskr')
+
+        self.assertNotIn('autopep8', modules)
+        self.assertLess(total / 1000.0, IMPORT_BUDGET_MS, 'slowest: {}'.format(
+            ', '.join('{} {:.0f} ms'.format(name, cumulative / 1000.0)
+                      for name, cumulative in slowest(modules)[1:6])))
+
+
 # Make the tests conveniently executable
 if __name__ == "__main__":
     unittest.main()
@@ -0,0 +1,105 @@
+'''
+Mixed read/write benchmark for the SQLite settings in src/database/models.py.
+
+    python bench_sqlite.py [--threads 8] [--seconds 5] [--writes 0.2]
+
+Runs the same workload twice on throwaway database files: once with
+SQLAlchemy's defaults for a file database (a new connection per checkout,
+rollback journal, synchronous=FULL) and once with SQLITE_ENGINE_OPTIONS and
+SQLITE_PRAGMAS. Each thread lists the drinks the way GET /drinks does and,
+for a `writes` fraction of its operations, inserts a drink and commits.
+'''
+
+import argparse
+import os
+import random
+import shutil
+import tempfile
+import threading
+import time
+
+from sqlalchemy import create_engine, event
+from sqlalchemy.exc import OperationalError
+
+from src.database.models import (Drink, SQLITE_ENGINE_OPTIONS,
+                                 set_sqlite_pragmas)
+
+RECIPE = '[{"name": "water", "color": "blue", "parts": 1}]'
+
+
+def make_engine(path, tuned):
+    url = 'sqlite:///' + path
+    if not tuned:
+        return create_engine(url)
+    engine = create_engine(url, **SQLITE_ENGINE_OPTIONS)
+    event.listen(engine, 'connect', set_sqlite_pragmas)
+    return engine
+
+
+def run(engine, threads, seconds, writes):
+    table = Drink.__table__
+    table.create(engine)
+    with engine.begin() as connection:
+        connection.execute(table.insert(), [
+            {'title': 'drink {}'.format(i), 'recipe': RECIPE}
+            for i in range(50)])
+
+    counts = {'reads': 0, 'writes': 0, 'errors': 0}
+    lock = threading.Lock()
+    deadline = time.time() + seconds
+
+    def work(seed):
+        rng = random.Random(seed)
+        done = {'reads': 0, 'writes': 0, 'errors': 0}
+        while time.time() < deadline:
+            try:
+                if rng.random() < writes:
+                    with engine.begin() as connection:
+                        connection.execute(
+                            table.insert(), recipe=RECIPE,
+                            title='drink {}'.format(rng.random()))
+                    done['writes'] += 1
+                else:
+                    with engine.connect() as connection:
+                        connection.execute(
+                            table.select().order_by(table.c.id)).fetchall()
+                    done['reads'] += 1
+            except OperationalError:
+                done['errors'] += 1
+        with lock:
+            for key in counts:
+                counts[key] += done[key]
+
+    workers = [threading.Thread(target=work, args=(i,)) for i in range(threads)]
+    for worker in workers:
+        worker.start()
+    for worker in workers:
+        worker.join()
+    engine.dispose()
+    return counts
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split('\n\n')[0])
+    parser.add_argument('--threads', type=int, default=8)
+    parser.add_argument('--seconds', type=float, default=5)
+    parser.add_argument('--writes', type=float, default=0.2,
+                        help='fraction of operations that insert')
+    args = parser.parse_args()
+
+    directory = tempfile.mkdtemp()
+    try:
+        for label, tuned in (('default', False), ('tuned', True)):
+            path = os.path.join(directory, label + '.db')
+            counts = run(make_engine(path, tuned), args.threads, args.seconds,
+                         args.writes)
+            total = counts['reads'] + counts['writes']
+            print('{:8} {:8.0f} ops/s  ({} reads, {} writes, {} locked)'.format(
+                label, total / args.seconds, counts['reads'], counts['writes'],
+                counts['errors']))
+    finally:
+        shutil.rmtree(directory)
+
+
+if __name__ == '__main__':
+    main()
@@ -1,15 +1,31 @@
 import os
-from flask import Flask, request, jsonify, abort
+import click
+from flask import Flask, request, jsonify, abort, Response
 from sqlalchemy import exc
+from sqlalchemy.engine.url import make_url
 import json
 from flask_cors import CORS
 
-from .database.models import db_drop_and_create_all, setup_db, Drink
+from .database import models
+from .database.models import db_drop_and_create_all, setup_db, db, Drink
+from .database.reseed import reseed
 from .auth.auth import AuthError, requires_auth
+from .compression import CompressionMiddleware
+from .metrics import Metrics
+from .menu import MenuSnapshot, ChangeFeed
 
 app = Flask(__name__)
 setup_db(app)
 CORS(app)
+metrics = Metrics(app, engine=db.engine)
+# The menu's ETag is kept (as a weak one) on compressed responses, and the
+# SSE stream is never buffered for compression.
+app.wsgi_app = CompressionMiddleware(
+    app.wsgi_app,
+    minimum_size=int(os.environ.get('COMPRESS_MIN_SIZE', 500)))
+menu_feed = ChangeFeed()
+menu = MenuSnapshot(db.engine, menu_feed)
+menu.track(db.session)
 
 '''
 @TODO uncomment the following line to initialize the datbase
@@ -18,15 +34,53 @@ CORS(app)
 '''
 # db_drop_and_create_all()
 
-## ROUTES
 '''
-@TODO implement endpoint
-    GET /drinks
-        it should be a public endpoint
-        it should contain only the drink.short() data representation
-    returns status code 200 and json {"success": True, "drinks": drinks} where drinks is the list of drinks
-        or appropriate status code indicating reason for failure
+flask reseed [SOURCE]
+    rebuilds the database from an NDJSON fixture (one drink per line,
+    default ./database/drinks.ndjson) and swaps it in while the server
+    keeps running
+'''
+@app.cli.command('reseed')
+@click.argument('source', default=os.path.join(
+    os.path.dirname(models.__file__), 'drinks.ndjson'))
+def reseed_command(source):
+    path = reseed(source, make_url(models.database_path).database)
+    click.echo('Swapped in {}'.format(path))
+
+## ROUTES
 '''
+GET /drinks
+    public endpoint with the drink.short() data representation
+    returns status code 200 and json {"success": True, "drinks": drinks}
+    where drinks is the list of drinks; served from the prebuilt menu
+    snapshot, and 304 when the client's ETag is still current
+'''
+@app.route('/drinks')
+def get_drinks():
+    body, etag, _ = menu.get()
+    response = Response(body, mimetype='application/json')
+    response.set_etag(etag)
+    response.headers['Cache-Control'] = 'no-cache'
+    return response.make_conditional(request)
+
+
+'''
+GET /drinks/stream
+    public Server-Sent Events stream of menu changes: a "menu" event with
+    the full GET /drinks body, then a "changes" event with upserted and
+    deleted drinks after each edit. Reconnecting with Last-Event-ID
+    replays the missed changes while they are still in the change log of
+    the worker that sent them; any other worker sends the full menu.
+    Run under gevent workers (see README) so idle streams hold no thread.
+'''
+@app.route('/drinks/stream')
+def stream_drinks():
+    last_event_id = menu_feed.parse_event_id(
+        request.headers.get('Last-Event-ID'))
+    return Response(
+        menu_feed.stream(last_event_id, menu.get),
+        mimetype='text/event-stream',
+        headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'})
 
 
 '''
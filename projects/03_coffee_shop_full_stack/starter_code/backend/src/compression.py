@@ -0,0 +1,332 @@
+# Shared module, copied into several projects. The original is in
+# projects/01_fyyur/starter_code/; edit it there and run
+# `python sync_shared.py` at the repo root to update the copies.
+#----------------------------------------------------------------------------#
+# Response compression and precompressed static assets.
+#
+# CompressionMiddleware wraps any WSGI app (Fyyur, or the JSON APIs of the
+# other projects) and gzip/brotli encodes responses negotiated through
+# Accept-Encoding. Files under /static are served straight from the .br/.gz
+# siblings written by `python compression.py` (or `fab precompress`), so they
+# cost nothing to compress per request.
+#
+# brotli is optional: `pip install brotli` to enable it.
+#----------------------------------------------------------------------------#
+
+import gzip
+import hashlib
+import json
+import mimetypes
+import os
+import re
+import shutil
+import sys
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+MANIFEST_NAME = 'manifest.json'
+IMMUTABLE_CACHE_CONTROL = 'public, max-age=31536000, immutable'
+
+COMPRESSIBLE_TYPES = (
+    'text/',
+    'application/json',
+    'application/javascript',
+    'application/x-javascript',
+    'application/xml',
+    'application/vnd.ms-fontobject',
+    'font/ttf',
+    'font/otf',
+    'image/svg+xml',
+)
+
+# Extensions worth precompressing; woff/jpg/png are already compressed.
+PRECOMPRESS_EXTENSIONS = (
+    '.css', '.js', '.map', '.html', '.json', '.txt',
+    '.svg', '.ttf', '.otf', '.eot',
+)
+
+FINGERPRINT_RE = re.compile(r'\.[0-9a-f]{10}\.[^./]+$')
+
+
+def is_compressible(content_type):
+    content_type = (content_type or '').split(';')[0].strip().lower()
+    return content_type.startswith(COMPRESSIBLE_TYPES)
+
+
+def accepted_encodings(header):
+    '''
+    Parses an Accept-Encoding header into the set of encodings with q > 0.
+    '''
+    encodings = set()
+    for part in (header or '').split(','):
+        params = part.strip().split(';')
+        name = params[0].strip().lower()
+        if not name:
+            continue
+        quality = 1.0
+        for param in params[1:]:
+            key, _, value = param.strip().partition('=')
+            if key == 'q':
+                try:
+                    quality = float(value)
+                except ValueError:
+                    quality = 0.0
+        if quality > 0:
+            encodings.add(name)
+    return encodings
+
+
+def choose_encoding(header):
+    encodings = accepted_encodings(header)
+    if brotli is not None and 'br' in encodings:
+        return 'br'
+    if 'gzip' in encodings or '*' in encodings:
+        return 'gzip'
+    return None
+
+
+def compress(body, encoding, level=6):
+    if encoding == 'br':
+        return brotli.compress(body, quality=min(level, 11))
+    return gzip.compress(body, compresslevel=level)
+
+
+def load_manifest(static_folder):
+    '''
+    Returns the {original: fingerprinted} map written by precompress_static,
+    or an empty dict when the build step has not been run.
+    '''
+    try:
+        with open(os.path.join(static_folder, MANIFEST_NAME)) as manifest:
+            return json.load(manifest)
+    except (IOError, ValueError):
+        return {}
+
+
+class CompressionMiddleware(object):
+    '''
+    WSGI middleware compressing responses of at least `minimum_size` bytes.
+    '''
+
+    def __init__(self, app, minimum_size=500, level=6,
+                 static_folder=None, static_url_path='/static'):
+        self.app = app
+        self.minimum_size = minimum_size
+        self.level = level
+        self.static_folder = static_folder
+        self.static_prefix = static_url_path.rstrip('/') + '/'
+        manifest = load_manifest(static_folder) if static_folder else {}
+        self.fingerprinted = set(manifest.values())
+
+    def __call__(self, environ, start_response):
+        encoding = choose_encoding(environ.get('HTTP_ACCEPT_ENCODING'))
+        path = environ.get('PATH_INFO', '')
+
+        if path.startswith(self.static_prefix):
+            filename = path[len(self.static_prefix):]
+            if encoding and environ.get('REQUEST_METHOD') in ('GET', 'HEAD'):
+                served = self.serve_precompressed(
+                    environ, start_response, filename, encoding)
+                if served is not None:
+                    return served
+            if filename in self.fingerprinted:
+                return self.app(environ, self.immutable(start_response))
+
+        if encoding is None:
+            return self.app(environ, start_response)
+
+        captured = {}
+        chunks = []
+
+        def capture(status, headers, exc_info=None):
+            captured['status'] = status
+            captured['headers'] = headers
+            captured['exc_info'] = exc_info
+            return chunks.append
+
+        app_iter = self.app(environ, capture)
+        headers = captured.get('headers', [])
+        if not self.should_compress(captured.get('status', ''), headers):
+            # Streaming or incompressible response; pass it through untouched.
+            start_response(captured['status'], headers,
+                           captured.get('exc_info'))
+            if chunks:
+                return _chain(chunks, app_iter)
+            return app_iter
+
+        try:
+            chunks.extend(app_iter)
+        finally:
+            if hasattr(app_iter, 'close'):
+                app_iter.close()
+        body = b''.join(chunks)
+
+        if len(body) < self.minimum_size:
+            start_response(captured['status'], headers,
+                           captured.get('exc_info'))
+            return [body]
+
+        body = compress(body, encoding, self.level)
+        headers = [_weak_etag(name, value) for name, value in headers
+                   if name.lower() != 'content-length']
+        headers.append(('Content-Encoding', encoding))
+        headers.append(('Content-Length', str(len(body))))
+        _add_vary(headers)
+        start_response(captured['status'], headers, captured.get('exc_info'))
+        return [body]
+
+    def should_compress(self, status, headers):
+        if not status.startswith('200'):
+            return False
+        values = dict((name.lower(), value) for name, value in headers)
+        if 'content-encoding' in values:
+            return False
+        if 'no-transform' in values.get('cache-control', ''):
+            return False
+        if values.get('content-type', '').startswith('text/event-stream'):
+            return False
+        return is_compressible(values.get('content-type'))
+
+    def serve_precompressed(self, environ, start_response, filename,
+                            encoding):
+        if self.static_folder is None:
+            return None
+        suffix = '.br' if encoding == 'br' else '.gz'
+        # os.path.join drops the folder for an absolute filename (say from
+        # /static//etc/...), so check where the path really ends up.
+        root = os.path.realpath(self.static_folder)
+        source = os.path.realpath(os.path.join(root, filename))
+        precompressed = source + suffix
+        if not source.startswith(root + os.sep):
+            return None
+        if not os.path.isfile(precompressed):
+            return None
+
+        content_type = mimetypes.guess_type(source)[0] \
+            or 'application/octet-stream'
+        headers = [
+            ('Content-Type', content_type),
+            ('Content-Encoding', encoding),
+            ('Content-Length', str(os.path.getsize(precompressed))),
+            ('Vary', 'Accept-Encoding'),
+        ]
+        if filename in self.fingerprinted:
+            headers.append(('Cache-Control', IMMUTABLE_CACHE_CONTROL))
+        start_response('200 OK', headers)
+        if environ.get('REQUEST_METHOD') == 'HEAD':
+            return [b'']
+        wrapper = environ.get('wsgi.file_wrapper', _file_iter)
+        return wrapper(open(precompressed, 'rb'), 64 * 1024)
+
+    def immutable(self, start_response):
+        def start(status, headers, exc_info=None):
+            if status.startswith('200'):
+                headers = [(name, value) for name, value in headers
+                           if name.lower() != 'cache-control']
+                headers.append(('Cache-Control', IMMUTABLE_CACHE_CONTROL))
+            return start_response(status, headers, exc_info)
+        return start
+
+
+def _add_vary(headers):
+    for index, (name, value) in enumerate(headers):
+        if name.lower() == 'vary':
+            if 'accept-encoding' not in value.lower():
+                headers[index] = (name, value + ', Accept-Encoding')
+            return
+    headers.append(('Vary', 'Accept-Encoding'))
+
+
+def _weak_etag(name, value):
+    # The encoded body is no longer byte-identical to what the strong ETag
+    # named, but it still validates conditional requests (If-None-Match
+    # compares weakly), so 304s keep working.
+    if name.lower() == 'etag' and not value.startswith('W/'):
+        return (name, 'W/' + value)
+    return (name, value)
+
+
+def _chain(chunks, app_iter):
+    try:
+        for chunk in chunks:
+            yield chunk
+        for chunk in app_iter:
+            yield chunk
+    finally:
+        if hasattr(app_iter, 'close'):
+            app_iter.close()
+
+
+def _file_iter(fileobj, block_size):
+    try:
+        while True:
+            block = fileobj.read(block_size)
+            if not block:
+                break
+            yield block
+    finally:
+        fileobj.close()
+
+
+#----------------------------------------------------------------------------#
+# Build step.
+#----------------------------------------------------------------------------#
+
+def fingerprint_name(path, content):
+    root, ext = os.path.splitext(path)
+    digest = hashlib.md5(content).hexdigest()[:10]
+    return '{}.{}{}'.format(root, digest, ext)
+
+
+def precompress_static(static_folder, level=9):
+    '''
+    Writes a content-hashed copy of every static file plus .gz (and .br when
+    brotli is installed) siblings, then records the mapping in manifest.json.
+    Fingerprinted copies stay next to their originals so relative url()
+    references inside stylesheets keep resolving.
+    '''
+    manifest = {}
+    for dirpath, _, filenames in os.walk(static_folder):
+        for filename in filenames:
+            if filename == MANIFEST_NAME or filename.endswith(('.gz', '.br')) \
+                    or FINGERPRINT_RE.search(filename):
+                continue
+            source = os.path.join(dirpath, filename)
+            relative = os.path.relpath(source, static_folder) \
+                .replace(os.sep, '/')
+            with open(source, 'rb') as f:
+                content = f.read()
+
+            fingerprinted = fingerprint_name(relative, content)
+            target = os.path.join(static_folder, fingerprinted)
+            if not os.path.exists(target):
+                shutil.copyfile(source, target)
+            manifest[relative] = fingerprinted
+
+            if not filename.lower().endswith(PRECOMPRESS_EXTENSIONS):
+                continue
+            for path in (source, target):
+                _write_compressed(path + '.gz', gzip.compress(
+                    content, compresslevel=level, mtime=0))
+                if brotli is not None:
+                    _write_compressed(path + '.br', brotli.compress(
+                        content, quality=11))
+
+    with open(os.path.join(static_folder, MANIFEST_NAME), 'w') as f:
+        json.dump(manifest, f, indent=2, sort_keys=True)
+    return manifest
+
+
+def _write_compressed(path, body):
+    with open(path, 'wb') as f:
+        f.write(body)
+
+
+if __name__ == '__main__':
+    folder = sys.argv[1] if len(sys.argv) > 1 else os.path.join(
+        os.path.dirname(os.path.abspath(__file__)), 'static')
+    written = precompress_static(folder)
+    print('Precompressed {} static files in {}'.format(len(written), folder))
@@ -1,5 +1,9 @@
 import os
-from sqlalchemy import Column, String, Integer
+import sqlite3
+from sqlalchemy import Column, String, Integer, event
+from sqlalchemy.engine.url import make_url
+from sqlalchemy.exc import DisconnectionError
+from sqlalchemy.pool import QueuePool
 from flask_sqlalchemy import SQLAlchemy
 import json
 
@@ -9,21 +13,88 @@ database_path = "sqlite:///{}".format(os.path.join(project_dir, database_filenam
 
 db = SQLAlchemy()
 
+'''
+SQLite performance profile
+    WAL lets readers run alongside the single writer, synchronous=NORMAL
+    is durable in WAL mode except for the last commits on power loss, and
+    busy_timeout makes writers queue up instead of failing with "database
+    is locked". Connections are pooled so these are set once per
+    connection rather than on every request.
+'''
+SQLITE_PRAGMAS = (
+    ('journal_mode', 'WAL'),
+    ('synchronous', 'NORMAL'),
+    ('busy_timeout', 5000),
+    ('cache_size', -16000),  # KiB, i.e. 16 MB per connection
+    ('mmap_size', 268435456),
+    ('temp_store', 'MEMORY'),
+)
+
+SQLITE_ENGINE_OPTIONS = {
+    'poolclass': QueuePool,
+    'pool_size': 8,
+    'max_overflow': 8,
+    'pool_timeout': 10,
+    'connect_args': {'check_same_thread': False, 'timeout': 5},
+}
+
+
+def set_sqlite_pragmas(dbapi_connection, connection_record):
+    cursor = dbapi_connection.cursor()
+    for name, value in SQLITE_PRAGMAS:
+        cursor.execute('PRAGMA {}={}'.format(name, value))
+    cursor.close()
+
+
+'''
+follow_reseeds(engine, path)
+    `flask reseed` (see reseed.py) swaps in a new database by repointing
+    the `path` symlink. Connections are opened on the file the link points
+    to, and a pooled connection whose file is no longer the current one is
+    replaced at checkout, so each worker moves to the new database on its
+    next request without a restart.
+'''
+def follow_reseeds(engine, path):
+    @event.listens_for(engine, 'connect')
+    def remember_file(dbapi_connection, connection_record):
+        cursor = dbapi_connection.cursor()
+        cursor.execute('PRAGMA database_list')
+        connection_record.info['database_file'] = cursor.fetchone()[2]
+        cursor.close()
+
+    @event.listens_for(engine, 'checkout')
+    def check_file(dbapi_connection, connection_record, connection_proxy):
+        if connection_record.info.get('database_file') != \
+                os.path.realpath(path):
+            raise DisconnectionError('database file was swapped')
+
+
 '''
 setup_db(app)
     binds a flask application and a SQLAlchemy service
 '''
 def setup_db(app):
+    path = make_url(database_path).database
+    connect_args = SQLITE_ENGINE_OPTIONS['connect_args']
     app.config["SQLALCHEMY_DATABASE_URI"] = database_path
     app.config["SQLALCHEMY_TRACK_MODIFICATIONS"] = False
+    app.config["SQLALCHEMY_ENGINE_OPTIONS"] = dict(
+        SQLITE_ENGINE_OPTIONS,
+        creator=lambda: sqlite3.connect(os.path.realpath(path),
+                                        **connect_args))
     db.app = app
     db.init_app(app)
+    engine = db.get_engine(app)
+    event.listen(engine, 'connect', set_sqlite_pragmas)
+    follow_reseeds(engine, path)
 
 '''
 db_drop_and_create_all()
     drops the database tables and starts fresh
     can be used to initialize a clean database
     !!NOTE you can change the database_filename variable to have multiple verisons of a database
+    !!NOTE this blocks every request while it runs; to refresh a running
+    server use `flask reseed` instead
 '''
 def db_drop_and_create_all():
     db.drop_all()
@@ -47,7 +118,6 @@ class Drink(db.Model):
         short form representation of the Drink model
     '''
     def short(self):
-        print(json.loads(self.recipe))
         short_recipe = [{'color': r['color'], 'parts': r['parts']} for r in json.loads(self.recipe)]
         return {
             'id': self.id,
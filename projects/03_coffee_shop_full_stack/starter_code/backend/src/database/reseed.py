@@ -0,0 +1,109 @@
+import json
+import os
+import time
+from glob import glob
+
+from sqlalchemy import create_engine
+
+from .models import db, Drink
+
+'''
+reseed(source, path)
+    replaces the database at `path` with one loaded from `source`, an NDJSON
+    file with one drink ({"title": ..., "recipe": [...]}) per line, without
+    stopping the server
+
+    The new database is built next to `path` as a file of its own
+    (database-<timestamp>.db) while the old one keeps serving. `path` is then
+    made a symlink to it with a single rename, which readers see either
+    before or after, never half done; running workers reconnect to the new
+    file on their next request (see models.follow_reseeds). The previous
+    `keep` generations are kept for requests still reading them.
+
+    Returns the path of the new database file.
+'''
+def reseed(source, path, batch_size=1000, keep=1):
+    directory, filename = os.path.split(os.path.abspath(path))
+    name, extension = os.path.splitext(filename)
+    now = time.time()
+    generation = os.path.join(directory, '{}-{}{:06d}{}'.format(
+        name, time.strftime('%Y%m%dT%H%M%S', time.gmtime(now)),
+        int(now % 1 * 1000000), extension))
+
+    build(source, generation, batch_size)
+
+    link = os.path.join(directory, '.{}.swap'.format(filename))
+    if os.path.lexists(link):
+        os.remove(link)
+    os.symlink(os.path.basename(generation), link)
+    os.replace(link, path)
+    fsync_directory(directory)
+
+    prune(directory, name, extension, generation, keep)
+    return generation
+
+
+'''
+build(source, path, batch_size)
+    creates the tables in a new file and bulk inserts the drinks; nothing
+    else has the file open yet, so the journal is off until it is done
+'''
+def build(source, path, batch_size=1000):
+    engine = create_engine('sqlite:///' + path)
+    try:
+        db.Model.metadata.create_all(engine)
+        table = Drink.__table__
+        with engine.connect() as connection:
+            connection.execute('PRAGMA journal_mode=OFF')
+            connection.execute('PRAGMA synchronous=OFF')
+            with connection.begin():
+                batch = []
+                for drink in read_drinks(source):
+                    batch.append(drink)
+                    if len(batch) >= batch_size:
+                        connection.execute(table.insert(), batch)
+                        batch = []
+                if batch:
+                    connection.execute(table.insert(), batch)
+    finally:
+        engine.dispose()
+    with open(path, 'rb') as f:
+        os.fsync(f.fileno())
+
+
+def read_drinks(source):
+    with open(source) as f:
+        for number, line in enumerate(f, 1):
+            if not line.strip():
+                continue
+            try:
+                drink = json.loads(line)
+                yield {'title': drink['title'],
+                       'recipe': json.dumps(drink['recipe'])}
+            except (ValueError, KeyError, TypeError):
+                raise ValueError('{}:{}: expected {{"title": ..., '
+                                 '"recipe": [...]}}'.format(source, number))
+
+
+def fsync_directory(directory):
+    descriptor = os.open(directory, os.O_RDONLY)
+    try:
+        os.fsync(descriptor)
+    finally:
+        os.close(descriptor)
+
+
+'''
+prune(directory, name, extension, current, keep)
+    deletes all but the newest `keep` generations before `current`, with
+    their -wal and -shm files
+'''
+def prune(directory, name, extension, current, keep):
+    pattern = os.path.join(directory, '{}-*{}'.format(name, extension))
+    older = sorted(path for path in glob(pattern) if path != current)
+    for path in older[:max(len(older) - keep, 0)]:
+        for leftover in (path, path + '-wal', path + '-shm'):
+            try:
+                os.remove(leftover)
+            except OSError:
+                pass
@@ -0,0 +1,229 @@
+import hashlib
+import json
+import os
+import threading
+import time
+import uuid
+from collections import deque
+from itertools import islice
+
+from sqlalchemy import event
+from sqlalchemy.orm import object_session
+
+from .database.models import Drink
+
+'''
+MenuSnapshot
+    the public GET /drinks body, serialized once and reused
+
+    The body is rebuilt from the database after every commit that inserted,
+    updated or deleted a Drink, and at most every `ttl` seconds to pick up
+    writes made by other worker processes. Readers get the (body, etag,
+    event_id) of the last finished build: a rebuild only becomes visible
+    when it replaces that tuple, together with its build time, in a single
+    assignment.
+
+    Each rebuild that changed the menu publishes the difference to `feed`;
+    event_id is the feed position the snapshot is current as of.
+'''
+class MenuSnapshot(object):
+    STAGED_KEY = 'menu_changed'
+
+    def __init__(self, engine, feed, ttl=30):
+        self.engine = engine
+        self.feed = feed
+        self.ttl = ttl
+        self._drinks = None
+        # (snapshot, built_at), swapped as one so readers never pair a
+        # snapshot with another build's time.
+        self._built = (None, None)
+        self._lock = threading.Lock()
+
+    '''
+    get()
+        returns (body, etag, event_id), building the snapshot if it is
+        missing or older than ttl
+    '''
+    def get(self):
+        current, built_at = self._built
+        if self._stale(current, built_at):
+            current = self.rebuild(only_if_stale=True)
+        return current
+
+    @property
+    def built_at(self):
+        return self._built[1]
+
+    def _stale(self, current, built_at):
+        return current is None or time.time() - built_at >= self.ttl
+
+    '''
+    rebuild(only_if_stale=False)
+        reads the drinks on a connection of its own, so it can run right
+        after a commit, and swaps in the new snapshot
+
+        With only_if_stale, requests that queued on the lock behind a
+        rebuild reuse its result instead of each reading the table again.
+    '''
+    def rebuild(self, only_if_stale=False):
+        with self._lock:
+            if only_if_stale and not self._stale(*self._built):
+                return self._built[0]
+            table = Drink.__table__
+            with self.engine.connect() as connection:
+                rows = connection.execute(
+                    table.select().order_by(table.c.id)).fetchall()
+            drinks = [Drink(id=row.id, title=row.title,
+                            recipe=row.recipe).short() for row in rows]
+            body = json.dumps({'success': True, 'drinks': drinks},
+                              separators=(',', ':')).encode('utf-8')
+            etag = hashlib.sha1(body).hexdigest()
+
+            by_id = dict((drink['id'], drink) for drink in drinks)
+            if self._drinks is not None:
+                changes = menu_changes(self._drinks, by_id)
+                if changes:
+                    self.feed.publish('changes', changes)
+            self._drinks = by_id
+            current = (body, etag, self.feed.last_id)
+            self._built = (current, time.time())
+            return current
+
+    '''
+    track(session)
+        rebuilds after commits of `session` that changed a Drink
+    '''
+    def track(self, session):
+        def stage(mapper, connection, target):
+            object_session(target).info[self.STAGED_KEY] = True
+
+        for name in ('after_insert', 'after_update', 'after_delete'):
+            event.listen(Drink, name, stage)
+
+        @event.listens_for(session, 'after_commit')
+        def rebuild_after_commit(committed):
+            if committed.info.pop(self.STAGED_KEY, False) and \
+                    self._built[0] is not None:
+                self.rebuild()
+
+        @event.listens_for(session, 'after_rollback')
+        def discard(rolled_back):
+            rolled_back.info.pop(self.STAGED_KEY, None)
+
+
+'''
+menu_changes(old, new)
+    the difference between two {id: drink.short()} menus, as
+    [{"op": "upsert", "drink": ...}] and [{"op": "delete", "id": ...}]
+'''
+def menu_changes(old, new):
+    changes = [{'op': 'upsert', 'drink': drink}
+               for id, drink in sorted(new.items()) if old.get(id) != drink]
+    changes.extend({'op': 'delete', 'id': id}
+                   for id in sorted(set(old) - set(new)))
+    return changes
+
+
+'''
+ChangeFeed
+    fans published events out to every open GET /drinks/stream
+
+    Events are numbered per process and the last `size` are kept, so a
+    client reconnecting with Last-Event-ID is replayed what it missed.
+    Event ids carry a boot id that is new for every process (forked workers
+    included), so a client reconnecting to another worker or after a
+    restart gets the full menu again instead of the wrong worker's events,
+    as does a client too far behind. Waiting streams block on one shared Condition, which under
+    gevent workers is a cheap greenlet wait rather than a thread apiece.
+'''
+class ChangeFeed(object):
+
+    def __init__(self, size=1000, heartbeat=15):
+        self.heartbeat = heartbeat
+        self.last_id = 0
+        self.boot = new_boot_id()
+        self._log = deque(maxlen=size)
+        self._condition = threading.Condition()
+        if hasattr(os, 'register_at_fork'):
+            os.register_at_fork(after_in_child=self._forked)
+
+    def _forked(self):
+        # The child's events are its own from here on; the ones logged in
+        # the parent were never sent by this process.
+        self.boot = new_boot_id()
+        self._condition = threading.Condition()
+        self._log.clear()
+
+    '''
+    parse_event_id(value)
+        the event number in a Last-Event-ID header, or None when it is
+        missing, malformed or from another process
+    '''
+    def parse_event_id(self, value):
+        boot, dot, number = (value or '').partition('.')
+        if not dot or boot != self.boot or not number.isdigit():
+            return None
+        return int(number)
+
+    def format_event(self, event_id, event, data):
+        return 'id: {}.{}\nevent: {}\ndata: {}\n\n'.format(
+            self.boot, event_id, event, data)
+
+    def publish(self, event, data):
+        with self._condition:
+            self.last_id += 1
+            self._log.append((self.last_id, event, json.dumps(
+                data, separators=(',', ':'))))
+            self._condition.notify_all()
+
+    '''
+    since(event_id)
+        the logged events after event_id, or None when some of them have
+        already been dropped
+    '''
+    def since(self, event_id):
+        with self._condition:
+            if event_id > self.last_id:
+                return None
+            if event_id == self.last_id:
+                return []
+            if not self._log or self._log[0][0] > event_id + 1:
+                return None
+            # Ids are consecutive, so the first missed event is at a fixed
+            # offset from the oldest one kept.
+            return list(islice(self._log, event_id + 1 - self._log[0][0],
+                               None))
+
+    def wait(self, event_id, timeout):
+        with self._condition:
+            return self._condition.wait_for(
+                lambda: self.last_id > event_id, timeout)
+
+    '''
+    stream(last_event_id, snapshot)
+        yields Server-Sent Events: missed events when last_event_id (an
+        event number from parse_event_id) can be resumed, otherwise a full "menu" event from snapshot(), then every
+        new event, with a comment line as keep-alive while idle
+    '''
+    def stream(self, last_event_id, snapshot):
+        yield 'retry: 3000\n\n'
+        cursor = last_event_id
+        while True:
+            entries = None if cursor is None else self.since(cursor)
+            if entries is None:
+                body, _, cursor = snapshot()
+                yield self.format_event(cursor, 'menu',
+                                        body.decode('utf-8'))
+            elif entries:
+                for entry in entries:
+                    yield self.format_event(*entry)
+                cursor = entries[-1][0]
+            elif not self.wait(cursor, self.heartbeat):
+                # Idle: let the snapshot pick up other workers' writes
+                # once its ttl is up, which publishes them here.
+                snapshot()
+                yield ': keep-alive\n\n'
+
+
+def new_boot_id():
+    return uuid.uuid4().hex[:12]
@@ -0,0 +1,423 @@
+# Shared module, copied into several projects. The original is in
+# projects/01_fyyur/starter_code/; edit it there and run
+# `python sync_shared.py` at the repo root to update the copies.
+'''
+Prometheus metrics for a Flask app.
+
+    metrics = Metrics(app, engine=db.engine)
+    metrics.watch_cache('fragments', fragment_cache)  # has stats() hits/misses
+    with metrics.timer('auth_verify_seconds', 'JWT verification time.'):
+        ...
+
+Code without a handle on the extension can use timed(...), which records
+through the current app's Metrics when it has one.
+
+GET /metrics returns the text exposition format: per-endpoint latency
+histograms, in-flight requests, connection pool usage, cache hits and
+misses, and any timers the app declares.
+
+Requests only touch counters owned by the current thread, so the hot path
+takes no lock; shards are summed when /metrics is scraped. When a thread (or
+greenlet) ends, its shard is folded into the process totals, so servers that
+start a thread per request do not grow a shard per request.
+
+Under a multi-process server set METRICS_DIR (config or environment) to a
+directory shared by the workers. Each worker writes its totals there every
+METRICS_FLUSH_SECONDS and /metrics sums the files of all workers, counting
+gauges of live workers only. Files left by workers that have exited (e.g.
+recycled after --max-requests) are merged into one metrics-exited.json.
+'''
+
+import glob
+import json
+import os
+import threading
+import time
+import weakref
+from bisect import bisect_left
+from contextlib import contextmanager
+
+from flask import Response, current_app, g, request
+
+try:
+    import fcntl
+except ImportError:
+    fcntl = None
+
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0,
+                   10.0)
+CONTENT_TYPE = 'text/plain; version=0.0.4; charset=utf-8'
+
+REQUEST_DURATION = 'http_request_duration_seconds'
+IN_FLIGHT = 'http_requests_in_flight'
+
+EXITED_FILE = 'metrics-exited.json'
+LOCK_FILE = 'metrics.lock'
+
+
+def metric_key(name, labels=()):
+    return json.dumps([name, sorted(labels)])
+
+
+class _Shard(object):
+    # Written only by its own thread.
+
+    def __init__(self):
+        self.histograms = {}
+        self.counters = {}
+        self.in_flight = 0
+
+
+class _ShardOwner(object):
+    # Kept in the thread-local next to the shard; it is dropped when the
+    # thread ends, which retires the shard.
+    pass
+
+
+class Metrics(object):
+
+    def __init__(self, app=None, engine=None, buckets=DEFAULT_BUCKETS):
+        self.buckets = tuple(buckets)
+        self.engine = engine
+        self.caches = {}
+        self.descriptions = {}
+        self.directory = None
+        self._flusher_forks = False
+        self._local = threading.local()
+        # Shards of threads that have ended are merged into _retired.
+        self._retired = _Shard()
+        self._shards = [self._retired]
+        self._shards_lock = threading.RLock()
+        self.describe(REQUEST_DURATION, 'histogram',
+                      'Request latency by endpoint, method and status.')
+        self.describe(IN_FLIGHT, 'gauge', 'Requests being handled.')
+        if app is not None:
+            self.init_app(app, engine)
+
+    def init_app(self, app, engine=None):
+        if engine is not None:
+            self.engine = engine
+        app.extensions['metrics'] = self
+        self.directory = app.config.get('METRICS_DIR') or \
+            os.environ.get('METRICS_DIR')
+        app.before_request(self._start_request)
+        app.after_request(self._record_status)
+        app.teardown_request(self._finish_request)
+        app.add_url_rule(app.config.get('METRICS_PATH', '/metrics'),
+                         'metrics', self.expose)
+        if self.directory:
+            os.makedirs(self.directory, exist_ok=True)
+            self._start_flusher(app.config.get('METRICS_FLUSH_SECONDS', 5))
+
+    # Recording.
+
+    def describe(self, name, kind, help=''):
+        self.descriptions.setdefault(name, (kind, help))
+
+    def _shard(self):
+        shard = getattr(self._local, 'shard', None)
+        if shard is None:
+            shard = self._local.shard = _Shard()
+            owner = self._local.owner = _ShardOwner()
+            with self._shards_lock:
+                self._shards.append(shard)
+            retire = weakref.finalize(owner, self._retire, shard)
+            retire.atexit = False
+        return shard
+
+    def _retire(self, shard):
+        with self._shards_lock:
+            _merge(self._retired.histograms, shard.histograms)
+            for key, value in shard.counters.items():
+                self._retired.counters[key] = \
+                    self._retired.counters.get(key, 0) + value
+            self._shards = [s for s in self._shards if s is not shard]
+
+    def observe(self, name, value, labels=()):
+        key = metric_key(name, labels)
+        histograms = self._shard().histograms
+        counts = histograms.get(key)
+        if counts is None:
+            # One slot per bucket plus +Inf, then the running sum.
+            counts = histograms[key] = [0] * (len(self.buckets) + 1) + [0.0]
+        counts[bisect_left(self.buckets, value)] += 1
+        counts[-1] += value
+
+    def inc(self, name, labels=(), amount=1):
+        key = metric_key(name, labels)
+        counters = self._shard().counters
+        counters[key] = counters.get(key, 0) + amount
+
+    @contextmanager
+    def timer(self, name, help='', labels=()):
+        self.describe(name, 'histogram', help)
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(name, time.perf_counter() - start, labels)
+
+    def watch_cache(self, name, cache):
+        '''
+        Reports cache.stats()['hits'] / ['misses'] as counters.
+        '''
+        self.describe('cache_hits_total', 'counter', 'Cache hits.')
+        self.describe('cache_misses_total', 'counter', 'Cache misses.')
+        self.describe('cache_hit_ratio', 'gauge', 'Hits over lookups.')
+        self.caches[name] = cache
+
+    def _start_request(self):
+        g.metrics_started = time.perf_counter()
+        g.metrics_status = 500
+        self._shard().in_flight += 1
+
+    def _record_status(self, response):
+        g.metrics_status = response.status_code
+        return response
+
+    def _finish_request(self, error=None):
+        started = g.pop('metrics_started', None)
+        if started is None:
+            return
+        self._shard().in_flight -= 1
+        # Unmatched URLs share one label so scanners cannot blow up the
+        # number of series.
+        self.observe(REQUEST_DURATION, time.perf_counter() - started, (
+            ('endpoint', request.endpoint or 'unmatched'),
+            ('method', request.method),
+            ('status', str(g.pop('metrics_status', 500)))))
+
+    # Collection.
+
+    def snapshot(self):
+        '''
+        This process's totals: {'histograms', 'counters', 'gauges'}, each
+        keyed by metric_key().
+        '''
+        histograms, counters = {}, {}
+        in_flight = 0
+        # Summed under the lock so a shard retiring meanwhile is not
+        # counted both on its own and in _retired.
+        with self._shards_lock:
+            for shard in self._shards:
+                in_flight += shard.in_flight
+                _merge(histograms, dict(shard.histograms))
+                for key, value in list(shard.counters.items()):
+                    counters[key] = counters.get(key, 0) + value
+
+        gauges = {metric_key(IN_FLIGHT): in_flight}
+        for name, cache in self.caches.items():
+            stats = cache.stats()
+            counters[metric_key('cache_hits_total', [('cache', name)])] = \
+                stats['hits']
+            counters[metric_key('cache_misses_total', [('cache', name)])] = \
+                stats['misses']
+        gauges.update(self._pool_gauges())
+        return {'histograms': histograms, 'counters': counters,
+                'gauges': gauges}
+
+    def _pool_gauges(self):
+        engine = self.engine() if callable(self.engine) else self.engine
+        if engine is None:
+            return {}
+        gauges = {}
+        for name, help in (('size', 'Connections the pool keeps open.'),
+                           ('checkedout', 'Connections in use.'),
+                           ('overflow', 'Connections opened beyond size.')):
+            method = getattr(engine.pool, name, None)
+            if method is not None:
+                metric = 'db_pool_' + name
+                self.describe(metric, 'gauge', help)
+                gauges[metric_key(metric)] = method()
+        return gauges
+
+    def _path(self, pid):
+        return os.path.join(self.directory, 'metrics-{}.json'.format(pid))
+
+    def flush(self):
+        path = self._path(os.getpid())
+        temporary = path + '.tmp'
+        with open(temporary, 'w') as f:
+            json.dump(self.snapshot(), f)
+        os.replace(temporary, path)
+
+    def _start_flusher(self, interval):
+        def run():
+            while True:
+                time.sleep(interval)
+                try:
+                    self.flush()
+                except OSError:
+                    pass
+        thread = threading.Thread(target=run, name='metrics-flush')
+        thread.daemon = True
+        thread.start()
+        if hasattr(os, 'register_at_fork') and not self._flusher_forks:
+            # Threads do not survive fork(), so workers forked from a
+            # preloaded app start their own.
+            self._flusher_forks = True
+            os.register_at_fork(
+                after_in_child=lambda: self._start_flusher(interval))
+
+    def collect(self):
+        '''
+        Totals over all workers when METRICS_DIR is set, else this process.
+        '''
+        if not self.directory:
+            return self.snapshot()
+        self.flush()
+        merged = {'histograms': {}, 'counters': {}, 'gauges': {}}
+        with self._directory_lock():
+            self._merge_exited()
+            for path in self._files():
+                snapshot = _read(path)
+                if snapshot is None:
+                    continue
+                _merge(merged['histograms'], snapshot['histograms'])
+                for key, value in snapshot['counters'].items():
+                    merged['counters'][key] = \
+                        merged['counters'].get(key, 0) + value
+                pid = _pid(path)
+                if pid is not None and _alive(pid):
+                    for key, value in snapshot['gauges'].items():
+                        merged['gauges'][key] = \
+                            merged['gauges'].get(key, 0) + value
+        return merged
+
+    def _files(self):
+        return glob.glob(os.path.join(self.directory, 'metrics-*.json'))
+
+    def _merge_exited(self):
+        '''
+        Folds the files of exited workers into EXITED_FILE, so the
+        directory stays as large as the number of live workers.
+        '''
+        exited = [path for path in self._files()
+                  if _pid(path) is not None and not _alive(_pid(path))]
+        if not exited:
+            return
+        path = os.path.join(self.directory, EXITED_FILE)
+        totals = _read(path) or {'histograms': {}, 'counters': {},
+                                 'gauges': {}}
+        for dead in exited:
+            snapshot = _read(dead)
+            if snapshot is None:
+                continue
+            _merge(totals['histograms'], snapshot['histograms'])
+            for key, value in snapshot['counters'].items():
+                totals['counters'][key] = totals['counters'].get(key, 0) + value
+        temporary = path + '.tmp'
+        with open(temporary, 'w') as f:
+            json.dump(totals, f)
+        os.replace(temporary, path)
+        for dead in exited:
+            try:
+                os.remove(dead)
+            except OSError:
+                pass
+
+    @contextmanager
+    def _directory_lock(self):
+        # Serializes collect() across workers, so two scrapes never merge
+        # the same exited worker twice.
+        if fcntl is None:
+            yield
+            return
+        with open(os.path.join(self.directory, LOCK_FILE), 'a') as f:
+            fcntl.flock(f, fcntl.LOCK_EX)
+            try:
+                yield
+            finally:
+                fcntl.flock(f, fcntl.LOCK_UN)
+
+    # Exposition.
+
+    def expose(self):
+        return Response(self.render(self.collect()), content_type=CONTENT_TYPE)
+
+    def render(self, collected):
+        samples = {}
+        for key, value in collected['counters'].items():
+            name, labels = json.loads(key)
+            samples.setdefault(name, []).append((name, labels, value))
+        for key, value in collected['gauges'].items():
+            name, labels = json.loads(key)
+            samples.setdefault(name, []).append((name, labels, value))
+        for key, counts in collected['histograms'].items():
+            name, labels = json.loads(key)
+            series = samples.setdefault(name, [])
+            cumulative = 0
+            bounds = [repr(float(b)) for b in self.buckets] + ['+Inf']
+            for bound, count in zip(bounds, counts):
+                cumulative += count
+                series.append((name + '_bucket', labels + [['le', bound]],
+                               cumulative))
+            series.append((name + '_sum', labels, counts[-1]))
+            series.append((name + '_count', labels, cumulative))
+        for cache in sorted(self.caches):
+            labels = [['cache', cache]]
+            hits = collected['counters'].get(
+                metric_key('cache_hits_total', labels), 0)
+            misses = collected['counters'].get(
+                metric_key('cache_misses_total', labels), 0)
+            samples.setdefault('cache_hit_ratio', []).append((
+                'cache_hit_ratio', labels,
+                hits / float(hits + misses) if hits + misses else 0.0))
+
+        lines = []
+        for name in sorted(samples):
+            kind, help = self.descriptions.get(name, ('untyped', ''))
+            lines.append('# HELP {} {}'.format(name, help))
+            lines.append('# TYPE {} {}'.format(name, kind))
+            for sample, labels, value in samples[name]:
+                lines.append('{}{} {}'.format(sample, _labels(labels), value))
+        return '\n'.join(lines) + '\n'
+
+
+@contextmanager
+def timed(name, help='', labels=()):
+    metrics = current_app.extensions.get('metrics') if current_app else None
+    if metrics is None:
+        yield
+        return
+    with metrics.timer(name, help, labels):
+        yield
+
+
+def _labels(labels):
+    if not labels:
+        return ''
+    return '{' + ','.join('{}="{}"'.format(
+        key, str(value).replace('\\', '\\\\').replace('"', '\\"'))
+        for key, value in labels) + '}'
+
+
+def _merge(totals, histograms):
+    for key, counts in histograms.items():
+        merged = totals.setdefault(key, [0] * len(counts))
+        for i, count in enumerate(counts):
+            merged[i] += count
+
+
+def _read(path):
+    try:
+        with open(path) as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return None
+
+
+def _pid(path):
+    # The worker pid of a metrics-<pid>.json file; None for EXITED_FILE.
+    name = os.path.basename(path)[len('metrics-'):-len('.json')]
+    return int(name) if name.isdigit() else None
+
+
+def _alive(pid):
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        return True
+    return True
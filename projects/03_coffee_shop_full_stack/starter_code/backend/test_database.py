@@ -0,0 +1,97 @@
+import glob
+import json
+import os
+import shutil
+import tempfile
+import unittest
+from unittest import mock
+
+from flask import Flask
+
+from src.database import models
+from src.database.models import SQLITE_PRAGMAS, Drink, db, setup_db
+from src.database.reseed import reseed
+
+
+class DatabaseTestCase(unittest.TestCase):
+    """Tests setup_db against a SQLite file of its own"""
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.directory)
+        self.path = os.path.join(self.directory, 'database.db')
+        self.app = Flask(__name__)
+        with mock.patch.object(models, 'database_path',
+                               'sqlite:///' + self.path):
+            setup_db(self.app)
+        self.engine = db.get_engine(self.app)
+        self.addCleanup(self.engine.dispose)
+        with self.app.app_context():
+            db.create_all()
+
+    """ Test every pooled connection gets the performance pragmas """
+
+    def test_pragmas(self):
+        expected = {'journal_mode': 'wal', 'synchronous': 1,
+                    'busy_timeout': 5000, 'cache_size': -16000,
+                    'mmap_size': 268435456, 'temp_store': 2}
+        self.assertEqual(set(expected), set(name for name, _ in SQLITE_PRAGMAS))
+        connections = [self.engine.connect() for _ in range(2)]
+        try:
+            for connection in connections:
+                for name, value in expected.items():
+                    self.assertEqual(value, connection.execute(
+                        'PRAGMA {}'.format(name)).scalar(), name)
+        finally:
+            for connection in connections:
+                connection.close()
+
+    def fixture(self, *titles):
+        path = os.path.join(self.directory, 'drinks.ndjson')
+        with open(path, 'w') as f:
+            for title in titles:
+                f.write(json.dumps({'title': title, 'recipe': [
+                    {'name': title, 'color': 'blue', 'parts': 1}]}) + '\n')
+        return path
+
+    def titles(self):
+        with self.app.app_context():
+            titles = sorted(drink.title for drink in Drink.query)
+            db.session.remove()
+        return titles
+
+    """ Test reseed swaps the symlink and running pools follow it """
+
+    def test_reseed(self):
+        first = reseed(self.fixture('water', 'latte'), self.path)
+        self.assertTrue(os.path.islink(self.path))
+        self.assertEqual(first, os.path.realpath(self.path))
+        self.assertEqual(['latte', 'water'], self.titles())
+
+        second = reseed(self.fixture('mocha'), self.path)
+        self.assertEqual(second, os.path.realpath(self.path))
+        # The pooled connection to the first file is replaced at checkout.
+        self.assertEqual(['mocha'], self.titles())
+        self.assertEqual([], glob.glob(os.path.join(self.directory, '.*')))
+
+        third = reseed(self.fixture('tea'), self.path)
+        self.assertEqual(['tea'], self.titles())
+        # keep=1: the previous generation stays for readers, older go.
+        self.assertEqual([second, third], sorted(
+            glob.glob(os.path.join(self.directory, 'database-*.db'))))
+
+    """ Test a bad fixture leaves the current database in place """
+
+    def test_reseed_bad_fixture(self):
+        reseed(self.fixture('water'), self.path)
+        source = os.path.join(self.directory, 'bad.ndjson')
+        with open(source, 'w') as f:
+            f.write('{"title": "tea"}\n')
+        with self.assertRaises(ValueError):
+            reseed(source, self.path)
+        self.assertEqual(['water'], self.titles())
+
+
+# Make the tests conveniently executable
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,176 @@
+import json
+import os
+import shutil
+import tempfile
+import threading
+import time
+import unittest
+from unittest import mock
+
+from sqlalchemy import create_engine
+
+from src.database.models import Drink
+from src.menu import ChangeFeed, MenuSnapshot
+
+RECIPE = json.dumps([{'color': 'blue', 'name': 'water', 'parts': 1}])
+
+
+class MenuSnapshotTestCase(unittest.TestCase):
+    """Tests the prebuilt GET /drinks body against its own SQLite file"""
+
+    def setUp(self):
+        directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, directory)
+        self.engine = create_engine(
+            'sqlite:///' + os.path.join(directory, 'menu.db'))
+        self.addCleanup(self.engine.dispose)
+        Drink.__table__.create(self.engine)
+        self.add_drink('water')
+        self.feed = ChangeFeed()
+        self.menu = MenuSnapshot(self.engine, self.feed, ttl=3600)
+
+    def add_drink(self, title):
+        # Written straight to the table, as another worker would.
+        self.engine.execute(Drink.__table__.insert(), title=title,
+                            recipe=RECIPE)
+
+    """ Test the body and ETag only change with the menu """
+
+    def test_etag(self):
+        body, etag, _ = self.menu.get()
+        self.assertEqual(['water'], [drink['title'] for drink in
+                                     json.loads(body)['drinks']])
+        self.assertEqual(etag, self.menu.rebuild()[1])
+
+        self.add_drink('milk')
+        body, changed, _ = self.menu.rebuild()
+        self.assertNotEqual(etag, changed)
+        self.assertEqual(2, len(json.loads(body)['drinks']))
+
+    """ Test other writers show up once the ttl is up """
+
+    def test_ttl(self):
+        first = self.menu.get()
+        self.add_drink('milk')
+        self.assertIs(first, self.menu.get())
+
+        self.menu.ttl = 0
+        body, _, event_id = self.menu.get()
+        self.assertEqual(2, len(json.loads(body)['drinks']))
+        self.assertEqual(self.feed.last_id, event_id)
+
+    """ Test concurrent first requests share one build """
+
+    def test_concurrent_first_build(self):
+        reads = []
+        connect = self.engine.connect
+
+        def slow_connect():
+            reads.append(1)
+            time.sleep(0.05)
+            return connect()
+
+        self.engine.connect = slow_connect
+        results, errors = [], []
+
+        def get():
+            try:
+                results.append(self.menu.get())
+            except Exception as error:
+                errors.append(error)
+
+        threads = [threading.Thread(target=get) for _ in range(10)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        self.assertEqual([], errors)
+        self.assertEqual(1, len(reads))
+        self.assertEqual(1, len(set(id(result) for result in results)))
+
+    """ Test a reader racing the first build never sees half of it """
+
+    def test_read_during_first_build(self):
+        errors = []
+
+        def get():
+            try:
+                self.menu.get()
+            except Exception as error:
+                errors.append(error)
+
+        def clock():
+            # Called by the build as it stamps the snapshot: read it from
+            # another thread at exactly that point.
+            if not errors and not hasattr(clock, 'raced'):
+                clock.raced = True
+                reader = threading.Thread(target=get)
+                reader.start()
+                reader.join(0.2)
+            return real_time()
+
+        real_time = time.time
+        with mock.patch('src.menu.time', mock.Mock(time=clock)):
+            self.menu.get()
+        self.assertEqual([], errors)
+
+
+
+class ChangeFeedTestCase(unittest.TestCase):
+    """Tests Last-Event-ID resume on the menu event stream"""
+
+    def setUp(self):
+        self.feed = ChangeFeed(size=3, heartbeat=0.01)
+
+    def snapshot(self):
+        return b'{"drinks":[]}', 'etag', self.feed.last_id
+
+    def first_event(self, last_event_id):
+        stream = self.feed.stream(
+            self.feed.parse_event_id(last_event_id), self.snapshot)
+        self.assertEqual('retry: 3000\n\n', next(stream))
+        return next(stream)
+
+    """ Test a client is replayed what it missed from this process """
+
+    def test_resume(self):
+        self.feed.publish('changes', [{'op': 'delete', 'id': 1}])
+        self.feed.publish('changes', [{'op': 'delete', 'id': 2}])
+
+        event = self.first_event('{}.1'.format(self.feed.boot))
+        self.assertEqual('id: {}.2\nevent: changes\n'
+                         'data: [{{"op":"delete","id":2}}]\n\n'.format(
+                             self.feed.boot), event)
+
+    """ Test unknown, foreign and dropped ids get the full menu """
+
+    def test_full_menu(self):
+        for _ in range(5):
+            self.feed.publish('changes', [])
+        menu = 'id: {}.5\nevent: menu\n'.format(self.feed.boot)
+        for last_event_id in (None, 'garbage', '1', 'other.4',
+                              '{}.1'.format(self.feed.boot),
+                              '{}.9'.format(self.feed.boot)):
+            self.assertTrue(self.first_event(last_event_id).startswith(menu),
+                            last_event_id)
+
+    """ Test a forked worker draws a boot id of its own """
+
+    @unittest.skipUnless(hasattr(os, 'fork'), 'needs fork()')
+    def test_fork(self):
+        read, write = os.pipe()
+        pid = os.fork()
+        if pid == 0:
+            os.write(write, self.feed.boot.encode('ascii'))
+            os._exit(0)
+        os.waitpid(pid, 0)
+        child_boot = os.read(read, 64).decode('ascii')
+        os.close(read)
+        os.close(write)
+        self.assertTrue(child_boot)
+        self.assertNotEqual(self.feed.boot, child_boot)
+
+# Make the tests conveniently executable
+if __name__ == "__main__":
+    unittest.main()
@@ -1,27 +1,139 @@
-import os
-from flask import Flask
-from models import setup_db
+from flask import Flask, request, abort, jsonify
+from flask_cors import CORS
+import click
+from models import setup_db, upgrade_db, db, Person
+from settings import load_settings, reload_on_sighup
+
+PEOPLE_PER_PAGE = 50
+MAX_PEOPLE_PER_PAGE = 500
+MAX_PEOPLE_PER_POST = 1000
 
 def create_app(test_config=None):
 
     app = Flask(__name__)
-    setup_db(app)
+    # Fails here, at boot, when a variable is missing or invalid.
+    app.config['SETTINGS'] = load_settings(test_config=test_config)
+    setup_db(app, app.config['SETTINGS'].database_url)
     CORS(app)
+    reload_on_sighup(app, test_config)
+
+    '''
+    flask upgrade-db
+        creates the tables and adds what older deploys lack (see
+        models.upgrade_people); run once per deploy, not at worker boot
+    '''
+    @app.cli.command('upgrade-db')
+    def upgrade_db_command():
+        upgrade_db()
+        click.echo('Database is up to date')
 
     @app.route('/')
     def get_greeting():
-        excited = os.environ['EXCITED']
-        greeting = "Hello" 
-        if excited == 'true': greeting = greeting + "!!!!!"
-        return greeting
+        return app.config['SETTINGS'].greeting
 
     @app.route('/coolkids')
     def be_cool():
         return "Be cool, man, be coooool! You're almost a FSND grad!"
 
+    '''
+    GET /people?limit=&after=&name=&fields=
+        a page of people ordered by id, or by name when `name` is given to
+        match a name prefix; `next` is the `after` value for the following
+        page, null on the last one; `fields` (e.g. id,name) selects only
+        those columns
+    '''
+    @app.route('/people')
+    def get_people():
+        limit = request.args.get('limit', PEOPLE_PER_PAGE, type=int)
+        if not 1 <= limit <= MAX_PEOPLE_PER_PAGE:
+            abort(400, 'limit must be between 1 and {}'.format(
+                MAX_PEOPLE_PER_PAGE))
+        fields = Person.FIELDS
+        if request.args.get('fields'):
+            fields = tuple(request.args['fields'].split(','))
+            unknown = set(fields) - set(Person.FIELDS)
+            if unknown:
+                abort(400, 'unknown fields: {}'.format(
+                    ', '.join(sorted(unknown))))
+        try:
+            people, next_cursor = Person.page(
+                after=request.args.get('after'), limit=limit,
+                prefix=request.args.get('name'), fields=fields)
+        except ValueError as error:
+            abort(400, str(error))
+        return jsonify({
+            'success': True,
+            'people': people,
+            'next': next_cursor
+        })
+
+    @app.route('/people/<int:person_id>')
+    def get_person(person_id):
+        person = Person.query.get_or_404(person_id)
+        return jsonify({'success': True, 'person': person.format()})
+
+    '''
+    POST /people
+        creates one person ({"name": ..., "catchphrase": ...}) or, given a
+        list, up to MAX_PEOPLE_PER_POST of them in one bulk insert
+    '''
+    @app.route('/people', methods=['POST'])
+    def create_people():
+        body = request.get_json(silent=True)
+        people = body if isinstance(body, list) else [body]
+        if not people or len(people) > MAX_PEOPLE_PER_POST:
+            abort(400, 'post 1 to {} people'.format(MAX_PEOPLE_PER_POST))
+        if not all(isinstance(person, dict) and
+                   isinstance(person.get('name'), str) and person['name']
+                   for person in people):
+            abort(422, 'every person needs a name')
+        if not all(isinstance(person.get('catchphrase', ''), str)
+                   for person in people):
+            abort(422, 'catchphrase must be a string')
+
+        if isinstance(body, list):
+            Person.insert_many(people)
+            return jsonify({'success': True, 'created': len(people)}), 201
+        person = Person(body['name'], body.get('catchphrase', ''))
+        db.session.add(person)
+        db.session.commit()
+        return jsonify({'success': True, 'person': person.format()}), 201
+
+    @app.route('/people/<int:person_id>', methods=['PATCH'])
+    def update_person(person_id):
+        person = Person.query.get_or_404(person_id)
+        body = request.get_json(silent=True) or {}
+        if 'name' in body:
+            if not isinstance(body['name'], str) or not body['name']:
+                abort(422, 'name must be a non-empty string')
+            person.name = body['name']
+        if 'catchphrase' in body:
+            if not isinstance(body['catchphrase'], str):
+                abort(422, 'catchphrase must be a string')
+            person.catchphrase = body['catchphrase']
+        db.session.commit()
+        return jsonify({'success': True, 'person': person.format()})
+
+    @app.route('/people/<int:person_id>', methods=['DELETE'])
+    def delete_person(person_id):
+        person = Person.query.get_or_404(person_id)
+        db.session.delete(person)
+        db.session.commit()
+        return jsonify({'success': True, 'deleted': person_id})
+
+    def error_response(error):
+        return jsonify({
+            'success': False,
+            'error': error.code,
+            'message': error.description
+        }), error.code
+
+    for code in (400, 404, 405, 422):
+        app.register_error_handler(code, error_response)
+
     return app
 
 app = create_app()
 
 if __name__ == '__main__':
-    app.run()
\ No newline at end of file
+    app.run()
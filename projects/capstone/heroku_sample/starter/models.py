@@ -1,34 +1,78 @@
-from sqlalchemy import Column, String, create_engine
+from sqlalchemy import Column, String, Integer, Index, create_engine, \
+  inspect, tuple_
 from flask_sqlalchemy import SQLAlchemy
+import base64
 import json
-
-database_path = os.environ['DATABASE_URL']
+import logging
 
 db = SQLAlchemy()
+log = logging.getLogger(__name__)
 
 '''
-setup_db(app)
+setup_db(app, database_path)
     binds a flask application and a SQLAlchemy service
+    database_path comes from the app's settings (DATABASE_URL)
+
+    No DDL runs here, since every worker calls this at boot; create or
+    upgrade the tables once per deploy with `flask upgrade-db`.
 '''
-def setup_db(app, database_path=database_path):
+def setup_db(app, database_path):
     app.config["SQLALCHEMY_DATABASE_URI"] = database_path
     app.config["SQLALCHEMY_TRACK_MODIFICATIONS"] = False
     db.app = app
     db.init_app(app)
+
+
+'''
+upgrade_db()
+    creates missing tables and brings existing ones up to date; run once,
+    e.g. in the Heroku release phase, not by each worker
+'''
+def upgrade_db():
     db.create_all()
+    upgrade_people(db.engine)
+
+
+'''
+upgrade_people(engine)
+    brings a People table made by an older version up to date
+
+    create_all() only creates missing tables, so an existing table would
+    lack ix_people_name_id, and name searches would scan it. The index is
+    added here. NOT NULL on name is not: rows without a name must be fixed
+    first, then run
+        ALTER TABLE "People" ALTER COLUMN name SET NOT NULL
+    (Postgres). A warning is logged until then.
+'''
+def upgrade_people(engine):
+  inspector = inspect(engine)
+  table = Person.__table__
+  indexes = set(index['name'] for index in inspector.get_indexes(table.name))
+  for index in table.indexes:
+    if index.name not in indexes:
+      log.info('creating index %s', index.name)
+      index.create(engine)
+  for column in inspector.get_columns(table.name):
+    if column['name'] == 'name' and column['nullable']:
+      log.warning('People.name allows NULL; see upgrade_people()')
 
 
 '''
 Person
-Have title and release year
+Have a name and a catchphrase
 '''
 class Person(db.Model):  
   __tablename__ = 'People'
+  # Serves name-prefix searches and their (name, id) keyset order in one
+  # index range scan.
+  __table_args__ = (Index('ix_people_name_id', 'name', 'id'),)
 
   id = Column(Integer, primary_key=True)
-  name = Column(String)
+  name = Column(String, nullable=False)
   catchphrase = Column(String)
 
+  FIELDS = ('id', 'name', 'catchphrase')
+
   def __init__(self, name, catchphrase=""):
     self.name = name
     self.catchphrase = catchphrase
@@ -37,4 +81,89 @@ class Person(db.Model):
     return {
       'id': self.id,
       'name': self.name,
-      'catchphrase': self.catchphrase}
\ No newline at end of file
+      'catchphrase': self.catchphrase}
+
+  '''
+  page(after, limit, prefix, fields)
+    one page of people as (rows, next cursor or None)
+
+    Pages are read by keyset, not OFFSET: by id, or by (name, id) when
+    searching by name prefix, continuing after the opaque `after` cursor of
+    the previous page, so every page costs the same however deep it is.
+    Only the columns in `fields` are selected. The prefix is matched case
+    sensitively as the range [prefix, next prefix); on Postgres give the
+    column the "C" collation for exact prefix semantics.
+  '''
+  @classmethod
+  def page(cls, after=None, limit=50, prefix=None, fields=FIELDS):
+    table = cls.__table__
+    key = [table.c.name, table.c.id] if prefix else [table.c.id]
+    selected = [table.c[name] for name in fields]
+    columns = selected + [c for c in key if c.name not in fields]
+    query = db.session.query(*columns).order_by(*key)
+
+    cursor = decode_cursor(after) if after else None
+    if cursor is not None and [type(value) for value in cursor] != \
+        ([str, int] if prefix else [int]):
+      raise ValueError('cursor is from a different search')
+    if prefix:
+      query = query.filter(table.c.name >= (cursor[0] if cursor else prefix))
+      upper = prefix_upper_bound(prefix)
+      if upper is not None:
+        query = query.filter(table.c.name < upper)
+      query = query.filter(table.c.name.startswith(prefix, autoescape=True))
+      if cursor:
+        query = query.filter(tuple_(*key) > tuple(cursor))
+    elif cursor:
+      query = query.filter(table.c.id > cursor[0])
+
+    rows = query.limit(limit + 1).all()
+    next_cursor = None
+    if len(rows) > limit:
+      rows = rows[:limit]
+      last = rows[-1]
+      next_cursor = encode_cursor([getattr(last, c.name) for c in key])
+    return [dict((name, getattr(row, name)) for name in fields)
+            for row in rows], next_cursor
+
+  '''
+  insert_many(people)
+    bulk inserts [{'name': ..., 'catchphrase': ...}] in one executemany
+  '''
+  @classmethod
+  def insert_many(cls, people):
+    db.session.execute(cls.__table__.insert(), [
+      {'name': person['name'], 'catchphrase': person.get('catchphrase', '')}
+      for person in people])
+    db.session.commit()
+
+
+def prefix_upper_bound(prefix):
+  # The smallest string greater than every string starting with prefix.
+  while prefix and prefix[-1] == chr(0x10ffff):
+    prefix = prefix[:-1]
+  if not prefix:
+    return None
+  return prefix[:-1] + chr(ord(prefix[-1]) + 1)
+
+
+def encode_cursor(values):
+  return base64.urlsafe_b64encode(
+    json.dumps(values, separators=(',', ':')).encode('utf-8')).decode('ascii')
+
+
+def decode_cursor(cursor):
+  '''
+  The key values in a cursor; ValueError when it was not made by
+  encode_cursor().
+  '''
+  try:
+    values = json.loads(base64.urlsafe_b64decode(cursor.encode('ascii')))
+  except (TypeError, ValueError, UnicodeError) as error:
+    raise ValueError('invalid cursor: {}'.format(error))
+  # type() rather than isinstance(): True and False are ints too.
+  if not isinstance(values, list) or not values or \
+      type(values[-1]) is not int or \
+      any(type(value) not in (int, str) for value in values):
+    raise ValueError('invalid cursor')
+  return values
@@ -0,0 +1,126 @@
+import logging
+import os
+import signal
+import threading
+from collections import namedtuple
+
+log = logging.getLogger(__name__)
+
+'''
+Settings
+    the app's configuration, read and validated once when the app is
+    created instead of looked up in os.environ on every request
+
+    Values come from the environment, then SETTINGS_FILE (KEY=VALUE lines)
+    when it is set, then the app factory's test_config. Derived values such
+    as the greeting are computed here, so handlers only read attributes.
+'''
+Settings = namedtuple('Settings', ['database_url', 'excited', 'greeting'])
+
+REQUIRED = object()
+
+
+class SettingsError(Exception):
+    pass
+
+
+def parse_boolean(value):
+    if isinstance(value, bool):
+        return value
+    lowered = value.strip().lower()
+    if lowered in ('true', '1', 'yes', 'on'):
+        return True
+    if lowered in ('false', '0', 'no', 'off', ''):
+        return False
+    raise ValueError('expected true or false, got {!r}'.format(value))
+
+
+# (environment variable, parser, default)
+FIELDS = (
+    ('DATABASE_URL', str, REQUIRED),
+    ('EXCITED', parse_boolean, 'false'),
+)
+
+# Fields that take effect only when the app is created; a reload keeps them.
+RESTART_ONLY = ('database_url',)
+
+
+def read_settings_file(path):
+    values = {}
+    with open(path) as f:
+        for number, line in enumerate(f, 1):
+            line = line.strip()
+            if not line or line.startswith('#'):
+                continue
+            key, equals, value = line.partition('=')
+            if not equals:
+                raise SettingsError('{}:{}: expected KEY=VALUE'.format(
+                    path, number))
+            values[key.strip()] = value.strip().strip('"\'')
+    return values
+
+
+'''
+load_settings(environ, test_config)
+    builds Settings, raising SettingsError that names every missing or
+    invalid variable at once
+'''
+def load_settings(environ=None, test_config=None):
+    values = dict(os.environ if environ is None else environ)
+    if values.get('SETTINGS_FILE'):
+        try:
+            values.update(read_settings_file(values['SETTINGS_FILE']))
+        except OSError as error:
+            raise SettingsError('cannot read SETTINGS_FILE: {}'.format(error))
+    values.update(test_config or {})
+
+    parsed, problems = {}, []
+    for name, parser, default in FIELDS:
+        value = values.get(name, default)
+        if value is REQUIRED:
+            problems.append('{} is not set'.format(name))
+            continue
+        try:
+            parsed[name.lower()] = parser(value)
+        except ValueError as error:
+            problems.append('{}: {}'.format(name, error))
+    if problems:
+        raise SettingsError('invalid settings: ' + '; '.join(problems))
+
+    greeting = 'Hello' + ('!!!!!' if parsed['excited'] else '')
+    return Settings(greeting=greeting, **parsed)
+
+
+'''
+reload_on_sighup(app, test_config)
+    re-reads the settings into app.config['SETTINGS'] on SIGHUP
+
+    A process's environment cannot change from outside, so this is for
+    values in SETTINGS_FILE. Invalid settings are logged and the current
+    ones kept. Only installed from the main thread and when nothing else
+    (e.g. a gunicorn master) handles SIGHUP.
+'''
+def reload_on_sighup(app, test_config=None):
+    if not hasattr(signal, 'SIGHUP') or \
+            threading.current_thread() is not threading.main_thread() or \
+            signal.getsignal(signal.SIGHUP) != signal.SIG_DFL:
+        return False
+
+    def reload(signum, frame):
+        current = app.config['SETTINGS']
+        try:
+            settings = load_settings(test_config=test_config)
+        except SettingsError as error:
+            log.error('keeping current settings: %s', error)
+            return
+        changed = [field for field in RESTART_ONLY
+                   if getattr(settings, field) != getattr(current, field)]
+        if changed:
+            log.warning('%s changed; restart to apply', ', '.join(changed))
+            settings = settings._replace(
+                **dict((field, getattr(current, field)) for field in changed))
+        app.config['SETTINGS'] = settings
+        log.info('settings reloaded')
+
+    signal.signal(signal.SIGHUP, reload)
+    return True
@@ -0,0 +1,129 @@
+import base64
+import json
+import os
+import shutil
+import tempfile
+import unittest
+
+# `import app` builds the module-level app, which needs a database URL.
+os.environ.setdefault('DATABASE_URL', 'sqlite://')
+
+from app import create_app
+from models import db, decode_cursor, encode_cursor, upgrade_db, Person
+from settings import SettingsError, load_settings
+
+
+class PeopleTestCase(unittest.TestCase):
+    """Tests the keyset-paginated /people API on SQLite"""
+
+    def setUp(self):
+        directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, directory)
+        self.app = create_app({'DATABASE_URL': 'sqlite:///' + os.path.join(
+            directory, 'people.db')})
+        self.client = self.app.test_client()
+        with self.app.app_context():
+            upgrade_db()
+            Person.insert_many([{'name': name, 'catchphrase': 'Hi'}
+                                for name in ('Abe', 'Abby', 'Bob', 'Ada',
+                                             'Al', 'Carl', 'Abel')])
+        self.addCleanup(self.dispose)
+
+    def dispose(self):
+        with self.app.app_context():
+            db.session.remove()
+            db.engine.dispose()
+
+    def pages(self, query):
+        names, after = [], None
+        while True:
+            url = '/people?' + query + ('&after=' + after if after else '')
+            body = self.client.get(url).get_json()
+            self.assertTrue(body['success'])
+            names.append([person['name'] for person in body['people']])
+            after = body['next']
+            if after is None:
+                return names
+
+    """ Test paging by id and by name prefix visits every row once """
+
+    def test_paging(self):
+        self.assertEqual([['Abe', 'Abby', 'Bob'], ['Ada', 'Al', 'Carl'],
+                          ['Abel']], self.pages('limit=3'))
+        self.assertEqual([['Abby', 'Abe'], ['Abel']],
+                         self.pages('limit=2&name=Ab'))
+        body = self.client.get('/people?limit=1&fields=id,name').get_json()
+        self.assertEqual([{'id': 1, 'name': 'Abe'}], body['people'])
+
+    """ Test malformed or mismatched cursors get 400, never 500 """
+
+    def test_bad_cursor(self):
+        def raw(values):
+            return base64.urlsafe_b64encode(
+                json.dumps(values).encode('utf-8')).decode('ascii')
+
+        for query in ('after=!!!', 'after=' + raw({'id': 1}),
+                      'after=' + raw([]), 'after=' + raw([True]),
+                      'after=' + raw(['Ab']), 'after=' + raw([1.5]),
+                      'after=' + raw([None, 1]),
+                      'name=Ab&after=' + raw([1]),
+                      'name=Ab&after=' + raw([2, 1]),
+                      'name=Ab&after=' + raw(['Ab', False]),
+                      'name=Ab&after=' + raw([['Ab'], 1]),
+                      'after=' + encode_cursor(['Abe', 1]),
+                      'limit=0', 'fields=id,secret'):
+            response = self.client.get('/people?' + query)
+            self.assertEqual(400, response.status_code, query)
+            self.assertFalse(response.get_json()['success'])
+
+    def test_cursor_round_trip(self):
+        self.assertEqual(['Abe', 7], decode_cursor(encode_cursor(['Abe', 7])))
+
+    """ Test catchphrases must be strings """
+
+    def test_catchphrase(self):
+        for body in ({'name': 'Dee', 'catchphrase': 5},
+                     [{'name': 'Dee', 'catchphrase': None}]):
+            self.assertEqual(422, self.client.post(
+                '/people', json=body).status_code)
+        self.assertEqual(422, self.client.patch(
+            '/people/1', json={'catchphrase': ['Hi']}).status_code)
+        self.assertEqual(201, self.client.post(
+            '/people', json={'name': 'Dee'}).status_code)
+
+
+class SettingsTestCase(unittest.TestCase):
+    """Tests settings are read and validated once"""
+
+    def test_defaults(self):
+        settings = load_settings({'DATABASE_URL': 'sqlite://'})
+        self.assertEqual('sqlite://', settings.database_url)
+        self.assertFalse(settings.excited)
+        self.assertEqual('Hello', settings.greeting)
+
+    def test_excited(self):
+        settings = load_settings({'DATABASE_URL': 'sqlite://',
+                                  'EXCITED': 'yes'})
+        self.assertEqual('Hello!!!!!', settings.greeting)
+
+    def test_problems_are_listed_together(self):
+        with self.assertRaises(SettingsError) as raised:
+            load_settings({'EXCITED': 'maybe'})
+        message = str(raised.exception)
+        self.assertIn('DATABASE_URL is not set', message)
+        self.assertIn('EXCITED', message)
+
+    def test_settings_file(self):
+        directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, directory)
+        path = os.path.join(directory, 'settings.env')
+        with open(path, 'w') as f:
+            f.write('# comment\nEXCITED="true"\n')
+        settings = load_settings({'DATABASE_URL': 'sqlite://',
+                                  'SETTINGS_FILE': path})
+        self.assertTrue(settings.excited)
+
+
+# Make the tests conveniently executable
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,111 @@
+# Shared module, copied into several projects. The original is in
+# projects/02_trivia_api/starter/backend/; edit it there and run
+# `python sync_shared.py` at the repo root to update the copies.
+'''
+Cold-start measurements for an app factory.
+
+    $ python bench_startup.py 'flaskr:create_app()' --path /categories
+    $ python bench_startup.py app:APP --path /metrics
+
+Starts a fresh interpreter `runs` times and reports the median time to
+import the app module, to run the factory, and to answer a first request
+to `path` through the test client, plus the slowest imports as reported by
+`python -X importtime`.
+
+import_time() is also what the import-time regression test uses.
+'''
+
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+import time
+
+CHILD = '''
+import importlib, json, sys, time
+started = time.perf_counter()
+module_name, _, name = sys.argv[1].partition(':')
+module = importlib.import_module(module_name)
+imported = time.perf_counter()
+app = getattr(module, name[:-2])() if name.endswith('()') else \\
+    getattr(module, name or 'app')
+created = time.perf_counter()
+status = app.test_client().get(sys.argv[2]).status_code
+answered = time.perf_counter()
+print(json.dumps({'import': imported - started, 'create_app': created - imported,
+                  'first_response': answered - created, 'status': status}))
+'''
+
+
+def import_time(module, runs=3):
+    '''
+    (total microseconds, {module: cumulative microseconds}) for importing
+    `module` in a fresh interpreter, from the fastest of `runs` runs.
+    '''
+    best = None
+    for _ in range(runs):
+        result = subprocess.run(
+            [sys.executable, '-X', 'importtime', '-c',
+             'import ' + module], stderr=subprocess.PIPE,
+            universal_newlines=True, cwd=os.path.dirname(
+                os.path.abspath(__file__)))
+        if result.returncode:
+            raise RuntimeError('importing {} failed:\n{}'.format(
+                module, result.stderr))
+        modules = {}
+        for line in result.stderr.splitlines():
+            if not line.startswith('import time:') or '|' not in line:
+                continue
+            _, cumulative, name = line[len('import time:'):].split('|')
+            if cumulative.strip().isdigit():
+                modules[name.strip()] = int(cumulative)
+        total = modules[module]
+        if best is None or total < best[0]:
+            best = (total, modules)
+    return best
+
+
+def slowest(modules, limit=10):
+    return sorted(modules.items(), key=lambda item: -item[1])[:limit]
+
+
+def startup(target, path, runs=5):
+    samples = []
+    for _ in range(runs):
+        launched = time.perf_counter()
+        output = subprocess.check_output(
+            [sys.executable, '-c', CHILD, target, path],
+            cwd=os.path.dirname(os.path.abspath(__file__)),
+            universal_newlines=True)
+        sample = json.loads(output.strip().splitlines()[-1])
+        sample['total'] = time.perf_counter() - launched
+        samples.append(sample)
+    return samples
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split('\n\n')[0])
+    parser.add_argument('target', help='"module:app" or '
+                        '"module:create_app()"')
+    parser.add_argument('--path', default='/')
+    parser.add_argument('--runs', type=int, default=5)
+    args = parser.parse_args()
+
+    samples = startup(args.target, args.path, args.runs)
+    print('{} -> GET {} ({})'.format(args.target, args.path,
+                                     samples[-1]['status']))
+    for phase in ('import', 'create_app', 'first_response', 'total'):
+        print('  {:15} {:7.1f} ms'.format(phase, statistics.median(
+            sample[phase] for sample in samples) * 1000))
+
+    module = args.target.partition(':')[0]
+    total, modules = import_time(module)
+    print('import {}: {:.1f} ms, slowest:'.format(module, total / 1000.0))
+    for name, cumulative in slowest(modules)[1:]:
+        print('  {:40} {:7.1f} ms'.format(name, cumulative / 1000.0))
+
+
+if __name__ == '__main__':
+    main()
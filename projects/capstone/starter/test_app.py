@@ -1 +1,26 @@
+import os
+import unittest
 
+from bench_startup import import_time, slowest
+
+# Milliseconds `import app` (which also runs create_app()) may take in a
+# fresh interpreter.
+IMPORT_BUDGET_MS = float(os.environ.get('IMPORT_BUDGET_MS', 300))
+
+
+class ImportTimeTestCase(unittest.TestCase):
+    """Guards the cold-start cost of importing the app"""
+
+    def test_import_time(self):
+        total, modules = import_time('app')
+
+        # Nothing uses the database yet.
+        self.assertNotIn('sqlalchemy', modules)
+        self.assertLess(total / 1000.0, IMPORT_BUDGET_MS, 'slowest: {}'.format(
+            ', '.join('{} {:.0f} ms'.format(name, cumulative / 1000.0)
+                      for name, cumulative in slowest(modules)[1:6])))
+
+
+# Make the tests conveniently executable
+if __name__ == "__main__":
+    unittest.main()
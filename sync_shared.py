@@ -0,0 +1,68 @@
+'''
+Keeps the modules shared between projects identical.
+
+    $ python sync_shared.py          # copy each source over its copies
+    $ python sync_shared.py --check  # exit 1 if any copy differs
+
+Every project here is deployed and run on its own from its own directory
+(each has its own requirements and app entry point), so there is no shared
+package: a module used by several projects is copied into each of them.
+Edit the first path listed for a module below, then run this script.
+'''
+
+import argparse
+import filecmp
+import os
+import shutil
+import sys
+
+ROOT = os.path.dirname(os.path.abspath(__file__))
+
+FYYUR = 'projects/01_fyyur/starter_code'
+TRIVIA = 'projects/02_trivia_api/starter/backend'
+COFFEE = 'projects/03_coffee_shop_full_stack/starter_code/backend'
+CAPSTONE = 'projects/capstone/starter'
+
+# module: [source, copies...]
+SHARED = {
+    'metrics.py': [FYYUR, TRIVIA, COFFEE + '/src', CAPSTONE],
+    'serve.py': [FYYUR, TRIVIA, COFFEE, CAPSTONE],
+    'compression.py': [FYYUR, TRIVIA, COFFEE + '/src'],
+    'profiling.py': [FYYUR, TRIVIA],
+    'query_counter.py': [FYYUR, TRIVIA],
+    'routing.py': [FYYUR, TRIVIA],
+    'bench_startup.py': [TRIVIA, CAPSTONE],
+}
+
+
+def differing():
+    '''
+    [(source, copy)] for every copy that is not identical to its source.
+    '''
+    stale = []
+    for module, directories in sorted(SHARED.items()):
+        source = os.path.join(ROOT, directories[0], module)
+        for directory in directories[1:]:
+            copy = os.path.join(ROOT, directory, module)
+            if not os.path.exists(copy) or \
+                    not filecmp.cmp(source, copy, shallow=False):
+                stale.append((source, copy))
+    return stale
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.split('\n\n')[0])
+    parser.add_argument('--check', action='store_true')
+    args = parser.parse_args(argv)
+
+    stale = differing()
+    for source, copy in stale:
+        print('{} {}'.format('differs:' if args.check else 'updating',
+                             os.path.relpath(copy, ROOT)))
+        if not args.check:
+            shutil.copyfile(source, copy)
+    return 1 if args.check and stale else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())